@@ -0,0 +1,242 @@
+"""
+End-to-end benchmarks against the fake Steam in server.py, so they run offline
+and give the same numbers from one run to the next.
+
+Each scenario runs in its own process (so its peak memory is its own) against a
+shared FakeSteam, and reports requests/sec, items/sec, client-side request latency
+percentiles, peak RSS and how many requests failed, plus a per-endpoint breakdown
+from Metrics.MetricsCollector (time spent rate limited, backing off and parsing).
+
+Usage:
+    python benchmarks/run.py [--scenario NAME ...] [--latency S] [--error-rate F]
+                             [--throttle-rate F] [--apps N] [--users N] [--workers N]
+                             [--output FILE] [--baseline FILE] [--tolerance F]
+
+Results are printed (and written to --output) as json. With --baseline, they're
+compared to an earlier run's json, and any scenario that got more than --tolerance
+(default 10%) slower or bigger is listed; the exit status is 1 if there are any.
+
+"""
+
+import json
+import multiprocessing
+import optparse
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from steamapiwrapper.SteamBase import SteamAPI
+from steamapiwrapper.Transport import PooledTransport
+from steamapiwrapper.RateLimit import RateLimiter
+from steamapiwrapper.Metrics import MetricsCollector
+from steamapiwrapper.SteamGames import Games
+from steamapiwrapper.GameItems import GameItems
+from steamapiwrapper.Users import SteamUser
+from steamapiwrapper.Libraries import LibraryLoader
+from server import FakeSteam
+
+API_KEY = 'benchmark'
+STEAM_ID = '76561197960287930'
+
+
+class TimingTransport(object):
+    """Wraps a transport and records how long each request took to come back"""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.latencies = []
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def open(self, url, headers=None, stream=False):
+        started = time.time()
+        try:
+            return self.transport.open(url, headers, stream)
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            with self._lock:
+                self.latencies.append(time.time() - started)
+
+
+def games_get_all(options):
+    games = Games(workers=options.workers)
+    return sum(1 for _ in games.get_all('US'))
+
+
+def games_get_all_compact(options):
+    games = Games(workers=options.workers)
+    return sum(1 for _ in games.get_all('US', compact=True))
+
+
+def game_items_get_all(options):
+    items = GameItems(API_KEY)
+    return len(items.get_all('tf2')) + len(items.get_all('dota2'))
+
+
+def users_bulk_load(options):
+    steam_ids = [int(STEAM_ID) + i for i in xrange(options.users)]
+    return len(SteamUser.bulk_load(steam_ids, API_KEY, workers=options.workers))
+
+
+def libraries_load(options):
+    steam_ids = [int(STEAM_ID) + i for i in xrange(options.users)]
+    return len(LibraryLoader(API_KEY, workers=options.workers).load(steam_ids))
+
+
+def user_methods(options):
+    """Every SteamUser method that makes requests, for --users users"""
+    count = 0
+    for i in xrange(options.users):
+        user = SteamUser(str(int(STEAM_ID) + i), API_KEY)
+        count += len(user.get_games())
+        count += len(user.get_items('tf2'))
+        count += len(user.get_gifts())
+        count += len(user.get_wishlist())
+        count += len(user.get_groups())
+    return count
+
+
+SCENARIOS = [
+    ('games.get_all', games_get_all),
+    ('games.get_all.compact', games_get_all_compact),
+    ('game_items.get_all', game_items_get_all),
+    ('users.bulk_load', users_bulk_load),
+    ('libraries.load', libraries_load),
+    ('users.methods', user_methods),
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def run_scenario(func, options, host_map, queue):
+    """Runs in a child process. Puts the scenario's results on queue."""
+    transport = TimingTransport(PooledTransport(host_map=host_map))
+    metrics = MetricsCollector()
+    SteamAPI.instruments = [metrics]
+    SteamAPI.transport = transport
+    SteamAPI.rate_limiter = RateLimiter(limits={}, base_delay=0.01, max_delay=0.1)
+    if not options.cache:
+        SteamAPI.cache = None
+
+    started = time.time()
+    error = None
+    items = 0
+    try:
+        items = func(options)
+    except Exception as e:
+        error = '{}: {}'.format(e.__class__.__name__, e)
+    elapsed = time.time() - started
+
+    latencies = transport.latencies
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    queue.put({
+        'seconds': elapsed,
+        'requests': len(latencies),
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'items': items,
+        'items_per_second': items / elapsed if elapsed else 0.0,
+        'latency_ms': dict(('p{}'.format(p), (percentile(latencies, p) or 0.0) * 1000) for p in (50, 90, 99)),
+        'peak_rss_bytes': peak_rss,
+        'failed_requests': transport.failures,
+        'error': error,
+        'endpoints': metrics.summary(),
+    })
+
+
+def run(options):
+    server = FakeSteam(apps=options.apps, latency=options.latency, error_rate=options.error_rate,
+                       throttle_rate=options.throttle_rate, retry_after=0).start()
+    results = {}
+    try:
+        for name, func in SCENARIOS:
+            if options.scenario and name not in options.scenario:
+                continue
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=run_scenario, args=(func, options, server.host_map(), queue))
+            process.start()
+            results[name] = queue.get()
+            process.join()
+    finally:
+        server.stop()
+    return {
+        'revision': revision(),
+        'time': int(time.time()),
+        'python': sys.version.split()[0],
+        'config': dict((k, getattr(options, k)) for k in
+                       ('apps', 'users', 'workers', 'latency', 'error_rate', 'throttle_rate', 'cache')),
+        'server': server.counts,
+        'scenarios': results,
+    }
+
+
+def revision():
+    """The git revision we're benchmarking, if we're in a checkout"""
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=here,
+                                           stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def regressions(results, baseline, tolerance):
+    """Scenarios that got slower or bigger than baseline by more than tolerance"""
+    found = []
+    for name, now in sorted(results['scenarios'].items()):
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        checks = [('requests_per_second', -1), ('items_per_second', -1),
+                  ('peak_rss_bytes', 1), ('p99', 1)]
+        for metric, direction in checks:
+            old = before['latency_ms'][metric] if metric == 'p99' else before[metric]
+            new = now['latency_ms'][metric] if metric == 'p99' else now[metric]
+            if old and (new - old) * direction / float(old) > tolerance:
+                found.append({'scenario': name, 'metric': metric, 'baseline': old, 'current': new})
+    return found
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--scenario', action='append', help='only run these (can be given more than once)')
+    parser.add_option('--apps', type='int', default=1000)
+    parser.add_option('--users', type='int', default=20)
+    parser.add_option('--workers', type='int', default=4)
+    parser.add_option('--latency', type='float', default=0.0)
+    parser.add_option('--error-rate', type='float', default=0.0)
+    parser.add_option('--throttle-rate', type='float', default=0.0)
+    parser.add_option('--no-cache', dest='cache', action='store_false', default=True)
+    parser.add_option('--output')
+    parser.add_option('--baseline')
+    parser.add_option('--tolerance', type='float', default=0.1)
+    options, _ = parser.parse_args()
+
+    results = run(options)
+    if options.baseline:
+        results['regressions'] = regressions(results, json.load(open(options.baseline)), options.tolerance)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    print output
+    if options.output:
+        with open(options.output, 'w') as f:
+            f.write(output + '\n')
+    if results.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
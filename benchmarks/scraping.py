@@ -0,0 +1,82 @@
+"""
+Compares the wishlist/groups scraping backends on the saved pages in fixtures/.
+
+Usage:
+    python benchmarks/scraping.py [--repeat N] [--scale N] [--json]
+
+--scale repeats the rows in each page N times, to see how the backends do on
+bigger pages. --json prints the results as json instead of a table.
+
+"""
+
+import json
+import optparse
+import os
+import sys
+import timeit
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from steamapiwrapper.Scraping import RegexScraper, SoupScraper
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_page(name, scale):
+    """A saved page, with the rows between its first and last row repeated scale times"""
+    html = open(os.path.join(FIXTURES, name)).read()
+    marker = {'wishlist.html': '<div class="wishlistRow', 'groups.html': '<div class="groupBlockMedium'}[name]
+    start = html.index(marker)
+    end = html.index('</div>\n<div id="footer">')
+    return html[:start] + html[start:end] * scale + html[end:]
+
+
+def backends():
+    found = [('regex', RegexScraper())]
+    try:
+        found.append(('soup', SoupScraper('html.parser')))
+        try:
+            found.append(('soup-lxml', SoupScraper('lxml')))
+            found[-1][1].wishlist_ids(StringIO('<div class="wishlistRow" id="game_1"></div>'))
+        except Exception:
+            found.pop()
+    except ImportError:
+        pass
+    return found
+
+
+def run(repeat, scale):
+    pages = [('wishlist', load_page('wishlist.html', scale), 'wishlist_ids'),
+             ('groups', load_page('groups.html', scale), 'group_urls')]
+    results = []
+    for page_name, html, method in pages:
+        for backend_name, scraper in backends():
+            parse = getattr(scraper, method)
+            seconds = min(timeit.repeat(lambda: parse(StringIO(html)), number=repeat, repeat=3)) / repeat
+            results.append({'page': page_name, 'backend': backend_name, 'bytes': len(html),
+                            'found': len(parse(StringIO(html))), 'ms': seconds * 1000})
+    return results
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--repeat', type='int', default=20)
+    parser.add_option('--scale', type='int', default=1)
+    parser.add_option('--json', action='store_true')
+    options, _ = parser.parse_args()
+
+    results = run(options.repeat, options.scale)
+    if options.json:
+        print json.dumps(results, indent=2)
+        return
+    for page in ('wishlist', 'groups'):
+        rows = [r for r in results if r['page'] == page]
+        fastest = min(r['ms'] for r in rows)
+        for r in rows:
+            print '{page:9} {backend:10} {bytes:>9} bytes {found:>6} found {ms:9.3f} ms  {x:6.1f}x'.format(
+                x=r['ms'] / fastest, **r)
+
+
+if __name__ == '__main__':
+    main()
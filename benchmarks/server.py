@@ -0,0 +1,258 @@
+"""
+A local stand-in for the Steam hosts, serving responses built from the recorded
+samples in fixtures/ (responses.json, wishlist.html, groups.html).
+
+It tells api.steampowered.com, store.steampowered.com and steamcommunity.com apart
+by the Host header, so point a PooledTransport's host_map at it:
+
+    server = FakeSteam(apps=5000, latency=0.02, error_rate=0.01, throttle_rate=0.01)
+    server.start()
+    SteamAPI.transport = PooledTransport(host_map=server.host_map())
+
+Or run it on its own with `python benchmarks/server.py --port 8000`.
+
+"""
+
+import copy
+import gzip
+import json
+import optparse
+import os
+import random
+import re
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+HOSTS = ('api.steampowered.com', 'store.steampowered.com', 'steamcommunity.com')
+
+
+class FakeSteam(ThreadingMixIn, HTTPServer):
+    """
+    args:
+    apps -- number of apps in the app list
+    schema_items -- number of items in each item schema
+    backpack_items -- number of items in each backpack
+    owned_games -- number of games each user owns
+    inventory_pages -- number of pages in each gift inventory
+    latency -- seconds to wait before answering each request (plus up to 50% jitter)
+    error_rate -- fraction of requests answered with a 500
+    throttle_rate -- fraction of requests answered with a 429 and a Retry-After
+    retry_after -- the Retry-After to send with 429s
+    gzip -- gzip responses when the client asks
+
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, apps=1000, schema_items=2000, backpack_items=300, owned_games=200,
+                 inventory_pages=3, latency=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1,
+                 gzip=True, seed=0):
+        HTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.apps = apps
+        self.schema_items = schema_items
+        self.backpack_items = backpack_items
+        self.games_per_user = owned_games
+        self.inventory_pages = inventory_pages
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.gzip = gzip
+        self.random = random.Random(seed)
+        self.fixtures = json.load(open(os.path.join(FIXTURES, 'responses.json')))
+        self.wishlist = open(os.path.join(FIXTURES, 'wishlist.html')).read()
+        self.groups = open(os.path.join(FIXTURES, 'groups.html')).read()
+        self.counts = {'requests': 0, 'errors': 0, 'throttled': 0}
+        self._lock = threading.Lock()
+        self._app_list = None
+        self._schemas = {}
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_port)
+
+    def host_map(self):
+        """A PooledTransport host_map sending every Steam host here"""
+        return dict((host, self.url) for host in HOSTS)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def roll(self):
+        """Decides what to do with a request: 'throttle', 'error' or None"""
+        with self._lock:
+            value = self.random.random()
+        if value < self.throttle_rate:
+            return 'throttle'
+        if value < self.throttle_rate + self.error_rate:
+            return 'error'
+        return None
+
+    def app_list(self):
+        if self._app_list is None:
+            apps = [{'appid': 10 * (i + 1), 'name': 'Game %d' % i} for i in xrange(self.apps)]
+            self._app_list = json.dumps({'applist': {'apps': apps}})
+        return self._app_list
+
+    def appdetails(self, appids, cc, filters):
+        page = {}
+        for appid in appids:
+            if not appid.isdigit() or int(appid) % 70 == 0:
+                page[appid] = {'success': False}
+                continue
+            entry = copy.deepcopy(self.fixtures['appdetails'])
+            data = entry['data']
+            data['steam_appid'] = int(appid)
+            data['name'] = 'Game %d' % (int(appid) / 10 - 1)
+            data['price_overview']['initial'] = 99 + int(appid) % 5000
+            data['price_overview']['final'] = data['price_overview']['initial']
+            data['price_overview']['discount_percent'] = 0
+            data['price_overview']['currency'] = {'GB': 'GBP', 'DE': 'EUR'}.get(cc, 'USD')
+            if filters == 'price_overview':
+                entry['data'] = {'price_overview': data['price_overview']}
+            page[appid] = entry
+        return json.dumps(page)
+
+    def schema(self, game):
+        if game not in self._schemas:
+            items = []
+            for i in xrange(self.schema_items):
+                item = dict(self.fixtures['schema_item'], defindex=i, name='Item %d' % i)
+                items.append(item)
+            self._schemas[game] = json.dumps({'result': {'status': 1, 'items_game_url': '', 'items': items}})
+        return self._schemas[game]
+
+    def player_summaries(self, steamids):
+        players = [dict(self.fixtures['player'], steamid=x) for x in steamids]
+        return json.dumps({'response': {'players': players}})
+
+    def owned(self, steamid):
+        games = [dict(self.fixtures['owned_game'], appid=10 * (i + 1)) for i in xrange(self.games_per_user)]
+        return json.dumps({'response': {'game_count': len(games), 'games': games}})
+
+    def backpack(self, steamid):
+        items = [dict(self.fixtures['backpack_item'], id=i + 1, defindex=5000 + i % 50)
+                 for i in xrange(self.backpack_items)]
+        return json.dumps({'result': {'status': 1, 'num_backpack_slots': 300, 'items': items}})
+
+    def inventory(self, steamid, start):
+        page = int(start or 0)
+        descriptions = {}
+        for i in xrange(50):
+            appid = 10 * (page * 50 + i + 1)
+            description = copy.deepcopy(self.fixtures['gift_description'])
+            description['actions'][0]['link'] = 'http://store.steampowered.com/app/%d/' % appid
+            descriptions['%d_0' % appid] = description
+        more = page + 1 < self.inventory_pages
+        return json.dumps({'success': True, 'rgInventory': {}, 'rgDescriptions': descriptions,
+                           'more': more, 'more_start': page + 1 if more else False})
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, which Nagle would hold up
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        server.count('requests')
+        if server.latency:
+            time.sleep(server.latency * (1 + 0.5 * random.random()))
+
+        outcome = server.roll()
+        if outcome == 'throttle':
+            server.count('throttled')
+            return self.respond(429, '', headers={'Retry-After': str(server.retry_after)})
+        if outcome == 'error':
+            server.count('errors')
+            return self.respond(500, '')
+
+        parts = urlparse.urlsplit(self.path)
+        query = dict(urlparse.parse_qsl(parts.query))
+        host = (self.headers.get('Host') or '').split(':')[0]
+        body = self.route(host, parts.path, query)
+        if body is None:
+            return self.respond(404, '')
+        content_type = 'text/html' if body.startswith('<') else 'application/json'
+        self.respond(200, body, content_type)
+
+    def route(self, host, path, query):
+        server = self.server
+        if host == 'api.steampowered.com':
+            if path.startswith('/ISteamApps/GetAppList'):
+                return server.app_list()
+            match = re.match(r'/IEconItems_(\d+)/(GetSchema|GetPlayerItems)', path)
+            if match and match.group(2) == 'GetSchema':
+                return server.schema(match.group(1))
+            if match:
+                return server.backpack(query.get('SteamID'))
+            if path.startswith('/ISteamUser/GetPlayerSummaries'):
+                return server.player_summaries(query.get('steamids', '').split(','))
+            if path.startswith('/IPlayerService/GetOwnedGames'):
+                return server.owned(query.get('steamid'))
+        elif host == 'store.steampowered.com':
+            if path.startswith('/api/appdetails'):
+                return server.appdetails(query.get('appids', '').split(','), query.get('cc'), query.get('filters'))
+        elif host == 'steamcommunity.com':
+            match = re.match(r'/profiles/(\d+)/(inventory/json/\d+/\d+|wishlist|groups)', path)
+            if match and match.group(2) == 'wishlist':
+                return server.wishlist
+            if match and match.group(2) == 'groups':
+                return server.groups
+            if match:
+                return server.inventory(match.group(1), query.get('start'))
+        return None
+
+    def respond(self, code, body, content_type='application/json', headers=None):
+        if body and self.server.gzip and 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            out = StringIO()
+            with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=5) as f:
+                f.write(body)
+            body = out.getvalue()
+            headers = dict(headers or {}, **{'Content-Encoding': 'gzip'})
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--port', type='int', default=8000)
+    parser.add_option('--apps', type='int', default=1000)
+    parser.add_option('--latency', type='float', default=0.0)
+    parser.add_option('--error-rate', type='float', default=0.0)
+    parser.add_option('--throttle-rate', type='float', default=0.0)
+    options, _ = parser.parse_args()
+    server = FakeSteam(options.port, apps=options.apps, latency=options.latency,
+                       error_rate=options.error_rate, throttle_rate=options.throttle_rate)
+    print 'Serving fake Steam on {}'.format(server.url)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""
+A compact, searchable index of the app list (appid <-> name).
+
+Games used to keep the whole app list in two dicts, where duplicate names
+overwrote each other and only exact names could be looked up. AppIndex keeps every
+app in sorted tables instead:
+
+ - apps sorted by appid, for name lookups by appid
+ - normalized names (lowercase, punctuation squashed to spaces) sorted alphabetically,
+   for exact and prefix lookups by binary search -- every appid with a name is kept
+ - a trigram index over the normalized names, for fuzzy lookups
+
+It all lives in one flat buffer of fixed-size records, so it can be saved to a file
+and memory-mapped back in: AppIndex.load doesn't parse anything, and processes that
+load the same file share its pages.
+
+Example:
+    index = AppIndex.build(Games().iter_apps())
+    index.save('apps.idx')
+
+    index = AppIndex.load('apps.idx') # instant
+    index.appids('Portal 2')          # [620]
+    index.prefix('counter-str')       # [(10, u'Counter-Strike'), ...]
+    index.fuzzy('portel 2')           # [(620, u'Portal 2', 0.5), ...]
+
+"""
+
+import heapq
+import mmap
+import re
+import struct
+import sys
+from array import array
+
+MAGIC = 'APPIDX01'
+# magic, then counts of apps, keys, trigrams and the offsets of each section
+HEADER = struct.Struct('<8s8I')
+APP = struct.Struct('<3I')        # appid, name offset, name length
+KEY = struct.Struct('<4I')        # key offset, key length, app row, number of trigrams
+GRAM = struct.Struct('<3I')       # trigram, postings offset, postings count
+POSTING = struct.Struct('<I')     # key row
+
+NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+class AppIndex(object):
+    """See the module docstring. Build one with AppIndex.build, or load a saved one with AppIndex.load."""
+
+    def __init__(self, buf):
+        """buf -- the index's bytes: a str, or an mmap of a saved index"""
+        magic, self.n_apps, self.n_keys, self.n_grams, self._apps, self._keys, self._grams, \
+            self._postings, self._blob = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError('Not an app index')
+        self._buf = buf
+
+    @classmethod
+    def build(cls, apps):
+        """Builds an index from (appid, name) pairs, like Games.iter_apps() gives"""
+        names = {}
+        for appid, name in apps:
+            names.setdefault(int(appid), name or u'')
+        rows = sorted(names.items())
+
+        blob = []
+        size = [0]
+
+        def add(data):
+            offset = size[0]
+            blob.append(data)
+            size[0] += len(data)
+            return offset, len(data)
+
+        app_records = []
+        for appid, name in rows:
+            app_records.append(APP.pack(appid, *add(name.encode('utf-8'))))
+
+        keys = sorted((normalize(name), appid, row) for row, (appid, name) in enumerate(rows))
+        key_records = []
+        grams = {}
+        for key_row, (key, _, row) in enumerate(keys):
+            key_grams = trigrams(key)
+            key_records.append(KEY.pack(*(add(key) + (row, len(key_grams)))))
+            for gram in key_grams:
+                grams.setdefault(gram, []).append(key_row)
+
+        gram_records, postings, count = [], [], 0
+        for gram in sorted(grams):
+            gram_records.append(GRAM.pack(gram, count, len(grams[gram])))
+            postings.append(_pack_rows(grams[gram]))
+            count += len(grams[gram])
+
+        apps_at = HEADER.size
+        keys_at = apps_at + APP.size * len(app_records)
+        grams_at = keys_at + KEY.size * len(key_records)
+        postings_at = grams_at + GRAM.size * len(gram_records)
+        blob_at = postings_at + POSTING.size * count
+        header = HEADER.pack(MAGIC, len(app_records), len(key_records), len(gram_records),
+                             apps_at, keys_at, grams_at, postings_at, blob_at)
+        return cls(''.join([header] + app_records + key_records + gram_records + postings + blob))
+
+    @classmethod
+    def load(cls, path):
+        """Memory-maps an index saved with save()"""
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self._buf[:])
+
+    def __len__(self):
+        return self.n_apps
+
+    def __contains__(self, appid):
+        return self._app_row(appid) is not None
+
+    def name(self, appid):
+        """The name of appid, or None if it isn't in the index"""
+        row = self._app_row(appid)
+        return self._app(row)[1] if row is not None else None
+
+    def appids(self, name=None):
+        """
+        Every appid named name (exactly), in appid order. With no name, every appid in the index.
+        Use find() to ignore case and punctuation.
+
+        """
+        if name is None:
+            return [APP.unpack_from(self._buf, self._apps + APP.size * row)[0] for row in xrange(self.n_apps)]
+        return [appid for appid, app_name in self.find(name) if app_name == name]
+
+    def find(self, name):
+        """(appid, name) for every app whose name matches, ignoring case and punctuation"""
+        key = normalize(name)
+        found = []
+        for key_row in xrange(self._lower_bound(key), self.n_keys):
+            if self._key(key_row) != key:
+                break
+            found.append(self._app(self._key_app(key_row)))
+        return found
+
+    def prefix(self, text, limit=20):
+        """(appid, name) for apps whose normalized name starts with text's, in alphabetical order"""
+        key = normalize(text)
+        found = []
+        for key_row in xrange(self._lower_bound(key), self.n_keys):
+            if len(found) >= limit or not self._key(key_row).startswith(key):
+                break
+            found.append(self._app(self._key_app(key_row)))
+        return found
+
+    def fuzzy(self, text, limit=10, min_score=0.3):
+        """
+        (appid, name, score) for the apps whose names are most like text, best first.
+        score is the trigram similarity (0 to 1) of the normalized names.
+
+        """
+        query = trigrams(normalize(text))
+        if not query:
+            return []
+        shared = {}
+        for gram in query:
+            start, count = self._postings_for(gram)
+            for key_row in _unpack_rows(self._buf[start:start + POSTING.size * count]):
+                shared[key_row] = shared.get(key_row, 0) + 1
+        scored = []
+        for key_row, common in shared.iteritems():
+            key_grams = KEY.unpack_from(self._buf, self._keys + KEY.size * key_row)[3]
+            score = float(common) / (len(query) + key_grams - common)
+            if score >= min_score:
+                scored.append((score, key_row))
+        results = []
+        for score, key_row in heapq.nlargest(limit, scored):
+            appid, name = self._app(self._key_app(key_row))
+            results.append((appid, name, score))
+        return results
+
+    def _app(self, row):
+        appid, offset, length = APP.unpack_from(self._buf, self._apps + APP.size * row)
+        start = self._blob + offset
+        return appid, self._buf[start:start + length].decode('utf-8')
+
+    def _app_row(self, appid):
+        low, high = 0, self.n_apps
+        while low < high:
+            mid = (low + high) // 2
+            value = APP.unpack_from(self._buf, self._apps + APP.size * mid)[0]
+            if value < appid:
+                low = mid + 1
+            elif value > appid:
+                high = mid
+            else:
+                return mid
+        return None
+
+    def _key(self, key_row):
+        offset, length, _, _ = KEY.unpack_from(self._buf, self._keys + KEY.size * key_row)
+        start = self._blob + offset
+        return self._buf[start:start + length]
+
+    def _key_app(self, key_row):
+        return KEY.unpack_from(self._buf, self._keys + KEY.size * key_row)[2]
+
+    def _lower_bound(self, key):
+        """The first key row >= key"""
+        low, high = 0, self.n_keys
+        while low < high:
+            mid = (low + high) // 2
+            if self._key(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def _postings_for(self, gram):
+        """(offset of the first posting, number of postings) for a trigram"""
+        low, high = 0, self.n_grams
+        while low < high:
+            mid = (low + high) // 2
+            value, offset, count = GRAM.unpack_from(self._buf, self._grams + GRAM.size * mid)
+            if value < gram:
+                low = mid + 1
+            elif value > gram:
+                high = mid
+            else:
+                return self._postings + POSTING.size * offset, count
+        return 0, 0
+
+
+def normalize(name):
+    """The key names are compared by: lowercase utf-8, with runs of punctuation and spaces turned into one space"""
+    if isinstance(name, str):
+        name = name.decode('utf-8', 'replace')
+    return NON_WORD.sub(u' ', name.lower()).strip().encode('utf-8')
+
+
+def trigrams(key):
+    """The set of byte trigrams in a normalized key (padded, so short names still have some)"""
+    padded = '  ' + key + ' '
+    return set((ord(padded[i]) << 16) | (ord(padded[i + 1]) << 8) | ord(padded[i + 2])
+               for i in xrange(len(padded) - 2))
+
+
+def _pack_rows(rows):
+    rows = array('I', rows)
+    if sys.byteorder == 'big':
+        rows.byteswap()
+    return rows.tostring()
+
+
+def _unpack_rows(data):
+    """A run of postings as an array, in one go instead of a struct call per row"""
+    rows = array('I')
+    rows.fromstring(data)
+    if sys.byteorder == 'big':
+        rows.byteswap()
+    return rows
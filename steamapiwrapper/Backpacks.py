@@ -0,0 +1,281 @@
+"""
+Scans TF2 and Dota2 backpacks for lots of users at once.
+
+SteamUser.get_items needs a SteamUser (and so a GetPlayerSummaries request) for
+every backpack. BackpackScanner just takes steamids, keeps several GetPlayerItems
+requests in flight, and yields each user's result as it finishes. Private or
+invalid backpacks come back as results with a status instead of exceptions, so
+one bad steamid doesn't stop the scan.
+
+Example:
+    scanner = BackpackScanner(api_key, workers=8)
+    for result in scanner.scan(steam_ids, 'tf2'):
+        if result.ok:
+            print result.steam_id, len(result.items)
+    print scanner.users_per_second()
+
+"""
+
+import time
+from array import array
+from SteamBase import SteamAPI, SteamError
+from Concurrency import imap
+from GameItems import GAME_IDS, BadGameException
+
+BACKPACK_URL = "http://api.steampowered.com/IEconItems_{}/GetPlayerItems/v0001/?key={}&SteamID={}"
+
+# GetPlayerItems status codes
+STATUS_OK = 1
+STATUS_MESSAGES = {
+    1: 'OK',
+    8: 'Invalid SteamID',
+    15: 'Backpack is private',
+    18: 'Invalid SteamID',
+}
+
+
+def _id_typecode():
+    """
+    An array typecode for 64-bit item ids. array has no 'Q' before Python 3.3 and 'L'
+    is only 64-bit on some platforms, so fall back to doubles, which hold ids exactly
+    up to 2**53.
+
+    """
+    for typecode in ('Q', 'L'):
+        try:
+            if array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:
+            pass
+    return 'd'
+
+ID_TYPECODE = _id_typecode()
+
+
+class BackpackResult(object):
+    """
+    One user's backpack scan.
+
+    steam_id -- the user scanned
+    status -- Steam's status code (see STATUS_MESSAGES), or None if the request failed or
+              the response didn't make sense
+    items -- the user's Backpack (or CompactBackpack, or raw json list), or None if status isn't OK
+    error -- what went wrong, if anything
+
+    """
+
+    __slots__ = ('steam_id', 'status', 'items', 'error')
+
+    def __init__(self, steam_id, status, items=None, error=None):
+        self.steam_id = steam_id
+        self.status = status
+        self.items = items
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status == STATUS_OK
+
+    def __repr__(self):
+        return '<BackpackResult {} status={}>'.format(self.steam_id, self.status)
+
+
+class BackpackScanner(SteamAPI):
+    """Scans many users' backpacks concurrently, see the module docstring."""
+
+    def __init__(self, api_key, workers=8, transport=None):
+        """
+        args:
+        workers -- number of GetPlayerItems requests to keep in flight
+        transport -- optional Transport to make requests with (see Transport.py)
+
+        """
+        SteamAPI.__init__(self, "", api_key, transport)
+        self.workers = workers
+        self.scanned = 0
+        self.elapsed = 0.0
+
+    def scan(self, steam_ids, game, raw_json=False, compact=False):
+        """
+        Yields a BackpackResult for each steamid, in the order they finish.
+
+        args:
+        steam_ids -- any iterable of steamids (it's read lazily, so a generator is fine)
+        game -- either 'dota2' or 'tf2'
+        raw_json -- give each result Steam's list of items instead of a Backpack
+        compact -- give each result a CompactBackpack
+
+        """
+        game = game.lower()
+        if game not in GAME_IDS:
+            raise BadGameException("Invalid game. Please call with 'Dota2' or 'TF2'")
+
+        def fetch(steam_id):
+            return self._scan_one(GAME_IDS[game], steam_id, raw_json, compact)
+
+        started = time.time()
+        try:
+            for result in imap(fetch, steam_ids, self.workers, ordered=False):
+                self.scanned += 1
+                yield result
+        finally:
+            self.elapsed += time.time() - started
+
+    def users_per_second(self):
+        """Average throughput over everything this scanner has scanned so far"""
+        return self.scanned / self.elapsed if self.elapsed else 0.0
+
+    def _scan_one(self, game_id, steam_id, raw_json, compact):
+        url = BACKPACK_URL.format(game_id, self.api_key, steam_id)
+        try:
+            json_data = self._get_json(url)
+        except (SteamError, ValueError) as e:
+            return BackpackResult(steam_id, None, error=str(e) or e.__class__.__name__)
+
+        # A malformed response only fails this user, like a failed request, instead of the whole scan
+        try:
+            status = json_data['result']['status']
+            if status != STATUS_OK:
+                return BackpackResult(steam_id, status, error=STATUS_MESSAGES.get(status, 'Unknown status'))
+            items = json_data['result'].get('items', [])
+            return BackpackResult(steam_id, status, items if raw_json else process_items(items, compact))
+        except (KeyError, TypeError, AttributeError) as e:
+            return BackpackResult(steam_id, None, error='Malformed response ({}: {})'.format(e.__class__.__name__, e))
+
+
+class Backpack(dict):
+    """
+    A user's items, keyed by item id (so several copies of the same item are all kept).
+    Each value is a dict of the item's fields, including its defindex.
+
+    """
+
+    def by_defindex(self):
+        """Returns a dict of defindex -> list of the items with it"""
+        groups = {}
+        for item in self.itervalues():
+            groups.setdefault(item['defindex'], []).append(item)
+        return groups
+
+    def count(self, defindex):
+        """How many of an item the user has, counting quantities"""
+        return sum(item['quantity'] or 1 for item in self.itervalues() if item['defindex'] == defindex)
+
+
+class CompactBackpack(object):
+    """
+    The same items as a Backpack, but stored as arrays of numbers (one per field)
+    instead of a dict per item, for holding lots of users' backpacks at once. The
+    rarely set text fields (custom_name, custom_desc) and style are kept in small
+    dicts by row.
+
+    Iterating gives back item dicts like Backpack's, and item ids can be looked up
+    with backpack[item_id].
+
+    """
+
+    __slots__ = ('ids', 'original_ids', 'defindexes', 'levels', 'qualities', 'quantities', 'flags',
+                 'extras', '_rows')
+
+    TRADABLE, CRAFTABLE = 1, 2
+
+    def __init__(self, items=()):
+        self.ids = array(ID_TYPECODE)
+        self.original_ids = array(ID_TYPECODE)
+        self.defindexes = array('l')
+        self.levels = array('H')
+        self.qualities = array('B')
+        self.quantities = array('l')
+        self.flags = array('B')
+        self.extras = {}
+        self._rows = None
+        for item in items:
+            self.append(item)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for row in xrange(len(self.ids)):
+            yield self.row(row)
+
+    def __getitem__(self, item_id):
+        if self._rows is None:
+            self._rows = dict((x, row) for row, x in enumerate(self.ids))
+        return self.row(self._rows[item_id])
+
+    def append(self, item):
+        """Adds an item from Steam's GetPlayerItems json"""
+        row = len(self.ids)
+        self.ids.append(item.get('id') or 0)
+        self.original_ids.append(item.get('original_id') or 0)
+        self.defindexes.append(item.get('defindex') or 0)
+        self.levels.append(item.get('level') or 0)
+        self.qualities.append(item.get('quality') or 0)
+        self.quantities.append(item.get('quantity') or 0)
+        flags = 0
+        if item.get('flag_cannot_trade') is None:
+            flags |= self.TRADABLE
+        if item.get('flag_cannot_craft') is None:
+            flags |= self.CRAFTABLE
+        self.flags.append(flags)
+        extras = dict((k, item[k]) for k in ('custom_name', 'custom_desc', 'style') if item.get(k) is not None)
+        if extras:
+            self.extras[row] = extras
+        self._rows = None
+
+    def row(self, row):
+        """The item at a row, as a dict with the same fields as a Backpack item"""
+        extras = self.extras.get(row, {})
+        return {
+            'item_id': int(self.ids[row]),
+            'original_id': int(self.original_ids[row]),
+            'defindex': self.defindexes[row],
+            'level': self.levels[row],
+            'quality': self.qualities[row],
+            'quantity': self.quantities[row],
+            'custom_name': extras.get('custom_name'),
+            'custom_desc': extras.get('custom_desc'),
+            'style': extras.get('style'),
+            'tradable': bool(self.flags[row] & self.TRADABLE),
+            'craftable': bool(self.flags[row] & self.CRAFTABLE),
+        }
+
+    def by_defindex(self):
+        """Returns a dict of defindex -> list of the items with it, like Backpack.by_defindex"""
+        groups = {}
+        for row, defindex in enumerate(self.defindexes):
+            groups.setdefault(defindex, []).append(self.row(row))
+        return groups
+
+    def count(self, defindex):
+        """How many of an item the user has, counting quantities"""
+        return sum(self.quantities[row] or 1 for row, x in enumerate(self.defindexes) if x == defindex)
+
+
+def process_items(items, compact=False):
+    """Puts GetPlayerItems items into a Backpack (or a CompactBackpack)"""
+    if compact:
+        return CompactBackpack(items)
+    backpack = Backpack()
+    for item in items:
+        backpack[item.get("id")] = item_values(item)
+    return backpack
+
+
+def item_values(item):
+    """The fields we keep for a single backpack item"""
+    values = {}
+    values["item_id"] = item.get("id")
+    values["original_id"] = item.get("original_id")
+    values["defindex"] = item.get("defindex")
+    values["level"] = item.get("level")
+    values["quality"] = item.get("quality")
+    values["quantity"] = item.get("quantity")
+    values["custom_name"] = item.get("custom_name")
+    values["custom_desc"] = item.get("custom_desc")
+    values["style"] = item.get("style")
+    # Optional Elements
+    values["tradable"] = item.get("flag_cannot_trade") is None
+    values["craftable"] = item.get("flag_cannot_craft") is None
+    return values
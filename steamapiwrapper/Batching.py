@@ -0,0 +1,138 @@
+"""
+Chunk sizing and bad appid tracking for appdetails requests.
+
+Steam takes several appids per appdetails request, but how many it's happy with
+changes: big chunks get slow or rejected, and one bad appid can sink a whole
+chunk. AdaptiveChunker grows the chunk size while requests come back quickly and
+complete, and halves it when they fail, are slow, or get too big (AIMD, like TCP).
+
+Games bisects chunks that fail until the bad appids are on their own. Blocklist
+counts how often each appid fails by itself (per country code), and once one has
+failed enough times in a row it's skipped from then on. Requests that fail because
+Steam is down don't count. Give it a path to keep it between runs:
+
+    games = Games(blocklist=Blocklist('appid_blocklist.json'))
+
+"""
+
+import json
+import os
+import threading
+
+
+class AdaptiveChunker(object):
+    """
+    Picks how many appids go in each appdetails request. Safe to share between threads.
+
+    args:
+    initial -- chunk size to start with
+    minimum, maximum -- limits on the chunk size. Make them equal for a fixed size.
+    step -- how much to grow by after a good request
+    target_seconds -- requests slower than this (not counting rate limiter waits) shrink the chunks
+    max_bytes -- responses bigger than this shrink the chunks
+    probe_after -- after shrinking, how many good requests it takes before chunks grow
+                   back to the size that went wrong
+
+    """
+
+    def __init__(self, initial=25, minimum=1, maximum=100, step=5, target_seconds=5.0, max_bytes=4 * 1024 * 1024,
+                 probe_after=20):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self.probe_after = probe_after
+        self._size = max(minimum, min(maximum, initial))
+        self._limit = self.maximum
+        self._good = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._size
+
+    def record(self, size, ok, seconds, nbytes=None):
+        """
+        Adjusts the chunk size after a request for size appids.
+
+        args:
+        ok -- whether Steam answered for every appid
+        seconds -- how long the request took
+        nbytes -- size of the response, if known
+
+        """
+        with self._lock:
+            if not ok or seconds > self.target_seconds or (nbytes and nbytes > self.max_bytes):
+                self._size = max(self.minimum, min(self._size, size) // 2)
+                # Don't grow straight back into the size that just went wrong
+                self._limit = max(self.minimum, min(self._limit, size - 1))
+                self._good = 0
+            elif size >= self._size:
+                # Only grow on evidence from a chunk at least as big as the current size
+                self._good += 1
+                if self._good >= self.probe_after:
+                    self._limit = self.maximum
+                self._size = min(self._limit, self._size + self.step)
+
+
+class Blocklist(object):
+    """
+    Appids that keep failing, per country code (an app that isn't sold in one country
+    can be fine in the rest). An appid is blocked for a cc after `threshold` failures
+    there in a row; a success clears its count. With a path, the counts are loaded from
+    (and saved to) a JSON file.
+
+    Check with `(appid, cc) in blocklist`. Counts recorded without a cc block the appid everywhere.
+
+    """
+
+    def __init__(self, path=None, threshold=3):
+        self.path = path
+        self.threshold = threshold
+        self.failures = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.failures = json.load(f)
+
+    def __contains__(self, item):
+        appid, cc = item if isinstance(item, tuple) else (item, None)
+        if self.failures.get(str(appid), 0) >= self.threshold:
+            return True
+        return cc is not None and self.failures.get(_key(appid, cc), 0) >= self.threshold
+
+    def blocked(self, cc=None):
+        """The appids blocked for cc (or blocked everywhere, with no cc), as strings"""
+        return sorted(key.split(':')[0] for key, count in self.failures.items()
+                      if count >= self.threshold and (':' not in key or key == _key(key.split(':')[0], cc)))
+
+    def record_failure(self, appid, cc=None):
+        with self._lock:
+            key = _key(appid, cc)
+            self.failures[key] = self.failures.get(key, 0) + 1
+            self._dirty = True
+
+    def record_success(self, appid, cc=None):
+        key = _key(appid, cc)
+        if key in self.failures:
+            with self._lock:
+                self.failures.pop(key, None)
+                self._dirty = True
+
+    def save(self):
+        """Writes the counts to path, if anything changed since the last save"""
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            data = json.dumps(self.failures, sort_keys=True)
+            self._dirty = False
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(data)
+        os.rename(tmp, self.path)
+
+
+def _key(appid, cc):
+    return str(appid) if cc is None else '{}:{}'.format(appid, cc.upper())
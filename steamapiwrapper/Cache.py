@@ -0,0 +1,187 @@
+"""
+HTTP response cache for SteamAPI._get_json.
+
+A lot of what we fetch (the app list, item schemas, appdetails) changes slowly, so
+responses from those endpoints are kept in an in-memory LRU, and optionally in a
+sqlite file so they survive restarts. Each endpoint has its own TTL. Once an entry
+goes stale it's revalidated with If-None-Match / If-Modified-Since, so if nothing
+changed Steam only has to send back a 304.
+
+Urls are stored with the API key stripped out, so it never ends up on disk.
+
+"""
+
+import sqlite3
+import threading
+import time
+import urllib
+import urlparse
+from collections import OrderedDict
+
+# Seconds to keep responses for, keyed by host + path prefix (the most specific one wins).
+# Endpoints that don't match aren't cached.
+DEFAULT_TTLS = {
+    'api.steampowered.com/ISteamApps/GetAppList': 60 * 60,
+    'api.steampowered.com/IEconItems_440/GetSchema': 6 * 60 * 60,
+    'api.steampowered.com/IEconItems_570/GetSchema': 6 * 60 * 60,
+    'store.steampowered.com/api/appdetails': 15 * 60,
+}
+
+
+class CacheEntry(object):
+    """A cached response body, with the validators Steam sent along with it"""
+
+    __slots__ = ('body', 'etag', 'last_modified', 'stored')
+
+    def __init__(self, body, etag=None, last_modified=None, stored=None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored = stored
+
+
+class ResponseCache(object):
+    """
+    An LRU of response bodies, capped by total size, with an optional persistent store behind it.
+    Safe to share between threads.
+
+    """
+
+    def __init__(self, ttls=None, max_bytes=64 * 1024 * 1024, store=None, clock=time.time):
+        """
+        args:
+        ttls -- dict of host + path prefix -> seconds. Defaults to DEFAULT_TTLS.
+        max_bytes -- how much response data to hold in memory before evicting the oldest
+        store -- optional persistent store, like SqliteStore
+
+        """
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.max_bytes = max_bytes
+        self.store = store
+        self.clock = clock
+        self.size = 0
+        self.hits, self.misses = 0, 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ttl_for(self, url):
+        """Seconds a response from url can be cached for, or None if it shouldn't be cached"""
+        parts = urlparse.urlsplit(url)
+        endpoint = parts.netloc + parts.path
+        best = None
+        for prefix in self.ttls:
+            if endpoint.startswith(prefix) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return self.ttls[best] if best is not None else None
+
+    def get(self, url):
+        """Returns the CacheEntry for url (fresh or not), or None"""
+        key = cache_key(url)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+        if entry is None and self.store is not None:
+            entry = self.store.get(key)
+            if entry is not None:
+                self._remember(key, entry)
+        return entry
+
+    def is_fresh(self, url, entry):
+        ttl = self.ttl_for(url)
+        return ttl is not None and self.clock() - entry.stored < ttl
+
+    def put(self, url, body, headers):
+        """Stores a 200 response, keeping its ETag and Last-Modified for revalidation"""
+        entry = CacheEntry(body, headers.get('etag'), headers.get('last-modified'), self.clock())
+        key = cache_key(url)
+        self._remember(key, entry)
+        if self.store is not None:
+            self.store.put(key, entry)
+        return entry
+
+    def touch(self, url, entry):
+        """Marks an entry as fresh again, after Steam said it hasn't changed (304)"""
+        entry.stored = self.clock()
+        if self.store is not None:
+            self.store.put(cache_key(url), entry)
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+        if self.store is not None:
+            self.store.clear()
+
+    def _remember(self, key, entry):
+        """Adds an entry to the in-memory LRU, evicting old ones to stay under max_bytes"""
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self._entries[key] = entry
+            self.size += len(entry.body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+
+class SqliteStore(object):
+    """Keeps cache entries in a sqlite file, evicting the least recently used past max_bytes"""
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                             'url TEXT PRIMARY KEY, body BLOB, etag TEXT, last_modified TEXT, '
+                             'stored REAL, accessed REAL, size INTEGER)')
+            self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT body, etag, last_modified, stored FROM responses WHERE url = ?',
+                                   (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE responses SET accessed = ? WHERE url = ?', (time.time(), key))
+            self._db.commit()
+        return CacheEntry(str(row[0]), row[1], row[2], row[3])
+
+    def put(self, key, entry):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (key, sqlite3.Binary(entry.body), entry.etag, entry.last_modified,
+                              entry.stored, time.time(), len(entry.body)))
+            self._evict()
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        while total > self.max_bytes:
+            url, size = self._db.execute('SELECT url, size FROM responses ORDER BY accessed LIMIT 1').fetchone()
+            self._db.execute('DELETE FROM responses WHERE url = ?', (url,))
+            total -= size
+
+
+def cache_key(url):
+    """The url without its API key, with query params in a stable order"""
+    parts = urlparse.urlsplit(url)
+    query = sorted((k, v) for k, v in urlparse.parse_qsl(parts.query, keep_blank_values=True) if k.lower() != 'key')
+    return urlparse.urlunsplit((parts.scheme, parts.netloc, parts.path, urllib.urlencode(query), ''))
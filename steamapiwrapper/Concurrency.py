@@ -0,0 +1,300 @@
+"""
+Small helpers for running Steam requests concurrently.
+
+Python 2 doesn't ship concurrent.futures (or asyncio), so this is a minimal thread
+pool that feeds work in lazily and hands results back as a generator, plus an
+Executor that hands back Futures for the *_async methods on the wrapper classes.
+
+"""
+
+import sys
+import threading
+from Queue import Queue
+
+_DONE = object()
+
+# What an AsyncIterator's futures resolve to once the iterator has run out
+END = object()
+
+
+class TimeoutError(Exception):
+    """Raised by Future.result when the call hasn't finished in time"""
+    pass
+
+
+def imap(func, items, workers, ordered=True):
+    """
+    Calls func on every entry of items from a pool of threads, yielding the results.
+    Items are pulled in lazily, so a generator works fine, and at most `workers`
+    calls are in flight at once. An exception raised by func is re-raised here.
+
+    args:
+    func -- called with a single item
+    items -- any iterable
+    workers -- number of threads. 1 (or less) just runs everything in this thread.
+    ordered -- yield results in the order of items (True), or as they finish (False)
+
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    tasks, results = Queue(), Queue()
+    # Module globals can be cleared before daemon threads exit
+    done, exc_info = _DONE, sys.exc_info
+
+    def worker():
+        while True:
+            task = tasks.get()
+            if task is done:
+                return
+            index, item = task
+            try:
+                results.put((index, True, func(item)))
+            except Exception:
+                results.put((index, False, exc_info()))
+
+    threads = [threading.Thread(target=worker) for _ in xrange(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    items = iter(items)
+    exhausted = False
+    submitted, received, yielded = 0, 0, 0
+    buffered = {}
+    try:
+        while True:
+            # Keep the pool busy, but don't let ordered results pile up behind a slow one
+            while not exhausted and submitted - received < workers and submitted - yielded < workers * 2:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                tasks.put((submitted, item))
+                submitted += 1
+
+            if received == submitted:
+                break
+
+            index, ok, value = results.get()
+            received += 1
+            if not ok:
+                raise value[0], value[1], value[2]
+
+            if ordered:
+                buffered[index] = value
+                while yielded in buffered:
+                    result = buffered.pop(yielded)
+                    yielded += 1
+                    yield result
+            else:
+                yielded += 1
+                yield value
+    finally:
+        # Drop anything not started yet, then let the threads exit. Wait for them, so
+        # none are still running when the interpreter shuts down (and clears globals)
+        with tasks.mutex:
+            tasks.queue.clear()
+        for _ in threads:
+            tasks.put(done)
+        for thread in threads:
+            thread.join()
+
+
+class Future(object):
+    """
+    The result of a call running on an Executor. A cut down concurrent.futures.Future:
+    result() blocks until it's done, and add_done_callback lets an event loop (or
+    anything else) hear about it without blocking.
+
+    """
+
+    def __init__(self):
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        return self._finished.is_set()
+
+    def result(self, timeout=None):
+        """The call's return value. If it raised, this raises the same exception."""
+        if not self._finished.wait(timeout):
+            raise TimeoutError()
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """The exception the call raised, or None"""
+        if not self._finished.wait(timeout):
+            raise TimeoutError()
+        return self._exc_info[1] if self._exc_info is not None else None
+
+    def add_done_callback(self, callback):
+        """Calls callback(future) once it's done (straight away if it already is), on the thread that finished it"""
+        with self._lock:
+            if not self._finished.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exc_info(self, exc_info):
+        self._exc_info = exc_info
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._finished.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                pass
+
+
+class Executor(object):
+    """
+    A pool of up to `workers` daemon threads that run submitted calls and hand back
+    Futures. Threads are started as work comes in, so an unused Executor costs nothing.
+
+    """
+
+    def __init__(self, workers=16):
+        self.workers = workers
+        self._tasks = Queue()
+        self._threads = []
+        self._idle = 0
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) on the pool. Returns a Future for the result."""
+        future = Future()
+        with self._lock:
+            self._tasks.put((future, func, args, kwargs))
+            if self._idle == 0 and len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            else:
+                self._idle -= 1
+        return future
+
+    def _work(self):
+        done = _DONE  # module globals can be cleared before daemon threads exit
+        while True:
+            task = self._tasks.get()
+            if task is done:
+                return
+            future, func, args, kwargs = task
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception:
+                future.set_exc_info(sys.exc_info())
+            with self._lock:
+                self._idle += 1
+
+    def shutdown(self):
+        """Lets the threads exit once the work already submitted is done"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+            self._idle = 0
+        for _ in threads:
+            self._tasks.put(_DONE)
+
+
+class AsyncIterator(object):
+    """
+    Steps through a (blocking) iterator on an Executor. next() returns a Future for the
+    next item, which resolves to END once the iterator has run out.
+
+    Example:
+    games = games.get_all_async('US')
+    future = games.next()
+    # ...later, or from future.add_done_callback...
+    game = future.result()
+
+    """
+
+    def __init__(self, items, executor):
+        self._items = iter(items)
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._last = None
+
+    def next(self):
+        # A generator can't be stepped from two threads at once, so each step is only
+        # submitted once the one before it is done -- rather than tying up executor
+        # threads waiting their turn, an iterator never has more than one step running
+        future = Future()
+        with self._lock:
+            previous, self._last = self._last, future
+        if previous is None:
+            self._executor.submit(self._step, future)
+        else:
+            previous.add_done_callback(lambda _: self._executor.submit(self._step, future))
+        return future
+
+    def _step(self, future):
+        try:
+            future.set_result(next(self._items, END))
+        except Exception:
+            future.set_exc_info(sys.exc_info())
+
+    def __iter__(self):
+        """Blocking iteration over the items, for when you do want to wait"""
+        while True:
+            item = self.next().result()
+            if item is END:
+                return
+            yield item
+
+
+class SingleFlight(object):
+    """
+    Makes concurrent calls for the same key share one call: the first caller runs it,
+    and the rest wait for (and get) its result -- or its exception. Once it's done, the
+    next call for the key runs again.
+
+    Example:
+    flight = SingleFlight()
+    result, shared = flight.do(url, lambda: fetch(url))
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """Returns (func's result, whether it came from another caller's call)"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result(), True
+        try:
+            future.set_result(func())
+        except Exception:
+            future.set_exc_info(sys.exc_info())
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result(), False
+
+    def in_flight(self):
+        """Number of keys with a call running"""
+        return len(self._calls)
@@ -0,0 +1,140 @@
+"""
+Resumable full-catalog crawls.
+
+Going through appdetails for every app on Steam takes hours, and Games.get_all keeps
+nothing if it's interrupted. CatalogCrawl writes each game to a JSON-lines file as
+its chunk comes back, and records which appids are done (and how much of the output
+file is good) in a sqlite checkpoint. Run it again after a crash, Ctrl-C or reboot
+and it picks up where it stopped, without duplicating or losing any lines.
+
+Example:
+    crawl = CatalogCrawl(Games(workers=4), CrawlCheckpoint('crawl.db'), 'games.jsonl', 'US')
+    crawl.run()
+    print crawl.checkpoint.progress()
+
+Each line of the output is {"appid": ..., "cc": ..., "data": <Steam's appdetails data>}.
+Appids whose requests failed stay pending and are tried again on the next run.
+
+"""
+
+import json
+import os
+import sqlite3
+
+
+class CheckpointError(Exception):
+    """Raised when a checkpoint doesn't match the crawl it's used for"""
+    pass
+
+
+class CrawlCheckpoint(object):
+    """Which appids a crawl has finished, and how many bytes of its output are committed"""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS crawl_apps (appid INTEGER PRIMARY KEY, done INTEGER NOT NULL DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS crawl_meta (key TEXT PRIMARY KEY, value TEXT);
+        ''')
+        self.db.commit()
+
+    def started(self):
+        return self.get('cc') is not None
+
+    def start(self, appids, cc):
+        """Records the appids to crawl"""
+        self.db.executemany('INSERT OR IGNORE INTO crawl_apps (appid) VALUES (?)', ((int(x),) for x in appids))
+        self.db.executemany('INSERT OR REPLACE INTO crawl_meta VALUES (?, ?)', [('cc', cc), ('offset', '0')])
+        self.db.commit()
+
+    def get(self, key):
+        row = self.db.execute('SELECT value FROM crawl_meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def offset(self):
+        """How many bytes of the output file belong to finished chunks"""
+        return int(self.get('offset') or 0)
+
+    def pending(self):
+        """The appids not done yet, in appid order"""
+        return [row[0] for row in self.db.execute('SELECT appid FROM crawl_apps WHERE done = 0 ORDER BY appid')]
+
+    def progress(self):
+        """Returns (appids done, appids in the crawl)"""
+        return self.db.execute('SELECT SUM(done), COUNT(*) FROM crawl_apps').fetchone()
+
+    def complete(self, appids, offset):
+        """Marks appids done and moves the committed offset, together"""
+        self.db.executemany('UPDATE crawl_apps SET done = 1 WHERE appid = ?', ((int(x),) for x in appids))
+        self.db.execute('INSERT OR REPLACE INTO crawl_meta VALUES (?, ?)', ('offset', str(offset)))
+        self.db.commit()
+
+
+class CatalogCrawl(object):
+    """Crawls appdetails into a JSON-lines file, resumably. See the module docstring."""
+
+    def __init__(self, games, checkpoint, output, cc):
+        """
+        args:
+        games -- the Games object to fetch with
+        checkpoint -- a CrawlCheckpoint
+        output -- path of the JSON-lines file to write to
+        cc -- Country Code
+
+        """
+        self.games = games
+        self.checkpoint = checkpoint
+        self.output = output
+        self.cc = cc
+
+    def run(self, appids=None, workers=None):
+        """
+        Fetches every appid that isn't done yet, appending the games to the output file.
+        Returns the number of games written by this run.
+
+        args:
+        appids -- the appids to crawl, the first time. Defaults to every app on Steam.
+                  Ignored when resuming; the checkpoint already has them.
+        workers -- number of requests in flight at once (defaults to games.workers)
+
+        """
+        if not self.checkpoint.started():
+            if appids is None:
+                appids = [appid for appid, _ in self.games.iter_apps()]
+            self.checkpoint.start(appids, self.cc)
+        elif self.checkpoint.get('cc') != self.cc:
+            raise CheckpointError('Checkpoint is for cc={}, not {}'.format(self.checkpoint.get('cc'), self.cc))
+
+        offset = self.checkpoint.offset()
+        self._rewind(offset)
+        pending = self.checkpoint.pending()
+        blocklist = self.games.blocklist
+        if blocklist is not None:
+            # These would never be fetched, so they'd never be done
+            self.checkpoint.complete([x for x in pending if (x, self.cc) in blocklist], offset)
+
+        written = 0
+        with open(self.output, 'ab') as f:
+            for chunk, page in self.games.iter_pages(pending, self.cc, workers, ordered=False):
+                done = []
+                for appid in chunk:
+                    entry = page.get(str(appid))
+                    if entry is None:
+                        continue
+                    done.append(appid)
+                    if entry.get('success'):
+                        f.write(json.dumps({'appid': int(appid), 'cc': self.cc, 'data': entry.get('data')}) + '\n')
+                        written += 1
+                f.flush()
+                os.fsync(f.fileno())
+                self.checkpoint.complete(done, os.fstat(f.fileno()).st_size)
+        return written
+
+    def _rewind(self, offset):
+        """Cuts off anything written after the last finished chunk (from a crash mid-chunk)"""
+        size = os.path.getsize(self.output) if os.path.exists(self.output) else 0
+        if size < offset:
+            raise CheckpointError("{} is shorter than the checkpoint says it should be".format(self.output))
+        if size > offset:
+            with open(self.output, 'r+b') as f:
+                f.truncate(offset)
@@ -0,0 +1,174 @@
+"""
+Streams games, schema items and backpacks out to CSV, Parquet or Arrow files.
+
+Rows are gathered into column batches of a fixed schema (GAME_SCHEMA, ITEM_SCHEMA,
+BACKPACK_SCHEMA) and written a batch at a time, so exporting the whole catalog only
+ever holds one batch in memory. CSV only needs the standard library; Parquet and
+Arrow IPC need pyarrow.
+
+Example:
+    games = Games(workers=8)
+    export(game_rows(games.get_all('US', compact=True)), GAME_SCHEMA, 'games.parquet', 'parquet')
+    export(item_rows(GameItems(api_key).get_all('tf2')), ITEM_SCHEMA, 'tf2_items.csv')
+    export(backpack_rows(user.get_items('tf2'), user.steam_id), BACKPACK_SCHEMA, 'backpack.arrow', 'arrow')
+
+"""
+
+import csv
+
+# (column, type) pairs. Types are 'int', 'float', 'str', 'bool', or 'list' (of strings).
+GAME_SCHEMA = [
+    ('appid', 'int'), ('name', 'str'), ('type', 'str'), ('currency', 'str'), ('price', 'float'),
+    ('discounted_price', 'float'), ('discount_percent', 'int'), ('windows', 'bool'), ('mac', 'bool'),
+    ('linux', 'bool'), ('categories', 'list'), ('website', 'str'),
+]
+ITEM_SCHEMA = [
+    ('name', 'str'), ('defindex', 'int'), ('item_class', 'str'), ('item_type_name', 'str'),
+    ('proper_name', 'bool'), ('item_slot', 'str'), ('item_quality', 'int'), ('craft_class', 'str'),
+    ('used_by_classes', 'list'), ('image_url', 'str'),
+]
+BACKPACK_SCHEMA = [
+    ('steam_id', 'str'), ('item_id', 'int'), ('original_id', 'int'), ('defindex', 'int'), ('level', 'int'),
+    ('quality', 'int'), ('quantity', 'int'), ('custom_name', 'str'), ('custom_desc', 'str'), ('style', 'int'),
+    ('tradable', 'bool'), ('craftable', 'bool'),
+]
+
+# Separates the entries of list columns in CSV files
+LIST_SEPARATOR = '|'
+
+
+def game_rows(games):
+    """Rows of GAME_SCHEMA from Games or CompactGames"""
+    for game in games:
+        platforms = game.platforms or {}
+        categories = [c['description'] if isinstance(c, dict) else c for c in game.categories or ()]
+        yield (int(game.appid), game.name, game.type, game.currency, game.price, game.discounted_price,
+               game.discount_percent, bool(platforms.get('windows')), bool(platforms.get('mac')),
+               bool(platforms.get('linux')), categories, game.website)
+
+
+def item_rows(items):
+    """Rows of ITEM_SCHEMA from GameItems.get_all's dict of name -> item"""
+    for name, item in items.iteritems():
+        yield (name, item.get('defindex'), item.get('item_class'), item.get('item_type_name'),
+               item.get('proper_name'), item.get('item_slot'), item.get('item_quality'),
+               item.get('craft_class'), item.get('used_by_classes'), item.get('image_url'))
+
+
+def backpack_rows(backpack, steam_id=None):
+    """Rows of BACKPACK_SCHEMA from a Backpack or CompactBackpack"""
+    items = backpack.itervalues() if isinstance(backpack, dict) else backpack
+    steam_id = str(steam_id) if steam_id is not None else None
+    for item in items:
+        yield (steam_id, item['item_id'], item['original_id'], item['defindex'], item['level'],
+               item['quality'], item['quantity'], item['custom_name'], item['custom_desc'],
+               item['style'], item['tradable'], item['craftable'])
+
+
+def batches(rows, schema, batch_size=8192):
+    """Groups rows into batches: dicts of column -> list of values, batch_size rows long"""
+    names = [name for name, _ in schema]
+    columns = [[] for _ in names]
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+        if len(columns[0]) >= batch_size:
+            yield dict(zip(names, columns))
+            columns = [[] for _ in names]
+    if columns[0]:
+        yield dict(zip(names, columns))
+
+
+def export(rows, schema, path, format='csv', batch_size=8192):
+    """
+    Writes rows out to path a batch at a time. Returns the number of rows written.
+
+    args:
+    format -- 'csv', 'parquet' or 'arrow' (Arrow IPC file)
+
+    """
+    writer = WRITERS[format](path, schema)
+    count = 0
+    try:
+        for batch in batches(rows, schema, batch_size):
+            writer.write_batch(batch)
+            count += len(batch[schema[0][0]])
+    finally:
+        writer.close()
+    return count
+
+
+class CsvWriter(object):
+    """Writes batches to a CSV file with a header row. List columns are joined with LIST_SEPARATOR."""
+
+    def __init__(self, path, schema):
+        self.schema = schema
+        self._file = open(path, 'wb')
+        self._csv = csv.writer(self._file)
+        self._csv.writerow([name for name, _ in schema])
+
+    def write_batch(self, batch):
+        columns = [[_csv_value(value, kind) for value in batch[name]] for name, kind in self.schema]
+        self._csv.writerows(zip(*columns))
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter(object):
+    """Writes batches to a Parquet file, one row group per batch. Needs pyarrow."""
+
+    def __init__(self, path, schema):
+        import pyarrow
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self.schema = _arrow_schema(pyarrow, schema)
+        self._writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write_batch(self, batch):
+        self._writer.write_table(self._pa.Table.from_batches([_record_batch(self._pa, self.schema, batch)]))
+
+    def close(self):
+        self._writer.close()
+
+
+class ArrowWriter(object):
+    """Writes batches to an Arrow IPC file. Needs pyarrow."""
+
+    def __init__(self, path, schema):
+        import pyarrow
+        self._pa = pyarrow
+        self.schema = _arrow_schema(pyarrow, schema)
+        self._sink = pyarrow.OSFile(path, 'wb')
+        self._writer = pyarrow.RecordBatchFileWriter(self._sink, self.schema)
+
+    def write_batch(self, batch):
+        self._writer.write_batch(_record_batch(self._pa, self.schema, batch))
+
+    def close(self):
+        self._writer.close()
+        self._sink.close()
+
+
+WRITERS = {'csv': CsvWriter, 'parquet': ParquetWriter, 'arrow': ArrowWriter}
+
+
+def _csv_value(value, kind):
+    if value is None:
+        return ''
+    if kind == 'list':
+        value = LIST_SEPARATOR.join(value)
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _arrow_schema(pa, schema):
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string(), 'bool': pa.bool_(),
+             'list': pa.list_(pa.string())}
+    return pa.schema([pa.field(name, types[kind]) for name, kind in schema])
+
+
+def _record_batch(pa, schema, batch):
+    arrays = [pa.array(batch[field.name], type=field.type) for field in schema]
+    return pa.RecordBatch.from_arrays(arrays, [field.name for field in schema])
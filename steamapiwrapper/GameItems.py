@@ -6,8 +6,11 @@ items in the store at once.
 
 """
 
+import threading
 from SteamBase import SteamAPI
 
+GAME_IDS = {'tf2': '440', 'dota2': '570'}
+
 class BadGameException(Exception):
     """Raised when the game passed in is not TF2 or Dota2 (or in a bad format)"""
     pass
@@ -24,69 +27,196 @@ class GameItems(SteamAPI):
 
     """
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, transport=None):
         """We don't need a SteamID, only an api key here."""
-        SteamAPI.__init__(self, "", api_key)
+        SteamAPI.__init__(self, "", api_key, transport)
         self.tf2_items = None
         self.dota2_items = None
+        self.schemas = {}
+        self._lock = threading.Lock()
 
 
-    def _get_items(self, game, raw_json=False):
-        """Gets the item info and puts it into an easier to use format."""
+    def iter_schema(self, game):
+        """
+        Yields the raw json for each item in the schema, parsing the (multi-megabyte)
+        response as it downloads rather than loading all of it first.
 
+        args:
+        game -- the appid, '440' for TF2 or '570' for Dota2
+
+        """
         url = "http://api.steampowered.com/IEconItems_{}/GetSchema/v0001/?key={}".format(game, self.api_key)
-        json_data = self._get_json(url)
+        return self._stream_json(url, ['result', 'items'])
+
+    def _get_items(self, game, raw_json=False):
+        """Gets the item info and puts it into an easier to use format."""
 
         if raw_json:
-            return json_data['result']['items']
+            return list(self.iter_schema(game))
 
         all_items = {}
-        for item in json_data["result"]["items"]:
-            values = {}
-            values['defindex'] = item.get('defindex')
-            values['item_class'] = item.get('item_class')
-            values['item_type_name'] = item.get('item_type_name')
-            values['proper_name'] = item.get('proper_name')
-            values['item_slot'] = item.get('item_slot')
-            values['item_quality'] = item.get('item_quality')
-            values['image_url'] = item.get('image_url')
-            values['image_url_large'] = item.get('image_url_large')
-            values['craft_class'] = item.get('craft_class')
-
-            if item.get('capabilities') is not None:
-                capable = item.get('capabilities')
-                capabilities = {}
-                capabilities['nameable'] = capable.get('nameable')
-                capabilities['can_gift_wrap'] = capable.get('can_gift_wrap')
-                capabilities['can_craft_mark'] = capable.get('can_craft_mark')
-                capabilities['can_be_restored'] = capable.get('can_be_restored')
-                capabilities['strange_parts'] = capable.get('strange_parts')
-                capabilities['can_card_upgrade'] = capable.get('can_card_upgrade')
-                values['capabilities'] = capabilities
-            if item.get('used_by_classes') is not None:
-                game_classes = []
-                for character_class in item.get('used_by_classes'):
-                    game_classes.append(character_class)
-                values['used_by_classes'] = game_classes
-
-            all_items[item.get('name')] = values
+        for item in self.iter_schema(game):
+            all_items[item.get('name')] = self._item_values(item)
 
         return all_items
 
+    def _item_values(self, item):
+        """The fields we keep for a single schema item"""
+        values = {}
+        values['defindex'] = item.get('defindex')
+        values['item_class'] = item.get('item_class')
+        values['item_type_name'] = item.get('item_type_name')
+        values['proper_name'] = item.get('proper_name')
+        values['item_slot'] = item.get('item_slot')
+        values['item_quality'] = item.get('item_quality')
+        values['image_url'] = item.get('image_url')
+        values['image_url_large'] = item.get('image_url_large')
+        values['craft_class'] = item.get('craft_class')
+
+        if item.get('capabilities') is not None:
+            capable = item.get('capabilities')
+            capabilities = {}
+            capabilities['nameable'] = capable.get('nameable')
+            capabilities['can_gift_wrap'] = capable.get('can_gift_wrap')
+            capabilities['can_craft_mark'] = capable.get('can_craft_mark')
+            capabilities['can_be_restored'] = capable.get('can_be_restored')
+            capabilities['strange_parts'] = capable.get('strange_parts')
+            capabilities['can_card_upgrade'] = capable.get('can_card_upgrade')
+            values['capabilities'] = capabilities
+        if item.get('used_by_classes') is not None:
+            game_classes = []
+            for character_class in item.get('used_by_classes'):
+                game_classes.append(character_class)
+            values['used_by_classes'] = game_classes
+
+        return values
+
     def get_all(self, game, raw_json=False):
         """
         I do a bit of massaging to the get the data in an easier to use format.
         If you want the exact json from Steam, pass in True for raw_json
 
+        Safe to call from several threads: they share one download of the schema, even
+        across GameItems objects (see SteamAPI.single_flight).
+
         """
         self.game = ''
         if game.lower() == 'tf2':
-            if self.tf2_items is None:
-                self.tf2_items = self._get_items('440', raw_json)
-            return self.tf2_items
+            with self._lock:
+                if self.tf2_items is None:
+                    self.tf2_items = self._load_items('440', raw_json)
+                return self.tf2_items
         elif game.lower() == 'dota2':
-            if self.dota2_items is None:
-                self.dota2_items = self._get_items('570', raw_json)
-            return self.dota2_items
+            with self._lock:
+                if self.dota2_items is None:
+                    self.dota2_items = self._load_items('570', raw_json)
+                return self.dota2_items
         else:
-            raise BadGameException("Please enter either TF2 or Dota2")
\ No newline at end of file
+            raise BadGameException("Please enter either TF2 or Dota2")
+
+    def _load_items(self, game, raw_json):
+        """_get_items, shared with any other GameItems loading the same schema right now"""
+        return self._coalesce(('items', game, raw_json, self.api_key), lambda: self._get_items(game, raw_json))
+
+    def get_all_async(self, game, raw_json=False):
+        """get_all, run on self.executor. Returns a Concurrency.Future of the items."""
+        return self.executor.submit(self.get_all, game, raw_json)
+
+    def get_schema(self, game):
+        """
+        Returns an ItemSchema for TF2 or Dota2, for fast lookups by defindex, name
+        and other fields, and for matching up backpacks with the schema.
+
+        Like get_all, concurrent callers share one download of the schema.
+
+        """
+        game = game.lower()
+        if game not in GAME_IDS:
+            raise BadGameException("Please enter either TF2 or Dota2")
+        with self._lock:
+            if game not in self.schemas:
+                self.schemas[game] = self._coalesce(('schema', game, self.api_key),
+                                                    lambda: self._build_schema(GAME_IDS[game]))
+            return self.schemas[game]
+
+    def _build_schema(self, game_id):
+        schema = ItemSchema()
+        for item in self.iter_schema(game_id):
+            schema.add(item.get('name'), self._item_values(item))
+        return schema
+
+
+class ItemSchema(object):
+    """
+    Every item in a game's schema, indexed so lookups don't need to scan the whole thing.
+
+    Example:
+    schema = items.get_schema('tf2')
+    schema.get(5021)                                    # by defindex
+    schema.named('Mann Co. Supply Crate Key')           # by name
+    schema.find(item_slot='primary', used_by_classes='Soldier')
+    schema.resolve(user.get_items('tf2'))               # a whole backpack, with schema info
+
+    """
+
+    # Fields with secondary indexes, for find()
+    INDEXES = ('item_class', 'item_slot', 'craft_class', 'used_by_classes')
+
+    def __init__(self):
+        self.by_defindex = {}
+        self.by_name = {}
+        self.indexes = dict((field, {}) for field in self.INDEXES)
+
+    def __len__(self):
+        return len(self.by_defindex)
+
+    def add(self, name, values):
+        """Adds an item (the dict from GameItems._item_values) to the schema and its indexes"""
+        values['name'] = name
+        defindex = values['defindex']
+        self.by_defindex[defindex] = values
+        self.by_name[name] = values
+        for field in self.INDEXES:
+            keys = values.get(field)
+            # Items without used_by_classes can be used by every class, they're indexed under None
+            for key in (keys if isinstance(keys, list) and keys else [keys]):
+                self.indexes[field].setdefault(key, set()).add(defindex)
+
+    def get(self, defindex):
+        """The item with this defindex, or None"""
+        return self.by_defindex.get(defindex)
+
+    def named(self, name):
+        """The item with this name, or None"""
+        return self.by_name.get(name)
+
+    def find(self, **criteria):
+        """
+        Returns the items matching all of the given fields (any of INDEXES), like
+        find(item_slot='melee', used_by_classes='Scout'), sorted by defindex.
+
+        """
+        matches = None
+        for field, value in criteria.items():
+            if field not in self.indexes:
+                raise BadItemException("Can't search by {}".format(field))
+            found = self.indexes[field].get(value, set())
+            matches = found if matches is None else matches & found
+        if matches is None:
+            matches = self.by_defindex
+        return [self.by_defindex[x] for x in sorted(matches)]
+
+    def resolve(self, backpack):
+        """
+        Matches up a backpack from SteamUser.get_items (a Backpack, CompactBackpack or
+        the raw json list) with the schema. Returns a list of the backpack's items, each
+        with the matching schema entry (or None) under 'schema'.
+
+        """
+        items = backpack.itervalues() if isinstance(backpack, dict) else backpack
+        resolved = []
+        for item in items:
+            item = dict(item)
+            item['schema'] = self.by_defindex.get(item.get('defindex'))
+            resolved.append(item)
+        return resolved
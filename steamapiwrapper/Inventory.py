@@ -0,0 +1,86 @@
+"""
+Reads a user's community inventory (steamcommunity.com/profiles/<id>/inventory/json/...)
+a page at a time.
+
+Big inventories are split into pages ("more" / "more_start"). InventoryReader
+follows them, and while you're working through one page it's already fetching
+the next, so parsing overlaps with the network.
+
+Example:
+    reader = InventoryReader(steam_id, appid=440, context=2)
+    for description in reader.descriptions():
+        print description['name']
+
+"""
+
+import sys
+import threading
+from SteamBase import SteamAPI
+
+INVENTORY_URL = "http://steamcommunity.com/profiles/{}/inventory/json/{}/{}/"
+
+
+class InventoryReader(SteamAPI):
+    """Streams the pages of one user's inventory for an appid/context pair"""
+
+    def __init__(self, steam_id, appid=753, context=1, prefetch=True, transport=None):
+        """
+        args:
+        appid, context -- which inventory to read. 753/1 is Steam gifts, 440/2 is TF2, 570/2 is Dota2.
+        prefetch -- fetch the next page in the background while the current one is being used
+
+        """
+        SteamAPI.__init__(self, steam_id, None, transport)
+        self.appid = appid
+        self.context = context
+        self.prefetch = prefetch
+
+    def pages(self):
+        """Yields each page's json, following "more_start" until the last page"""
+        pending = _Fetch(self._get_json, self._page_url(None), background=False)
+        while pending is not None:
+            page = pending.result()
+            more_start = page.get('more_start') if page.get('more') else None
+            pending = None
+            if more_start is not None:
+                pending = _Fetch(self._get_json, self._page_url(more_start), self.prefetch)
+            yield page
+
+    def descriptions(self):
+        """Yields every item description (rgDescriptions) in the inventory, page by page"""
+        for page in self.pages():
+            descriptions = page.get('rgDescriptions') or {}
+            for key in descriptions:
+                yield descriptions[key]
+
+    def _page_url(self, start):
+        url = INVENTORY_URL.format(self.steam_id, self.appid, self.context)
+        return url if start is None else '{}?start={}'.format(url, start)
+
+
+class _Fetch(object):
+    """Calls func(url), either right away or on a background thread, and hands back the result"""
+
+    def __init__(self, func, url, background=True):
+        self._result = None
+        self._error = None
+        if background:
+            self._thread = threading.Thread(target=self._run, args=(func, url))
+            self._thread.daemon = True
+            self._thread.start()
+        else:
+            self._thread = None
+            self._run(func, url)
+
+    def _run(self, func, url):
+        try:
+            self._result = func(url)
+        except Exception:
+            self._error = sys.exc_info()
+
+    def result(self):
+        if self._thread is not None:
+            self._thread.join()
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._result
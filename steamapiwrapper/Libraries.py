@@ -0,0 +1,260 @@
+"""
+Owned games for lots of users at once, as numpy arrays.
+
+SteamUser.get_games gives one user's games as a list of dicts, which is fine for
+one user and far too slow for library stats over hundreds of thousands of them.
+LibraryLoader fetches GetOwnedGames for many steamids concurrently and keeps the
+results in an OwnedGames: one row per (user, game) in flat numpy arrays, so totals,
+joins against catalog prices and co-ownership counts are done by numpy instead of
+Python loops.
+
+Example:
+    libraries = LibraryLoader(api_key, workers=8).load(steam_ids)
+    hours = libraries.total_playtime() / 60.0                   # per user
+    values = libraries.library_values(Games().get_table('US'))  # per user
+    print libraries.top_apps(10)                                # [(appid, owners), ...]
+    counts = libraries.co_ownership([440, 570, 730])            # 3x3 owners of each pair
+
+Needs numpy.
+
+"""
+
+from array import array
+from SteamBase import SteamAPI, SteamError, log
+from Concurrency import imap
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Stands in for a user's games in OwnedGames.from_games when their request failed
+FAILED = object()
+
+OWNED_GAMES_URL = ('http://api.steampowered.com/IPlayerService/GetOwnedGames/v0001/'
+                   '?key={}&steamid={}&format=json&include_played_free_games=1&include_appinfo={}')
+
+
+class LibraryLoader(SteamAPI):
+    """Loads many users' owned games concurrently into an OwnedGames, see the module docstring."""
+
+    def __init__(self, api_key, workers=8, transport=None):
+        """
+        args:
+        workers -- number of GetOwnedGames requests to keep in flight
+        transport -- optional Transport to make requests with (see Transport.py)
+
+        """
+        _need_numpy()
+        SteamAPI.__init__(self, "", api_key, transport)
+        self.workers = workers
+
+    def load(self, steam_ids):
+        """
+        Returns an OwnedGames of every user's games. Users are numbered in the order their
+        requests finish. Private profiles get no games and visible=False; users whose
+        requests failed get no games and failed=True (see OwnedGames.failed_steam_ids to retry them).
+
+        """
+        fetch = lambda steam_id: (steam_id, self._load_one(steam_id))
+        return OwnedGames.from_games(imap(fetch, steam_ids, self.workers, ordered=False))
+
+    def _load_one(self, steam_id):
+        """
+        The user's list of {'appid', 'playtime_forever', ...} dicts, None if their profile
+        is private, or FAILED if the request failed.
+
+        """
+        try:
+            json_data = self._get_json(OWNED_GAMES_URL.format(self.api_key, steam_id, 0))
+        except (SteamError, ValueError) as e:
+            log.info('GetOwnedGames failed for %s: %s', steam_id, e)
+            return FAILED
+        response = json_data.get('response') or {}
+        # Private profiles come back with an empty response
+        if 'game_count' not in response:
+            return None
+        return response.get('games', [])
+
+
+class OwnedGames(object):
+    """
+    Owned games for many users, one row per (user, game), with each user's rows together.
+
+    steam_ids -- steamid of each user (int64), by user index
+    visible -- False for users whose profiles are private (bool), by user index
+    failed -- True for users whose request failed, so we don't know their games (bool), by user index
+    offsets -- user i's rows are offsets[i]:offsets[i + 1]
+    users -- user index of each row (int32)
+    appids -- appid of each row (int32)
+    playtime -- minutes played of each row (playtime_forever, int32)
+
+    Catalogs passed in for prices can be a GameTable (Games.get_table) or anything else
+    with an appids array and a same-length array of values.
+
+    """
+
+    def __init__(self, steam_ids, visible, offsets, appids, playtime, failed=None):
+        _need_numpy()
+        self.steam_ids = numpy.asarray(steam_ids, dtype=numpy.int64)
+        self.visible = numpy.asarray(visible, dtype=bool)
+        if failed is None:
+            failed = numpy.zeros(len(self.steam_ids), dtype=bool)
+        self.failed = numpy.asarray(failed, dtype=bool)
+        self.offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        self.appids = numpy.asarray(appids, dtype=numpy.int32)
+        self.playtime = numpy.asarray(playtime, dtype=numpy.int32)
+        self.users = numpy.repeat(numpy.arange(len(self.steam_ids), dtype=numpy.int32), numpy.diff(self.offsets))
+        self._order = None
+
+    @classmethod
+    def from_games(cls, users):
+        """
+        Builds an OwnedGames from (steam_id, games) pairs, where games is a list of
+        GetOwnedGames entries (like SteamUser.get_games gives), None for a private
+        profile, or FAILED if the request for it failed.
+
+        """
+        # steamids are 64-bit, which array('l') isn't everywhere (and doubles can't hold
+        # them exactly), so the per-user columns are lists that numpy turns into int64
+        steam_ids, offsets = [], [0]
+        visible, failed = array('b'), array('b')
+        appids, playtime = array('i'), array('i')
+        for steam_id, games in users:
+            steam_ids.append(int(steam_id))
+            visible.append(games is not None)
+            failed.append(games is FAILED)
+            if games is FAILED:
+                games = None
+            for game in games or ():
+                appids.append(game['appid'])
+                playtime.append(game.get('playtime_forever') or 0)
+            offsets.append(len(appids))
+        return cls(steam_ids, _from_array(visible), offsets,
+                   _from_array(appids), _from_array(playtime), _from_array(failed))
+
+    @classmethod
+    def load(cls, path):
+        """Loads an OwnedGames saved with save()"""
+        _need_numpy()
+        data = numpy.load(path)
+        failed = data['failed'] if 'failed' in data.files else None
+        return cls(data['steam_ids'], data['visible'], data['offsets'], data['appids'], data['playtime'], failed)
+
+    def save(self, path):
+        """Saves the arrays to a .npz file"""
+        numpy.savez(path, steam_ids=self.steam_ids, visible=self.visible, offsets=self.offsets,
+                    appids=self.appids, playtime=self.playtime, failed=self.failed)
+
+    def __len__(self):
+        return len(self.appids)
+
+    @property
+    def user_count(self):
+        return len(self.steam_ids)
+
+    def user_index(self, steam_id):
+        """The index of a user, for the arrays that are by user index. Raises KeyError if they aren't here."""
+        if self._order is None:
+            self._order = numpy.argsort(self.steam_ids, kind='mergesort')
+        sorted_ids = self.steam_ids[self._order]
+        i = numpy.searchsorted(sorted_ids, int(steam_id))
+        if i == len(sorted_ids) or sorted_ids[i] != int(steam_id):
+            raise KeyError(steam_id)
+        return int(self._order[i])
+
+    def failed_steam_ids(self):
+        """The steamids whose requests failed, to load again"""
+        return [str(x) for x in self.steam_ids[self.failed]]
+
+    def games_of(self, steam_id):
+        """The appids a user owns"""
+        i = self.user_index(steam_id)
+        return self.appids[self.offsets[i]:self.offsets[i + 1]]
+
+    def game_counts(self):
+        """Number of games each user owns, by user index"""
+        return numpy.diff(self.offsets)
+
+    def total_playtime(self):
+        """Minutes each user has played in total, by user index"""
+        return self._per_user(self.playtime)
+
+    def prices(self, catalog, column='prices'):
+        """
+        Each row's value from catalog's column (a price, by default), joined on appid.
+        Apps that aren't in the catalog get 0.
+
+        """
+        catalog_appids = _from_array(catalog.appids)
+        values = _from_array(getattr(catalog, column))
+        order = numpy.argsort(catalog_appids, kind='mergesort')
+        catalog_appids, values = catalog_appids[order], values[order]
+        if not len(catalog_appids):
+            return numpy.zeros(len(self.appids))
+        rows = numpy.searchsorted(catalog_appids, self.appids).clip(0, len(catalog_appids) - 1)
+        found = catalog_appids[rows] == self.appids
+        return numpy.where(found, values[rows], 0).astype(numpy.float64)
+
+    def library_values(self, catalog, column='prices'):
+        """What each user's games add up to in catalog's column (see prices), by user index"""
+        return numpy.bincount(self.users, weights=self.prices(catalog, column), minlength=self.user_count)
+
+    def top_apps(self, n=10, by='owners'):
+        """
+        The n apps with the most owners (by='owners') or minutes played (by='playtime'),
+        as a list of (appid, count), biggest first.
+
+        """
+        appids, rows = numpy.unique(self.appids, return_inverse=True)
+        if by == 'owners':
+            totals = numpy.bincount(rows, minlength=len(appids))
+        elif by == 'playtime':
+            totals = numpy.bincount(rows, weights=self.playtime, minlength=len(appids)).astype(numpy.int64)
+        else:
+            raise ValueError("by should be 'owners' or 'playtime'")
+        # Stable sort of the negated totals, so ties come out in appid order
+        top = numpy.argsort(-totals, kind='mergesort')[:n]
+        return [(int(appids[i]), int(totals[i])) for i in top]
+
+    def co_ownership(self, appids, batch_users=65536):
+        """
+        How many users own each pair of appids: a len(appids) x len(appids) matrix, where
+        [i, j] is the number of users owning both appids[i] and appids[j] (and [i, i] the
+        owners of appids[i]). Users are counted batch_users at a time, to bound memory.
+
+        """
+        appids = numpy.asarray(appids, dtype=numpy.int32)
+        counts = numpy.zeros((len(appids), len(appids)), dtype=numpy.int64)
+        if not len(appids) or not len(self.appids):
+            return counts
+        order = numpy.argsort(appids, kind='mergesort')
+        sorted_appids = appids[order]
+        columns = numpy.searchsorted(sorted_appids, self.appids).clip(0, len(appids) - 1)
+        wanted = sorted_appids[columns] == self.appids
+        rows, columns = self.users[wanted], order[columns[wanted]]
+        for start in xrange(0, self.user_count, batch_users):
+            batch = (rows >= start) & (rows < start + batch_users)
+            owned = numpy.zeros((min(batch_users, self.user_count - start), len(appids)), dtype=numpy.float32)
+            owned[rows[batch] - start, columns[batch]] = 1
+            counts += owned.T.dot(owned).round().astype(numpy.int64)
+        return counts
+
+    def shared_apps(self, steam_id, other_steam_id):
+        """The appids both users own"""
+        return numpy.intersect1d(self.games_of(steam_id), self.games_of(other_steam_id))
+
+    def _per_user(self, values):
+        return numpy.bincount(self.users, weights=values, minlength=self.user_count).astype(numpy.int64)
+
+
+def _from_array(values):
+    """A numpy array of an array.array's items, without going through Python ints"""
+    if isinstance(values, array):
+        return numpy.frombuffer(values, dtype=numpy.dtype(values.typecode)).copy()
+    return numpy.asarray(values)
+
+
+def _need_numpy():
+    if numpy is None:
+        raise ImportError('Libraries.py needs numpy')
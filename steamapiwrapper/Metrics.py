@@ -0,0 +1,283 @@
+"""
+Request instrumentation for SteamAPI.
+
+Every call to _get_json (and every page or stream opened with _open_url) is
+described by a RequestInfo, which is handed to each instrument in
+SteamAPI.instruments before the request goes out and again once it's done. An
+instrument is anything with before_request(info) and after_request(info) methods;
+subclass Instrument to only implement the one you need.
+
+MetricsCollector keeps per-endpoint latency histograms, error rates, and how much
+time went to rate limiting, backoff and parsing, and can print them in Prometheus'
+text format. StatsdExporter sends each request to a StatsD server as it finishes.
+
+Example:
+    metrics = MetricsCollector()
+    SteamAPI.instruments.append(metrics)
+    ...
+    print metrics.summary()['store.steampowered.com/api/appdetails']['p90']
+    open('steam.prom', 'w').write(metrics.prometheus())
+
+"""
+
+import re
+import socket
+import threading
+import time
+import urlparse
+
+# Upper bounds (in seconds) of the request latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (metric name, help, _EndpointStats attribute) for the per-endpoint Prometheus counters
+COUNTERS = [
+    ('requests_total', 'Requests made, including ones served from the cache.', 'requests'),
+    ('request_errors_total', 'Requests that failed.', 'errors'),
+    ('response_bytes_total', 'Bytes of response bodies received.', 'bytes'),
+    ('retries_total', 'Retries after errors and throttling.', 'retries'),
+    ('rate_limit_wait_seconds_total', 'Time spent waiting on the rate limiter.', 'rate_limit_wait'),
+    ('backoff_seconds_total', 'Time spent backing off between retries.', 'backoff'),
+    ('parse_seconds_total', 'Time spent parsing json.', 'parse'),
+]
+
+
+class RequestInfo(object):
+    """
+    What happened to one request. Times are in seconds; the ones that don't apply are None.
+
+    url -- the url requested
+    endpoint -- the url with the query and ids taken out (see endpoint())
+    sent -- whether anything was actually sent to Steam (False for fresh cache hits)
+    status -- HTTP status of the last attempt, or None if it never got a response
+    bytes -- size of the (decoded) response body
+    dns, connect -- time spent resolving and connecting, None if a pooled connection was reused
+                    (for https, connect includes the TLS handshake)
+    ttfb -- time from sending the request to getting the response headers back
+    total -- the whole call, including retries, waits and parsing
+    parse -- time spent decoding the json
+    retries -- how many times the request was retried
+    cache -- 'hit', 'revalidated' (a 304), 'stale' (served from the cache because Steam failed),
+             'miss', 'shared' (waited on the same request from another thread), or None if
+             the endpoint isn't cached
+    rate_limit_wait -- time spent waiting on the rate limiter, including pauses after throttling
+    backoff -- time spent sleeping between retries after other errors
+    error -- what went wrong, if the request failed
+
+    """
+
+    __slots__ = ('url', 'endpoint', 'started', 'sent', 'status', 'bytes', 'dns', 'connect', 'ttfb',
+                 'total', 'parse', 'retries', 'cache', 'rate_limit_wait', 'backoff', 'error')
+
+    def __init__(self, url, clock=time.time):
+        self.url = url
+        self.endpoint = endpoint(url)
+        self.started = clock()
+        self.sent = False
+        self.status = None
+        self.bytes = None
+        self.dns = None
+        self.connect = None
+        self.ttfb = None
+        self.total = None
+        self.parse = None
+        self.retries = 0
+        self.cache = None
+        self.rate_limit_wait = 0.0
+        self.backoff = 0.0
+        self.error = None
+
+    def finish(self, clock=time.time):
+        self.total = clock() - self.started
+
+    def __repr__(self):
+        return '<RequestInfo {} status={} total={}>'.format(self.endpoint, self.status, self.total)
+
+
+class Instrument(object):
+    """Base class for instruments. Both hooks are called on the thread making the request."""
+
+    def before_request(self, info):
+        pass
+
+    def after_request(self, info):
+        pass
+
+
+class MetricsCollector(Instrument):
+    """Aggregates finished requests by endpoint. Safe to share between threads."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def after_request(self, info):
+        with self._lock:
+            stats = self._endpoints.get(info.endpoint)
+            if stats is None:
+                stats = self._endpoints[info.endpoint] = _EndpointStats(len(self.buckets))
+            stats.add(info, self.buckets)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+    def summary(self):
+        """
+        Returns a dict of endpoint -> dict of: requests, errors, error_rate, mean, p50, p90, p99
+        (latency percentiles, as the upper bound of the histogram bucket they fall in), ttfb
+        (mean), bytes, retries, cache (dict of cache result -> count), and the total seconds
+        spent on rate_limit_wait, backoff and parse.
+
+        """
+        with self._lock:
+            return dict((name, stats.summary(self.buckets)) for name, stats in self._endpoints.items())
+
+    def prometheus(self, prefix='steamapi'):
+        """Everything collected so far, in Prometheus' text exposition format"""
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            histogram = prefix + '_request_duration_seconds'
+            lines = ['# HELP {} Time taken by requests to Steam, including retries.'.format(histogram),
+                     '# TYPE {} histogram'.format(histogram)]
+            for name, stats in endpoints:
+                label = 'endpoint="{}"'.format(_escape(name))
+                cumulative = 0
+                for bound, count in zip(self.buckets, stats.histogram):
+                    cumulative += count
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (histogram, label, bound, cumulative))
+                lines.append('%s_bucket{%s,le="+Inf"} %d' % (histogram, label, stats.sent))
+                lines.append('%s_sum{%s} %r' % (histogram, label, stats.time))
+                lines.append('%s_count{%s} %d' % (histogram, label, stats.sent))
+
+            for metric, help_text, attr in COUNTERS:
+                metric = '{}_{}'.format(prefix, metric)
+                lines.append('# HELP {} {}'.format(metric, help_text))
+                lines.append('# TYPE {} counter'.format(metric))
+                for name, stats in endpoints:
+                    lines.append('%s{endpoint="%s"} %r' % (metric, _escape(name), getattr(stats, attr)))
+
+            metric = prefix + '_cache_results_total'
+            lines.append('# HELP {} Cache lookups by result.'.format(metric))
+            lines.append('# TYPE {} counter'.format(metric))
+            for name, stats in endpoints:
+                for result, count in sorted(stats.cache.items()):
+                    lines.append('%s{endpoint="%s",result="%s"} %d' % (metric, _escape(name), result, count))
+        return '\n'.join(lines) + '\n'
+
+
+class StatsdExporter(Instrument):
+    """
+    Sends each finished request to a StatsD server over UDP: a requests counter, an
+    errors counter, and timers for total, ttfb, rate_limit_wait and parse, all under
+    <prefix>.<endpoint>. Send failures are ignored.
+
+    """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='steamapi'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def after_request(self, info):
+        name = '{}.{}'.format(self.prefix, re.sub(r'[^A-Za-z0-9_\-]+', '_', info.endpoint).strip('_'))
+        lines = ['{}.requests:1|c'.format(name)]
+        if info.error is not None:
+            lines.append('{}.errors:1|c'.format(name))
+        if info.cache is not None:
+            lines.append('{}.cache.{}:1|c'.format(name, info.cache))
+        for timer in ('total', 'ttfb', 'rate_limit_wait', 'parse'):
+            value = getattr(info, timer)
+            if value is not None:
+                lines.append('{}.{}:{:.3f}|ms'.format(name, timer, value * 1000))
+        try:
+            self._socket.sendto('\n'.join(lines), self.address)
+        except socket.error:
+            pass
+
+
+class _EndpointStats(object):
+    """Running totals for one endpoint"""
+
+    def __init__(self, buckets):
+        self.histogram = [0] * buckets
+        self.requests = 0
+        self.sent = 0
+        self.errors = 0
+        self.time = 0.0
+        self.ttfb = 0.0
+        self.ttfb_count = 0
+        self.bytes = 0
+        self.retries = 0
+        self.rate_limit_wait = 0.0
+        self.backoff = 0.0
+        self.parse = 0.0
+        self.cache = {}
+
+    def add(self, info, buckets):
+        self.requests += 1
+        self.errors += info.error is not None
+        self.bytes += info.bytes or 0
+        self.retries += info.retries
+        self.rate_limit_wait += info.rate_limit_wait
+        self.backoff += info.backoff
+        self.parse += info.parse or 0.0
+        if info.cache is not None:
+            self.cache[info.cache] = self.cache.get(info.cache, 0) + 1
+        if info.ttfb is not None:
+            self.ttfb += info.ttfb
+            self.ttfb_count += 1
+        # Only requests that went to Steam go in the latency histogram
+        if info.sent and info.total is not None:
+            self.sent += 1
+            self.time += info.total
+            for i, bound in enumerate(buckets):
+                if info.total <= bound:
+                    self.histogram[i] += 1
+                    break
+
+    def percentile(self, pct, buckets):
+        """The upper bound of the bucket the pct'th percentile falls in (None past the last bucket)"""
+        if not self.sent:
+            return None
+        target = pct / 100.0 * self.sent
+        seen = 0
+        for bound, count in zip(buckets, self.histogram):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def summary(self, buckets):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'error_rate': float(self.errors) / self.requests if self.requests else 0.0,
+            'mean': self.time / self.sent if self.sent else None,
+            'p50': self.percentile(50, buckets),
+            'p90': self.percentile(90, buckets),
+            'p99': self.percentile(99, buckets),
+            'ttfb': self.ttfb / self.ttfb_count if self.ttfb_count else None,
+            'bytes': self.bytes,
+            'retries': self.retries,
+            'cache': dict(self.cache),
+            'rate_limit_wait': self.rate_limit_wait,
+            'backoff': self.backoff,
+            'parse': self.parse,
+        }
+
+
+def endpoint(url):
+    """
+    The endpoint a url belongs to, for grouping metrics: host and path, without the
+    query string, and with numeric path segments (steamids, appids) replaced by {id}.
+    e.g. 'steamcommunity.com/profiles/{id}/wishlist'
+
+    """
+    parts = urlparse.urlsplit(url)
+    segments = ['{id}' if x.isdigit() else x for x in parts.path.strip('/').split('/') if x]
+    return '/'.join([parts.netloc] + segments)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
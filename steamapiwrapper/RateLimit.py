@@ -0,0 +1,170 @@
+"""
+Client-side rate limiting for Steam requests.
+
+Each endpoint gets a token bucket, so we can send requests as fast as Steam allows
+and no faster. When Steam throttles us anyway (429/503), the bucket is paused for
+an exponential backoff with jitter -- or for as long as Steam's Retry-After header
+asks -- so every thread hitting that endpoint slows down together.
+
+One RateLimiter is shared by all SteamAPI objects (SteamAPI.rate_limiter).
+
+"""
+
+import random
+import threading
+import time
+import urlparse
+from email.utils import parsedate_tz, mktime_tz
+
+# (requests per second, burst size), keyed by host or host + path prefix.
+# The most specific prefix wins.
+DEFAULT_LIMITS = {
+    # The Web API allows 100,000 calls a day per key
+    'api.steampowered.com': (100000 / 86400.0, 100),
+    # The storefront API allows roughly 200 requests every 5 minutes
+    'store.steampowered.com': (200 / 300.0, 40),
+    # No published limit for community pages, so be polite
+    'steamcommunity.com': (1.0, 20),
+}
+
+
+class TokenBucket(object):
+    """A thread-safe token bucket that refills at `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate, capacity, clock=time.time):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.updated = clock()
+        self.paused_until = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """
+        Takes tokens from the bucket and returns how many seconds the caller has to wait
+        before using them. The bucket can go into debt, so waiters queue up fairly.
+
+        """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            wait = 0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.paused_until - now)
+
+    def pause(self, seconds):
+        """Stops handing out tokens for the next `seconds` seconds"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+
+class RateLimiter(object):
+    """
+    Token buckets per endpoint, plus backoff for when Steam pushes back.
+    Keeps counters of how long requests spent waiting, see stats().
+
+    """
+
+    def __init__(self, limits=None, base_delay=1.0, max_delay=120.0, clock=time.time, sleep=time.sleep):
+        """
+        args:
+        limits -- dict of host (or host + path prefix) -> (requests per second, burst size).
+                  Defaults to DEFAULT_LIMITS. Endpoints that don't match aren't limited.
+        base_delay -- first backoff delay in seconds, doubled on each retry
+        max_delay -- longest we'll ever back off for
+
+        """
+        self.limits = DEFAULT_LIMITS if limits is None else limits
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        self._buckets = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        """Blocks until a request to url is allowed. Returns the number of seconds waited."""
+        key = self._key(url)
+        bucket = self._bucket(key)
+        wait = bucket.reserve() if bucket is not None else 0
+        if wait > 0:
+            self.sleep(wait)
+        self._count(key, requests=1, waits=1 if wait > 0 else 0, wait_time=wait)
+        return wait
+
+    def backoff(self, url, attempt, retry_after=None, throttled=True):
+        """
+        Works out how long to back off after a failed request, and returns it.
+
+        If Steam throttled us (throttled=True) the endpoint's bucket is paused, so the
+        next acquire() -- from any thread -- waits it out. Otherwise only this thread sleeps.
+
+        args:
+        attempt -- how many retries have been made already
+        retry_after -- value of the Retry-After header, if Steam sent one
+
+        """
+        delay = parse_retry_after(retry_after, self.clock())
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        delay = min(delay, self.max_delay)
+
+        key = self._key(url)
+        bucket = self._bucket(key)
+        if throttled and bucket is not None:
+            bucket.pause(delay)
+        else:
+            self.sleep(delay)
+        self._count(key, backoffs=1, throttled=1 if throttled else 0, backoff_time=delay)
+        return delay
+
+    def stats(self):
+        """Returns a dict of endpoint -> counters (requests, waits, wait_time, backoffs, throttled, backoff_time)"""
+        with self._lock:
+            return dict((key, dict(counts)) for key, counts in self._stats.items())
+
+    def total_wait(self):
+        """Total seconds spent waiting on buckets and backoffs, over all endpoints"""
+        return sum(s.get('wait_time', 0) + s.get('backoff_time', 0) for s in self.stats().values())
+
+    def _key(self, url):
+        """The most specific configured limit that matches url, or its host if none do"""
+        parts = urlparse.urlsplit(url)
+        endpoint = parts.netloc + parts.path
+        best = parts.netloc
+        for prefix in self.limits:
+            if endpoint.startswith(prefix) and len(prefix) > len(best):
+                best = prefix
+        return best
+
+    def _bucket(self, key):
+        if key not in self.limits:
+            return None
+        with self._lock:
+            if key not in self._buckets:
+                rate, capacity = self.limits[key]
+                self._buckets[key] = TokenBucket(rate, capacity, self.clock)
+            return self._buckets[key]
+
+    def _count(self, key, **counts):
+        with self._lock:
+            stats = self._stats.setdefault(key, {})
+            for name, value in counts.items():
+                stats[name] = stats.get(name, 0) + value
+
+
+def parse_retry_after(value, now):
+    """Retry-After is either a number of seconds or an HTTP date. Returns seconds, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, mktime_tz(parsed) - now)
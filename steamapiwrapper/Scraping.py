@@ -0,0 +1,122 @@
+"""
+Scrapers for the community pages that have no API: wishlists and groups.
+
+SteamUser.scraper picks the backend. The default RegexScraper never builds a DOM:
+it runs a couple of compiled patterns over the page as it streams in, and only
+keeps the bit of the page it hasn't looked at yet. SoupScraper uses BeautifulSoup
+(with lxml if it's installed), and is more forgiving of odd markup.
+
+See benchmarks/scraping.py for how they compare.
+
+"""
+
+import re
+
+# Attribute names are anchored with (?<![\w-]) rather than \b, which would also match data-id= and the like
+WISHLIST_ROW = re.compile(r'<div\b[^>]*(?<![\w-])class="[^"]*\bwishlistRow\b[^"]*"[^>]*>')
+ID_ATTR = re.compile(r'(?<![\w-])id="[^"0-9]*([0-9]+)')
+GROUP_BLOCK_OR_LINK = re.compile(r'(<div\b[^>]*(?<![\w-])class="[^"]*\bgroupBlockMedium\b[^"]*"[^>]*>)'
+                                 r'|<a\b[^>]*(?<![\w-])href="([^"]*)"')
+NUMBER = re.compile(r'([0-9]+)')
+# The strainer sees the raw class attribute, which Steam pads with spaces
+WISHLIST_CLASS = re.compile(r'\bwishlistRow\b')
+GROUP_CLASS = re.compile(r'\bgroupBlockMedium\b')
+
+
+class Scraper(object):
+    """Base class for scrapers. Both methods take a file-like object with the page's html."""
+
+    def wishlist_ids(self, fp):
+        """Returns the appids on a wishlist page"""
+        raise NotImplementedError
+
+    def group_urls(self, fp):
+        """Returns the group urls on a profile's groups page"""
+        raise NotImplementedError
+
+
+class RegexScraper(Scraper):
+    """Pulls out just the tags we need with regular expressions, as the page arrives"""
+
+    def __init__(self, chunk_size=16 * 1024):
+        self.chunk_size = chunk_size
+
+    def wishlist_ids(self, fp):
+        ids = []
+        for match in iter_matches(fp, WISHLIST_ROW, self.chunk_size):
+            found = ID_ATTR.search(match.group(0))
+            if found:
+                ids.append(int(found.group(1)))
+        return ids
+
+    def group_urls(self, fp):
+        urls = []
+        in_block = False
+        for match in iter_matches(fp, GROUP_BLOCK_OR_LINK, self.chunk_size):
+            if match.group(1):
+                in_block = True
+            elif in_block:
+                # The first link after a group block's opening tag is the group's
+                if match.group(2):
+                    urls.append(match.group(2))
+                in_block = False
+        return urls
+
+
+class SoupScraper(Scraper):
+    """
+    Parses the page with BeautifulSoup, only building the parts of the tree we look at.
+    Needs beautifulsoup4; uses the lxml parser if it's installed.
+
+    """
+
+    def __init__(self, parser=None):
+        from bs4 import BeautifulSoup, SoupStrainer
+        self._soup, self._strainer = BeautifulSoup, SoupStrainer
+        if parser is None:
+            try:
+                import lxml
+                parser = 'lxml'
+            except ImportError:
+                parser = 'html.parser'
+        self.parser = parser
+
+    def wishlist_ids(self, fp):
+        soup = self._soup(fp.read(), self.parser, parse_only=self._strainer('div', class_=WISHLIST_CLASS))
+        ids = []
+        for game in soup.find_all('div', 'wishlistRow'):
+            search = NUMBER.search(game.get('id') or '')
+            if search:
+                ids.append(int(search.group(1)))
+        return ids
+
+    def group_urls(self, fp):
+        soup = self._soup(fp.read(), self.parser, parse_only=self._strainer('div', class_=GROUP_CLASS))
+        urls = []
+        for group in soup.find_all('div', 'groupBlockMedium'):
+            link = group.find('a')
+            if link and link.get('href'):
+                urls.append(link['href'])
+        return urls
+
+
+def iter_matches(fp, pattern, chunk_size=16 * 1024):
+    """
+    Yields pattern's matches over everything read from fp, a chunk at a time.
+    Only the unmatched tail of the page (from the last '<') is carried over between
+    chunks, so tags split across chunks are still found. Patterns have to start at '<'
+    and not contain another '<'.
+
+    """
+    buf = ''
+    while True:
+        data = fp.read(chunk_size)
+        buf += data
+        last_end = 0
+        for match in pattern.finditer(buf):
+            last_end = match.end()
+            yield match
+        if not data:
+            return
+        cut = buf.rfind('<', last_end)
+        buf = buf[cut:] if cut != -1 else ''
@@ -1,7 +1,29 @@
 import json
 import datetime
+import logging
+import re
+import threading
+import time
 import urllib2
-from time import sleep
+import urlparse
+from contextlib import contextmanager
+from StringIO import StringIO
+from Cache import ResponseCache
+from Concurrency import Executor, SingleFlight
+from Metrics import RequestInfo
+from Streaming import iter_array
+from RateLimit import RateLimiter
+from Transport import PooledTransport
+
+# Status codes worth retrying after a backoff
+RETRY_CODES = (429, 500, 502, 503, 504)
+
+log = logging.getLogger('steamapiwrapper')
+log.addHandler(logging.NullHandler())
+
+# The RequestInfo for the _get_json/_stream_json call running on this thread, so
+# _open_url fills it in instead of starting its own
+_local = threading.local()
 
 class SteamError(Exception):
     pass
@@ -9,55 +31,355 @@ class SteamError(Exception):
 class SteamAPI:
     """Base class for our other Steam API classes"""
 
-    def __init__(self, steam_id, api_key):
-        """Sets the steam id of the user in question and your API key."""
+    # Max number of simultaneous requests to each host, shared by every instance.
+    # Hosts that aren't listed aren't capped.
+    host_limits = {
+        'api.steampowered.com': 8,
+        'store.steampowered.com': 4,
+        'steamcommunity.com': 4,
+    }
+    _host_semaphores = {}
+    _host_lock = threading.Lock()
+
+    # Shared by every instance unless one is passed in, so keep-alive connections get reused
+    transport = PooledTransport()
+
+    # Shared by every instance (and thread), so all of our requests count against the same limits
+    rate_limiter = RateLimiter()
+
+    # Shared response cache, so new objects don't download the app list and schemas all over again.
+    # Set to ResponseCache(store=SqliteStore(path)) to keep it on disk, or None to turn it off.
+    cache = ResponseCache()
+
+    # Instruments called before and after every request, shared by every instance (see Metrics.py)
+    instruments = []
+
+    # Threads the *_async methods run on, shared by every instance
+    executor = Executor(16)
+
+    # Identical _get_json calls running at the same time share one request and parsed result.
+    # Set to None to turn it off.
+    single_flight = SingleFlight()
+
+    def __init__(self, steam_id, api_key, transport=None):
+        """
+        Sets the steam id of the user in question and your API key.
+        Optionally takes a Transport to make requests with (see Transport.py).
+
+        """
         self.api_key = api_key
         self.steam_id = steam_id
-        self.time = 10
+        if transport is not None:
+            self.transport = transport
         self.retries = 3
 
 
-    def _get_json(self, url, params = None):
-        """Retrieves json from a particular url, and returns it as a json object."""
-        if params is None:
-            return json.load(self._open_url(url))
+    def _get_json(self, url, params = None, cache=True):
+        """
+        Retrieves json from a particular url, and returns it as a json object.
+
+        Responses from slow-changing endpoints are kept in self.cache (see Cache.py).
+        Pass cache=False to skip the cache and go straight to Steam for this call.
+
+        If another thread is already loading the same url, this waits for its result
+        instead of making a request of its own (see self.single_flight). The json that
+        comes back can be shared between callers, so don't change it in place.
+
+        """
+        if params is not None:
+            url = url % params
+        info = self._begin_request(url)
+        try:
+            if self.single_flight is None:
+                return self._load_json(url, cache, info)
+            (data, leader), shared = self.single_flight.do(
+                (url, cache, self.transport), lambda: (self._load_json(url, cache, info), info))
+            if shared:
+                info.cache, info.status, info.bytes = 'shared', leader.status, leader.bytes
+            return data
+        except Exception as e:
+            info.error = info.error or str(e) or e.__class__.__name__
+            raise
+        finally:
+            self._end_request(info)
+
+    def _load_json(self, url, cache, info):
+        if not cache or self.cache is None or self.cache.ttl_for(url) is None:
+            with _current_request(info):
+                resp = self._open_url(url)
+            if resp is None:
+                raise SteamError("Couldn't load {}".format(_redact(url)))
+            return _parse(resp.read(), info)
+
+        entry = self.cache.get(url)
+        if entry is not None and self.cache.is_fresh(url, entry):
+            self.cache.record(hit=True)
+            info.cache = 'hit'
+            return _parse(entry.body, info)
+
+        headers = {}
+        if entry is not None and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        with _current_request(info):
+            resp = self._open_url(url, headers)
+
+        if resp is not None and resp.getcode() == 304 and entry is not None:
+            self.cache.touch(url, entry)
+            self.cache.record(hit=True)
+            info.cache = 'revalidated'
+            return _parse(entry.body, info)
+        if resp is None and entry is not None:
+            # Steam's having trouble -- stale data is better than none
+            self.cache.record(hit=True)
+            info.cache = 'stale'
+            return _parse(entry.body, info)
+
+        if resp is None:
+            raise SteamError("Couldn't load {}".format(_redact(url)))
+        self.cache.record(hit=False)
+        info.cache = 'miss'
+        body = resp.read()
+        data = _parse(body, info)
+        if resp.getcode() == 200:
+            self.cache.put(url, body, resp.info())
+        return data
+
+    def _stream_json(self, url, path, cache=True):
+        """
+        Like _get_json, but for huge responses: yields the elements of the array at path
+        (a list of keys, like ['applist', 'apps']) one by one, parsing the response as it
+        arrives instead of loading all of it first. See Streaming.py.
+
+        Cached responses are streamed from the cache, and fresh ones are saved into it as
+        they're read (unless they're too big for it).
+
+        """
+        info = self._begin_request(url)
+        try:
+            for item in self._iter_json(url, path, cache, info):
+                yield item
+        except Exception as e:
+            info.error = info.error or str(e) or e.__class__.__name__
+            raise
+        finally:
+            self._end_request(info)
+
+    def _iter_json(self, url, path, cache, info):
+        cacheable = cache and self.cache is not None and self.cache.ttl_for(url) is not None
+        entry = self.cache.get(url) if cacheable else None
+        resp = None
+        if entry is not None and self.cache.is_fresh(url, entry):
+            self.cache.record(hit=True)
+            info.cache, info.bytes = 'hit', len(entry.body)
+            fp = StringIO(entry.body)
         else:
-            return json.load(self._open_url(url % params))
+            headers = {}
+            if entry is not None and entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry is not None and entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+            with _current_request(info):
+                resp = self._open_url(url, headers, stream=True)
+            if entry is not None and (resp is None or resp.getcode() == 304):
+                if resp is not None:
+                    self.cache.touch(url, entry)
+                self.cache.record(hit=True)
+                info.cache = 'revalidated' if resp is not None else 'stale'
+                info.bytes = len(entry.body)
+                fp = StringIO(entry.body)
+            else:
+                if resp is None:
+                    raise SteamError("Couldn't load {}".format(_redact(url)))
+                if cacheable:
+                    self.cache.record(hit=False)
+                    info.cache = 'miss'
+                fp = resp
+                if cacheable and resp.getcode() == 200:
+                    fp = _CachingReader(resp, self.cache.max_bytes,
+                                        lambda body: self.cache.put(url, body, resp.info()))
+        try:
+            for item in iter_array(fp, path):
+                yield item
+            # Read whatever's after the array, so the body can be cached and the connection reused
+            while fp.read(64 * 1024):
+                pass
+        finally:
+            fp.close()
+            if info.bytes is None:
+                info.bytes = getattr(resp, 'bytes_read', None)
 
-    def _open_url(self, url):
+    def _open_url(self, url, headers=None, stream=False):
         """
         Put here to make catching exceptions easier
-        
-        Sometimes Steam seems to throttle your requests if you're hitting them a bit hard.
-        If you get an HTTPError from that, it will pause and retry a few times, which usually
-        results in Steam letting your next requests go through. If it fails all the retries, it
-        will just return None and continue on.
 
-        TODO - better error logging for failed requests.
+        Requests are paced by self.rate_limiter so we stay under Steam's limits. If Steam
+        throttles us (429/503), is having trouble (other 5xx), or the connection fails,
+        this backs off exponentially -- or for as long as Steam's Retry-After header says --
+        and tries again, up to self.retries times. If every retry fails a SteamError is raised.
+        Any other HTTP error just returns None so you can continue on. Failures are logged
+        to the 'steamapiwrapper' logger.
+
+        headers -- optional dict of extra request headers
+        stream -- ask the transport for a response that's read as it arrives
 
         """
+        info = getattr(_local, 'request', None)
+        if info is not None and info.url == url:
+            return self._send(url, headers, stream, info)
+        info = self._begin_request(url)
         try:
-            return urllib2.urlopen(url)
-        except urllib2.URLError as e:
-            print 'URLError = ' + str(e.reason)
-        except urllib2.HTTPError as e:
-            print 'HTTPError = ' + str(e.code)
-            return self._retry(self, url, self.time, self.tries)
-        except ValueError as e:
-            print 'Not a proper URL'
-        except:
-            return self._retry(url, self.time, self.retries)
-
-    def _retry(self, url):
-        """Retries your request n number of times"""
-        print "{} is unreachable, retrying {} number of times".format(url, self.retries)
-        for num in range(self.retries):
+            resp = self._send(url, headers, stream, info)
+            body = getattr(resp, 'body', None)
+            if isinstance(body, str):
+                info.bytes = len(body)
+            return resp
+        finally:
+            self._end_request(info)
+
+    def _send(self, url, headers, stream, info):
+        """The retry loop behind _open_url, recording what happens in info"""
+        info.sent = True
+        for attempt in xrange(self.retries + 1):
+            info.retries = attempt
+            info.rate_limit_wait += self.rate_limiter.acquire(url)
+            semaphore = self._host_semaphore(url)
+            if semaphore is not None:
+                semaphore.acquire()
             try:
-                return urllib2.urlopen(url)
-            except:
-                sleep(self.time)
+                resp = self.transport.open(url, headers, stream)
+                info.status, info.error = resp.getcode(), None
+                _set_timings(info, getattr(resp, 'timings', None))
+                return resp
+            except urllib2.HTTPError as e:
+                log.warning('HTTP %s from %s (attempt %d)', e.code, _redact(url), attempt + 1)
+                info.status, info.error = e.code, 'HTTP {}'.format(e.code)
+                if e.code not in RETRY_CODES:
+                    return None
+                retry_after = e.info().get('retry-after') if e.info() is not None else None
+                throttled = e.code in (429, 503)
+            except urllib2.URLError as e:
+                log.warning("Couldn't connect to %s: %s (attempt %d)", _redact(url), e.reason, attempt + 1)
+                info.status, info.error = None, str(e.reason)
+                retry_after, throttled = None, False
+            except ValueError as e:
+                log.warning('Not a proper URL: %s', _redact(url))
+                info.error = 'Not a proper URL'
+                return None
+            finally:
+                if semaphore is not None:
+                    semaphore.release()
+            if attempt < self.retries:
+                delay = self.rate_limiter.backoff(url, attempt, retry_after, throttled)
+                # A throttled endpoint's bucket is paused instead, so that wait shows up in acquire()
+                if not throttled:
+                    info.backoff += delay
         raise SteamError('Can\'t connect to Steam. Try again later.')
-        
+
+    def _coalesce(self, key, func):
+        """
+        Returns func(), sharing the call with any other thread doing the same (key) right
+        now -- for loads that don't go through _get_json, like streamed app lists and schemas.
+
+        """
+        if self.single_flight is None:
+            return func()
+        result, _ = self.single_flight.do(key + (self.transport,), func)
+        return result
+
+    def _begin_request(self, url):
+        info = RequestInfo(url)
+        self._notify('before_request', info)
+        return info
+
+    def _end_request(self, info):
+        info.finish()
+        _local.last_request = info
+        self._notify('after_request', info)
+
+    def _notify(self, hook, info):
+        """Calls hook on every instrument. A broken instrument never breaks the request."""
+        for instrument in self.instruments:
+            try:
+                getattr(instrument, hook)(info)
+            except Exception:
+                log.exception('%s.%s failed', instrument.__class__.__name__, hook)
+
+    def _host_semaphore(self, url):
+        """Returns the semaphore capping concurrent requests to url's host, or None if it isn't capped"""
+        host = urlparse.urlparse(url).netloc
+        limit = self.host_limits.get(host)
+        if not limit:
+            return None
+        with SteamAPI._host_lock:
+            key = (host, limit)
+            if key not in SteamAPI._host_semaphores:
+                SteamAPI._host_semaphores[key] = threading.BoundedSemaphore(limit)
+            return SteamAPI._host_semaphores[key]
 
     def _date(self, date):
-        return datetime.datetime.fromtimestamp(int(date)).strftime('%Y-%m-%d %H:%M:%S')
\ No newline at end of file
+        return datetime.datetime.fromtimestamp(int(date)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def last_request():
+    """The RequestInfo of the last request finished on this thread, if any"""
+    return getattr(_local, 'last_request', None)
+
+
+@contextmanager
+def _current_request(info):
+    """Lets _open_url calls on this thread fill in info"""
+    _local.request = info
+    try:
+        yield
+    finally:
+        _local.request = None
+
+
+def _parse(body, info):
+    """json.loads, recording the body size and the time it took in info"""
+    started = time.time()
+    data = json.loads(body)
+    info.bytes = len(body)
+    info.parse = time.time() - started
+    return data
+
+
+def _set_timings(info, timings):
+    if timings:
+        info.dns = timings.get('dns')
+        info.connect = timings.get('connect')
+        info.ttfb = timings.get('ttfb')
+
+
+def _redact(url):
+    """Hides the API key in a url, for error messages"""
+    return re.sub(r'([?&]key=)[^&]*', r'\1<hidden>', url)
+
+
+class _CachingReader(object):
+    """Passes reads through to a response, and hands the whole body to on_done at the end (if it fits)"""
+
+    def __init__(self, fp, max_bytes, on_done):
+        self.fp = fp
+        self.max_bytes = max_bytes
+        self.on_done = on_done
+        self.parts = []
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        if self.parts is not None:
+            if data:
+                self.parts.append(data)
+                self.size += len(data)
+                if self.size > self.max_bytes:
+                    self.parts = None
+            else:
+                self.on_done(''.join(self.parts))
+                self.parts = None
+        return data
+
+    def close(self):
+        self.fp.close()
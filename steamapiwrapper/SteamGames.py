@@ -7,9 +7,16 @@ http://steamdb.info/blog/5/
 
 """
 
+import threading
+import time
 import urllib
-import json
-from SteamBase import SteamAPI
+from array import array
+from SteamBase import SteamAPI, SteamError, last_request, log
+from Concurrency import AsyncIterator, imap
+from Batching import AdaptiveChunker
+from AppIndex import AppIndex
+
+APP_LIST_URL = "http://api.steampowered.com/ISteamApps/GetAppList/v2"
 
 
 class Games(SteamAPI):
@@ -23,91 +30,351 @@ class Games(SteamAPI):
     # Get a generator for just the appids you specify
     some_games = games.get_appids_info([123,1245])
 
+    # Keep 8 requests in flight at a time
+    games = Games(workers=8)
+
+    # Skip appids that keep failing, and remember them between runs
+    games = Games(blocklist=Blocklist('appid_blocklist.json'))
+
+    # Look names up in a saved app index instead of downloading the app list
+    games = Games(index=AppIndex.load('apps.idx'))
+
     """
 
-    def __init__(self,num=None):
+    def __init__(self, num=None, workers=1, transport=None, blocklist=None, index=None):
         """
         args:
-        num -- number of games to query per call. The default 150 should work in most cases.
+        num -- number of games to query per call. By default this starts at 25 and adapts
+               to how Steam is coping (see Batching.py); pass a number to fix it.
+        workers -- number of appdetails requests to keep in flight at once. Requests
+                   to each host are also capped by SteamAPI.host_limits.
+        transport -- optional Transport to make requests with (see Transport.py)
+        blocklist -- optional Batching.Blocklist of appids to skip once they keep failing (per cc)
+        index -- optional AppIndex to resolve names and appids with. By default one is
+                 built from the app list the first time it's needed.
 
         """
-        self.num = 25 if num is None else num
-        self.appids_to_names, self.names_to_appids = None, None
+        SteamAPI.__init__(self, "", None, transport)
+        self.chunker = AdaptiveChunker(25) if num is None else AdaptiveChunker(num, num, num)
+        self.blocklist = blocklist
+        self.workers = workers
+        self._index = index
+        self._index_lock = threading.Lock()
+
+    def _create_url(self, appids, cc, filters=None):
+        """
+        Given a list of appids, creates an API url to retrieve them.
+        filters limits the response to some fields, like 'price_overview'.
 
-    def _create_url(self, appids, cc):
-        """Given a list of appids, creates an API url to retrieve them"""
+        """
         appids = ','.join([str(x) for x in appids])
         data = {'appids': appids, 'cc': cc, 'l': 'english', 'v': '1'}
+        if filters is not None:
+            data['filters'] = filters
         return "http://store.steampowered.com/api/appdetails/?{}".format(urllib.urlencode(data))
 
-    def _get_urls(self, appids, cc):
-        """Returns urls for all of appids"""
-        list_of_ids = list(self._chunks(appids,self.num))
-        return [self._create_url(x, cc) for x in list_of_ids]
+    def _iter_chunks(self, appids, cc):
+        """Splits appids into chunks, sized by self.chunker as it goes. Appids blocked for cc are left out."""
+        if self.blocklist is not None:
+            appids = [x for x in appids if (x, cc) not in self.blocklist]
+        else:
+            appids = list(appids)
+        i = 0
+        while i < len(appids):
+            size = self.chunker.size
+            yield appids[i:i + size]
+            i += size
+
+    def _fetch_chunk(self, appids, cc, filters=None):
+        """
+        Gets appdetails for a chunk of appids, as a dict of appid -> Steam's entry for it.
+
+        If Steam rejects the chunk (it answers null when it doesn't like one of the appids),
+        or leaves some of the appids out, those are fetched again in halves until the ones
+        at fault are on their own. Appids that fail by themselves are left out and count
+        against the blocklist for cc. A rejected chunk only shrinks self.chunker if that
+        doesn't turn up an appid at fault, or if both its halves are rejected too.
+
+        If Steam can't be reached at all, the SteamError is raised: that's not the appids' fault.
+
+        """
+        return self._fetch(appids, cc, filters)[0]
+
+    def _fetch(self, appids, cc, filters):
+        """_fetch_chunk's work. Returns (page, whether Steam rejected the request, number of appids that failed alone)."""
+        url = self._create_url(appids, cc, filters)
+        started = time.time()
+        page = self._get_json(url)
+        # The page may be shared with other callers (see SteamAPI.single_flight), so copy it before adding to it
+        page = dict(page) if isinstance(page, dict) else {}
+        missing = [x for x in appids if str(x) not in page]
+        info = last_request()
+        if info is None or info.url != url:
+            info = None
+        # Time spent waiting on the rate limiter says nothing about how Steam coped with the chunk
+        seconds = info.total - info.rate_limit_wait - info.backoff if info else time.time() - started
+        nbytes = info.bytes if info else None
+
+        if len(missing) < len(appids):
+            # Bad appids are split out below, so they don't count against the chunk size
+            self.chunker.record(len(appids), True, seconds, nbytes)
+
+        if len(appids) == 1:
+            entry = page.get(str(appids[0]))
+            ok = entry is not None and bool(entry.get('success'))
+            if not ok:
+                log.info('appdetails failed for appid %s (cc=%s)', appids[0], cc)
+            self._record(appids[0], cc, filters, ok)
+            return page, bool(missing), 0 if ok else 1
+        if len(missing) == len(appids):
+            half = len(appids) // 2
+            first, first_rejected, first_bad = self._fetch(appids[:half], cc, filters)
+            second, second_rejected, second_bad = self._fetch(appids[half:], cc, filters)
+            page.update(first)
+            page.update(second)
+            if not first_bad + second_bad or (first_rejected and second_rejected):
+                # Not one bad appid's doing: Steam is turning down chunks this big
+                self.chunker.record(len(appids), False, seconds, nbytes)
+            return page, True, first_bad + second_bad
+        bad = 0
+        if missing:
+            found, _, bad = self._fetch(missing, cc, filters)
+            page.update(found)
+        for appid in appids:
+            entry = page.get(str(appid))
+            if entry is not None and entry.get('success'):
+                self._record(appid, cc, filters, True)
+        return page, False, bad
+
+    def _record(self, appid, cc, filters, ok):
+        # Filtered requests (regional prices) leave out too much to say whether an appid is bad
+        if self.blocklist is None or filters is not None:
+            return
+        if ok:
+            self.blocklist.record_success(appid, cc)
+        else:
+            self.blocklist.record_failure(appid, cc)
+
+    def _save_blocklist(self):
+        if self.blocklist is not None:
+            self.blocklist.save()
 
-    def get_all(self, cc):
+    def get_all(self, cc, workers=None, ordered=True, compact=False):
         """
         Gets all games currently in the Steam store (as a generator)
 
         args:
         cc -- Country Code
+        workers -- number of requests in flight at once (defaults to self.workers)
+        ordered -- if False, games are yielded as soon as their request finishes instead
+                   of in appid list order
+        compact -- yield CompactGames instead of Games, which use a lot less memory
 
         """
-        if self.appids_to_names is None or self.names_to_appids is None:
-            self.appids_to_names, self.names_to_appids = self.get_ids_and_names()
-        urls = self._get_urls(self.appids_to_names.keys(), cc)
-        for url in urls:
-            for game in self._get_games_from(url):
-                yield game
+        for game in self.get_info_for(self.index.appids(), cc, workers, ordered, compact):
+            yield game
+
+    def get_all_async(self, cc, workers=None, ordered=True, compact=False):
+        """
+        get_all, stepped through on self.executor: returns a Concurrency.AsyncIterator,
+        whose next() gives a Future of the next game (or of Concurrency.END at the end).
+
+        """
+        return AsyncIterator(self.get_all(cc, workers, ordered, compact), self.executor)
+
+    def get_info_for_async(self, appids, cc, workers=None, ordered=True, compact=False):
+        """get_info_for, as an AsyncIterator. See get_all_async."""
+        return AsyncIterator(self.get_info_for(appids, cc, workers, ordered, compact), self.executor)
 
-    def _get_games_from(self, url):
+    def _games_from(self, page, cc, compact=False):
         """Generator to create the actual game objects"""
-        page = json.loads(self._open_url(url).read())
         for appid in page:
-            game = Game(page[appid], appid)
+            if compact:
+                game = CompactGame(page[appid], appid, self, cc=cc)
+            else:
+                game = Game(page[appid], appid)
             if game.success:
                 yield game
 
-    def get_info_for(self, appids, cc):
-        """Given a list of appids, returns their Game objects"""
-        urls = self._get_urls(appids, cc)
-        for url in urls:
-            for game in self._get_games_from(url):
+    def get_info_for(self, appids, cc, workers=None, ordered=True, compact=False):
+        """Given a list of appids, returns their Game objects. See get_all for the other args."""
+        for chunk, page in self.iter_pages(appids, cc, workers, ordered):
+            for game in self._games_from(page, cc, compact):
                 yield game
 
+    def iter_pages(self, appids, cc, workers=None, ordered=True):
+        """
+        Yields (chunk, page) for each chunk of appids fetched: the appids that were asked
+        for, and Steam's appdetails for them as a dict of appid -> json. Appids whose
+        requests failed are missing from the page. See get_all for the other args.
+
+        """
+        workers = self.workers if workers is None else workers
+        fetch = lambda chunk: (chunk, self._fetch_chunk(chunk, cc))
+        try:
+            for result in imap(fetch, self._iter_chunks(appids, cc), workers, ordered):
+                yield result
+        finally:
+            self._save_blocklist()
+
+    def get_prices(self, ccs, appids=None, workers=None, compact=False):
+        """
+        Gets games' prices in several countries at once. The full details are only
+        fetched once (for the first country code); for the rest only price_overview is
+        requested. Requests for every region are run side by side.
+
+        Yields a RegionalPrices per game, in appid list order. A game's price for a country
+        is None if it isn't sold there, or if the request for that country failed (the rest
+        carry on); free games get (None, 0, 0, 0).
+
+        args:
+        ccs -- list of Country Codes
+        appids -- the appids to load. Defaults to every app on Steam.
+        compact -- use CompactGames for the details
+
+        Example:
+        for game in games.get_prices(['US', 'GB', 'DE'], [570, 440]):
+            print game.game.name, game.prices['GB']
+
+        """
+        if appids is None:
+            appids = self.index.appids()
+        workers = self.workers if workers is None else workers
+        ccs = list(ccs)
+
+        def tasks():
+            for chunk in self._iter_chunks(appids, ccs[0]):
+                yield chunk, ccs[0], None
+                for cc in ccs[1:]:
+                    yield chunk, cc, 'price_overview'
+
+        def fetch(task):
+            chunk, cc, filters = task
+            if filters is None:
+                return chunk, self._fetch_chunk(chunk, cc)
+            try:
+                return chunk, self._fetch_chunk(chunk, cc, filters)
+            except (SteamError, ValueError) as e:
+                log.warning('Prices for cc=%s failed for %d appids: %s', cc, len(chunk), e)
+                return chunk, None
+
+        # Results come back in order, so every len(ccs) pages make up one chunk
+        pages = []
+        try:
+            for chunk, page in imap(fetch, tasks(), workers):
+                pages.append(page)
+                if len(pages) < len(ccs):
+                    continue
+                details, pages = pages[0], pages[1:]
+                for appid in (str(x) for x in chunk):
+                    if appid not in details:
+                        continue
+                    if compact:
+                        game = CompactGame(details[appid], appid, self, cc=ccs[0])
+                    else:
+                        game = Game(details[appid], appid)
+                    if not game.success:
+                        continue
+                    prices = {ccs[0]: (game.currency, game.price, game.discounted_price, game.discount_percent)}
+                    for cc, region_page in zip(ccs[1:], pages):
+                        if region_page is None:
+                            prices[cc] = None
+                            continue
+                        entry = region_page.get(appid) or {}
+                        data = entry.get('data')
+                        if not entry.get('success'):
+                            # Not sold there (or region locked), which isn't the same as free
+                            prices[cc] = None
+                        elif isinstance(data, dict):
+                            prices[cc] = _price(data)
+                        else:
+                            # Free games come back with an empty list instead of an object
+                            prices[cc] = (None, 0, 0, 0) if data == [] else None
+                    yield RegionalPrices(game, prices)
+                pages = []
+        finally:
+            self._save_blocklist()
+
+    def get_table(self, cc, appids=None, workers=None):
+        """
+        Loads games straight into a GameTable, without making an object per game.
+        Handy for whole-catalog price crunching.
+
+        args:
+        appids -- the appids to load. Defaults to every app on Steam.
+
+        """
+        if appids is None:
+            appids = self.index.appids()
+        workers = self.workers if workers is None else workers
+        table = GameTable()
+        for _, page in self.iter_pages(appids, cc, workers):
+            for appid in page:
+                table.append_json(page[appid], appid)
+        return table
+
+    def iter_apps(self):
+        """
+        Yields (appid, name) for every app on Steam, parsing the (huge) app list
+        as it downloads instead of loading all of it into memory first.
+
+        """
+        for app in self._stream_json(APP_LIST_URL, ['applist', 'apps']):
+            yield app['appid'], app['name']
+
     def get_ids_and_names(self):
         """
-        Returns two dicts: one mapping appid->game name, and one game name->appid
-        TODO: Refactor the code so we don't need to seperate dicts
+        Returns two dicts: one mapping appid->game name, and one game name->appid.
+        Where names are shared the last appid wins; see index for a lookup that keeps them all.
 
         """
-        url = self._open_url("http://api.steampowered.com/ISteamApps/GetAppList/v2")
-        url_info = json.loads(url.read())
         all_ids = {}
         all_names = {}
-        for app in url_info['applist']['apps']:
-            all_ids[app['appid']] = app['name']
-            all_names[app['name']] = app['appid']
+        for appid, name in self.iter_apps():
+            all_ids[appid] = name
+            all_names[name] = appid
         return all_ids, all_names
 
+    @property
+    def index(self):
+        """
+        The AppIndex of every app on Steam, built from the app list the first time it's used.
+        Threads (and Games objects) that need it at the same time share one download.
+
+        """
+        with self._index_lock:
+            if self._index is None:
+                self._index = self._coalesce(('app index',), lambda: AppIndex.build(self.iter_apps()))
+            return self._index
+
     def get_id(self, game_name):
-        """Given an appid, returns the game name"""
-        if self.appids_to_names is None or self.names_to_appids is None:
-            self.appids_to_names, self.names_to_appids = self.get_ids_and_names()
-        if game_name in self.names_to_appids:
-            return self.names_to_appids[game_name]
+        """Given a game name, returns its appid (the lowest one, if several apps have that name)"""
+        appids = self.index.appids(game_name)
+        if appids:
+            return appids[0]
+
+    def get_ids(self, game_name):
+        """Given a game name, returns every appid with that name"""
+        return self.index.appids(game_name)
 
     def get_name(self, appid):
-        """Given a game name returns its appid"""
-        if self.appids_to_names is None or self.names_to_appids is None:
-            self.appids_to_names, self.names_to_appids = self.get_ids_and_names()
-        if appid in self.appids_to_names:
-            return self.appids_to_names[appid]
+        """Given an appid, returns the game name"""
+        return self.index.name(int(appid))
 
-    def _chunks(self, params, number):
-        """Breaks a list into a set of equally sized chunked lists, with remaining entries in last list"""
-        for i in xrange(0, len(params), number):
-            yield params[i:i+number]
+    def search(self, text, limit=10):
+        """
+        Looks up games by a name someone typed: names starting with text first, then the
+        closest fuzzy matches. Returns a list of (appid, name).
+
+        """
+        found = self.index.prefix(text, limit)
+        if len(found) < limit:
+            seen = set(appid for appid, _ in found)
+            for appid, name, _ in self.index.fuzzy(text, limit):
+                if appid not in seen and len(found) < limit:
+                    found.append((appid, name))
+                    seen.add(appid)
+        return found
 
 
 class Game(SteamAPI):
@@ -123,66 +390,255 @@ class Game(SteamAPI):
         that the game object should have. Not all of these exist on all
         appids, so there's some defaults whenever there is a key error.
 
-        TODO: This is so awful. Rewrite this whole ugly method into
-        smaller ones.
-
         """
 
         self.appid = appid
         if 'success' in game_json:
             self.success = game_json['success']
             if self.success:
-                self.store_url = self._store_url(self.appid)
+                self.store_url = _store_url(self.appid)
                 data = game_json['data']
                 self.raw_json = data
                 self.type = data['type']
                 self.descriptidataon = data['detailed_description']
-
-                # Some appids don't have names
-                try:
-                    self.name = data['name']
-                except KeyError:
-                    self.name = "No Name"
-
-                try:
-                    self.supported_languages = data['supported_languages']
-                except KeyError:
-                    self.supported_languages = None
-
-                self.header_image = "http://cdn.steampowered.com/v/gfx/apps/{}/capsule_184x69.jpg".format(self.appid)
+                self.name = _name(data)
+                self.supported_languages = data.get('supported_languages')
+                self.header_image = _header_image(self.appid)
                 self.website = data['website']
-
-                # If any of these don't exit all of them don't exist,
-                # which is why I think it's okay to wrap them all in one try/except.
-                try:
-                    self.currency = data['price_overview']['currency']
-                    self.price = self._calc_price(data['price_overview']['initial'])
-                    self.discounted_price = self._calc_price(data['price_overview']['final'])
-                    self.discount_percent = data['price_overview']['discount_percent']
-                except KeyError:
-                    self.currency = None
-                    self.price = 0
-                    self.discounted_price = 0
-                    self.discount_percent = 0
-
-                try:
-                    self.packages = data['packages']
-                except KeyError:
-                    self.packages = None
-
+                self.currency, self.price, self.discounted_price, self.discount_percent = _price(data)
+                self.packages = data.get('packages')
                 self.platforms = data['platforms']
-
-                try:
-                    self.categories = data['categories']
-                except KeyError:
-                    self.categories = None
+                self.categories = data.get('categories')
 
         else:
-            print "Error! Can't read the game info for {}".format(appid)
+            log.warning("Can't read the game info for %s", appid)
 
     def _calc_price(self, amount):
         """Prices from the API are represented by cents -- convert to dollars"""
-        return float(amount) / 100.0
+        return _calc_price(amount)
 
     def _store_url(self, appid):
-        return "http://store.steampowered.com/app/{}".format(appid)
\ No newline at end of file
+        return _store_url(appid)
+
+
+class CompactGame(object):
+    """
+    A slimmed down Game for when you're holding lots of them in memory. It has the same
+    fields as Game, but keeps them in __slots__ instead of a __dict__, and leaves out
+    raw_json and the big text fields (description, supported_languages). Those are
+    fetched from Steam the first time you ask for them.
+
+    Differences from Game: platforms is built from a bitmask when you ask for it,
+    categories is a tuple of category descriptions, and packages a tuple of package ids.
+
+    """
+
+    __slots__ = ('appid', 'success', 'cc', 'name', 'type', 'website', 'currency', 'price', 'discounted_price',
+                 'discount_percent', 'packages', 'categories', '_platforms', '_details', '_source')
+
+    def __init__(self, game_json, appid, source=None, keep_details=False, cc='US'):
+        """
+        args:
+        source -- the Games object to fetch the left out fields with
+        keep_details -- keep raw_json and the text fields now instead of fetching them later
+        cc -- the Country Code the game was loaded for, so the left out fields are fetched for the same one
+
+        """
+        self.appid = appid
+        self.success = game_json.get('success', False)
+        self.cc = cc
+        self._source = source
+        self._details = None
+        if not self.success:
+            return
+        data = game_json['data']
+        self.name = _name(data)
+        self.type = _shared(data['type'])
+        self.website = data['website']
+        self.currency, self.price, self.discounted_price, self.discount_percent = _price(data)
+        self.currency = _shared(self.currency)
+        self.packages = tuple(data.get('packages') or ())
+        self.categories = tuple(_shared(c['description']) for c in data.get('categories') or ())
+        self._platforms = _platform_bits(data['platforms'])
+        if keep_details:
+            self._details = data
+
+    @property
+    def store_url(self):
+        return _store_url(self.appid)
+
+    @property
+    def header_image(self):
+        return _header_image(self.appid)
+
+    @property
+    def platforms(self):
+        return dict((name, bool(self._platforms & bit)) for name, bit in PLATFORM_BITS)
+
+    @property
+    def raw_json(self):
+        """
+        The full appdetails data for this game (for self.cc), fetched on first use.
+        Raises a SteamError if Steam doesn't have it any more.
+
+        """
+        if self._details is None:
+            if self._source is None:
+                self._source = Games()
+            page = self._source._get_json(self._source._create_url([self.appid], self.cc))
+            entry = (page or {}).get(str(self.appid)) or {}
+            if not entry.get('success'):
+                raise SteamError("Steam has no details for appid {}".format(self.appid))
+            self._details = entry['data']
+        return self._details
+
+    @property
+    def description(self):
+        return self.raw_json['detailed_description']
+
+    @property
+    def supported_languages(self):
+        return self.raw_json.get('supported_languages')
+
+
+class RegionalPrices(object):
+    """
+    A game, and its price in each country code asked for.
+    prices is a dict of cc -> (currency, price, discounted_price, discount_percent),
+    or None where the game isn't sold (or its prices couldn't be loaded).
+
+    """
+
+    __slots__ = ('game', 'prices')
+
+    def __init__(self, game, prices):
+        self.game = game
+        self.prices = prices
+
+    @property
+    def appid(self):
+        return self.game.appid
+
+
+class GameTable(object):
+    """
+    A column-oriented collection of games: one array per field instead of one object
+    per game, so whole-catalog aggregations don't have to create millions of objects.
+
+    Example:
+    table = games.get_table('US')
+    print table.total('prices', platform='linux')
+
+    """
+
+    NUMERIC_COLUMNS = ('appids', 'prices', 'discounted_prices', 'discount_percents', 'platforms')
+
+    def __init__(self):
+        self.appids = array('l')
+        self.prices = array('d')
+        self.discounted_prices = array('d')
+        self.discount_percents = array('B')
+        self.platforms = array('B')  # bitmask, see PLATFORM_BITS
+        self.names = []
+        self.types = []
+        self.currencies = []
+
+    def __len__(self):
+        return len(self.appids)
+
+    def append(self, game):
+        """Adds a Game or CompactGame"""
+        self._append(int(game.appid), game.name, game.type, game.currency, game.price,
+                     game.discounted_price, game.discount_percent, _platform_bits(game.platforms))
+
+    def append_json(self, game_json, appid):
+        """Adds a game straight from its appdetails json. Unsuccessful entries are skipped."""
+        if not game_json.get('success'):
+            return
+        data = game_json['data']
+        currency, price, discounted_price, discount_percent = _price(data)
+        self._append(int(appid), _name(data), data['type'], currency, price, discounted_price,
+                     discount_percent, _platform_bits(data['platforms']))
+
+    def _append(self, appid, name, type, currency, price, discounted_price, discount_percent, platforms):
+        self.appids.append(appid)
+        self.names.append(name)
+        self.types.append(_shared(type))
+        self.currencies.append(_shared(currency))
+        self.prices.append(price)
+        self.discounted_prices.append(discounted_price)
+        self.discount_percents.append(discount_percent)
+        self.platforms.append(platforms)
+
+    def select(self, platform=None, type=None, discounted=None):
+        """Returns the row numbers of games matching all the given filters"""
+        bit = dict(PLATFORM_BITS)[platform] if platform is not None else 0
+        rows = []
+        for i in xrange(len(self.appids)):
+            if bit and not self.platforms[i] & bit:
+                continue
+            if type is not None and self.types[i] != type:
+                continue
+            if discounted is not None and (self.discount_percents[i] > 0) != discounted:
+                continue
+            rows.append(i)
+        return rows
+
+    def total(self, column='prices', **filters):
+        """Sums a numeric column (prices by default) over the games matching filters (see select)"""
+        values = getattr(self, column)
+        if not filters:
+            return sum(values)
+        return sum(values[i] for i in self.select(**filters))
+
+    def rows(self):
+        """Yields each game as a tuple of (appid, name, type, currency, price, discounted_price, discount_percent)"""
+        for i in xrange(len(self.appids)):
+            yield (self.appids[i], self.names[i], self.types[i], self.currencies[i], self.prices[i],
+                   self.discounted_prices[i], self.discount_percents[i])
+
+
+PLATFORM_BITS = (('windows', 1), ('mac', 2), ('linux', 4))
+
+# One copy of each of the strings that repeat across lots of games (types, currencies, categories)
+_shared_strings = {}
+
+
+def _shared(value):
+    return _shared_strings.setdefault(value, value)
+
+
+def _platform_bits(platforms):
+    return sum(bit for name, bit in PLATFORM_BITS if platforms.get(name))
+
+
+def _name(data):
+    """Some appids don't have names"""
+    return data.get('name', "No Name")
+
+
+def _price(data):
+    """
+    Returns (currency, price, discounted_price, discount_percent).
+    If any of these don't exist all of them don't exist, so free games get (None, 0, 0, 0).
+
+    """
+    try:
+        overview = data['price_overview']
+        return (overview['currency'], _calc_price(overview['initial']),
+                _calc_price(overview['final']), overview['discount_percent'])
+    except KeyError:
+        return None, 0, 0, 0
+
+
+def _calc_price(amount):
+    """Prices from the API are represented by cents -- convert to dollars"""
+    return float(amount) / 100.0
+
+
+def _store_url(appid):
+    return "http://store.steampowered.com/app/{}".format(appid)
+
+
+def _header_image(appid):
+    return "http://cdn.steampowered.com/v/gfx/apps/{}/capsule_184x69.jpg".format(appid)
@@ -0,0 +1,104 @@
+"""
+Incremental JSON parsing for Steam's big payloads.
+
+GetAppList and the item schemas are huge, and all we want from them is one
+array (applist.apps, result.items). iter_array walks down to that array and
+yields its elements one at a time as the bytes come in, so we never hold more
+than a chunk of the response plus the element being parsed.
+
+    for app in iter_array(response, ['applist', 'apps']):
+        print app['appid']
+
+"""
+
+import json
+
+WHITESPACE = ' \t\n\r'
+
+_decoder = json.JSONDecoder()
+
+
+def iter_array(fp, path, chunk_size=64 * 1024):
+    """
+    Yields the elements of the array found by following the object keys in path,
+    reading from the file-like fp as needed. Values we pass by on the way are parsed
+    and thrown away. Raises KeyError if a key in path isn't there, and ValueError if
+    the document isn't valid JSON.
+
+    """
+    reader = _Reader(fp, chunk_size)
+    for key in path:
+        reader.expect('{')
+        while True:
+            if reader.peek() == '}':
+                raise KeyError(key)
+            name = reader.value()
+            reader.expect(':')
+            if name == key:
+                break
+            reader.value()
+            if reader.peek() == ',':
+                reader.expect(',')
+
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() == ',':
+            reader.expect(',')
+        else:
+            reader.expect(']')
+            return
+
+
+class _Reader(object):
+    """A buffer over a file-like object that hands back one JSON token or value at a time"""
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def peek(self):
+        """The next non-whitespace character, or '' at the end of the document"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected {!r} at byte {}, got {!r}'.format(char, self.pos, self.peek()))
+        self.pos += 1
+
+    def value(self):
+        """Parses the next complete JSON value, reading more input until it's all there"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the very end of the buffer might carry on in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _fill(self):
+        """Reads another chunk into the buffer, dropping what's been consumed. False at EOF."""
+        if self.eof:
+            return False
+        data = self.fp.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
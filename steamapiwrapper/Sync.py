@@ -0,0 +1,195 @@
+"""
+Incremental catalog sync.
+
+Re-downloading appdetails for every app each day is mostly wasted work, since few
+games change from one day to the next. CatalogSync keeps the last seen state of each
+game (per country code) in a sqlite file, and on each run:
+
+ - diffs the current app list against the last one to find new and removed apps
+ - fetches new apps (and any others never fetched for this country code), plus the known
+   apps that are due for a refresh -- discounted and recently changed games first, then
+   the ones we've gone longest without checking
+ - returns a ChangeSet of what actually changed, instead of the whole catalog
+
+Example:
+    sync = CatalogSync(Games(workers=4), CatalogStore('catalog.db'), 'US')
+    changes = sync.sync()
+    for appid, (old, new) in changes.changed.items():
+        print appid, old['price'], '->', new['price']
+
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+
+from SteamGames import PLATFORM_BITS
+
+# The Game fields we keep and compare
+STATE_FIELDS = ('name', 'type', 'website', 'currency', 'price', 'discounted_price', 'discount_percent',
+                'packages', 'categories', 'platforms')
+
+
+class CatalogStore(object):
+    """The app list, and the last seen state of each game, in a sqlite file"""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS apps (appid INTEGER PRIMARY KEY, name TEXT);
+            CREATE TABLE IF NOT EXISTS games (
+                appid INTEGER, cc TEXT, state TEXT, digest TEXT, discount_percent INTEGER,
+                fetched REAL, changed REAL, PRIMARY KEY (appid, cc));
+            CREATE INDEX IF NOT EXISTS games_due ON games (cc, fetched);
+        ''')
+        self.db.commit()
+
+    def app_list(self):
+        """Returns the app list from the last sync, as a dict of appid -> name"""
+        return dict(self.db.execute('SELECT appid, name FROM apps'))
+
+    def save_app_list(self, added, removed):
+        """Updates the saved app list, given dicts of appid -> name added and removed since the last sync"""
+        self.db.executemany('INSERT OR REPLACE INTO apps VALUES (?, ?)', added.items())
+        self.db.executemany('DELETE FROM apps WHERE appid = ?', ((x,) for x in removed))
+        self.db.executemany('DELETE FROM games WHERE appid = ?', ((x,) for x in removed))
+        self.db.commit()
+
+    def get_state(self, appid, cc):
+        """Returns (state dict or None, digest), or None if we've never fetched appid for cc"""
+        row = self.db.execute('SELECT state, digest FROM games WHERE appid = ? AND cc = ?', (appid, cc)).fetchone()
+        if row is None:
+            return None
+        return (json.loads(row[0]) if row[0] is not None else None), row[1]
+
+    def save_state(self, appid, cc, state, fetched, changed):
+        """Saves a game's state. state is None for appids Steam didn't return anything for."""
+        if state is None:
+            encoded, digest, discount = None, None, 0
+        else:
+            encoded = json.dumps(state, sort_keys=True)
+            digest, discount = hashlib.sha1(encoded).hexdigest(), state['discount_percent']
+        if changed is None:
+            row = self.db.execute('SELECT changed FROM games WHERE appid = ? AND cc = ?', (appid, cc)).fetchone()
+            changed = row[0] if row is not None else fetched
+        self.db.execute('INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (appid, cc, encoded, digest, discount, fetched, changed))
+
+    def due(self, cc, fetched_before, limit=None):
+        """
+        Appids last fetched before fetched_before, most important first: discounted games,
+        then the most recently changed, then the ones we've gone longest without checking.
+
+        """
+        query = ('SELECT appid FROM games WHERE cc = ? AND fetched < ? '
+                 'ORDER BY discount_percent > 0 DESC, changed DESC, fetched ASC')
+        params = (cc, fetched_before)
+        if limit is not None:
+            query += ' LIMIT ?'
+            params += (limit,)
+        return [row[0] for row in self.db.execute(query, params)]
+
+    def unfetched(self, cc):
+        """Appids in the app list we've never fetched for cc (new ones, or ones a crashed sync didn't get to)"""
+        query = 'SELECT appid FROM apps WHERE appid NOT IN (SELECT appid FROM games WHERE cc = ?) ORDER BY appid'
+        return [row[0] for row in self.db.execute(query, (cc,))]
+
+    def commit(self):
+        self.db.commit()
+
+
+class ChangeSet(object):
+    """
+    What a sync found:
+
+    added_apps / removed_apps -- dicts of appid -> name, from the app list diff
+    new -- dict of appid -> state, for games fetched for the first time
+    changed -- dict of appid -> (old state, new state)
+    unchanged -- number of refreshed games that hadn't changed
+    missing -- appids Steam returned nothing for
+
+    """
+
+    def __init__(self, added_apps, removed_apps):
+        self.added_apps = added_apps
+        self.removed_apps = removed_apps
+        self.new = {}
+        self.changed = {}
+        self.unchanged = 0
+        self.missing = []
+
+    def __repr__(self):
+        return '<ChangeSet +{} -{} apps, {} new, {} changed, {} unchanged, {} missing>'.format(
+            len(self.added_apps), len(self.removed_apps), len(self.new), len(self.changed),
+            self.unchanged, len(self.missing))
+
+
+class CatalogSync(object):
+    """Keeps a CatalogStore up to date for one country code, see the module docstring."""
+
+    def __init__(self, games, store, cc, max_age=24 * 60 * 60, max_refresh=None, clock=time.time):
+        """
+        args:
+        games -- the Games object to fetch with
+        store -- a CatalogStore
+        cc -- Country Code
+        max_age -- refresh known games once they're this many seconds old
+        max_refresh -- refresh at most this many known games per sync (new apps are always fetched)
+
+        """
+        self.games = games
+        self.store = store
+        self.cc = cc
+        self.max_age = max_age
+        self.max_refresh = max_refresh
+        self.clock = clock
+
+    def sync(self):
+        """Runs one sync, returning a ChangeSet"""
+        now = self.clock()
+        apps = dict(self.games.iter_apps())
+        previous = self.store.app_list()
+        added = dict((appid, name) for appid, name in apps.iteritems() if appid not in previous)
+        removed = dict((appid, name) for appid, name in previous.iteritems() if appid not in apps)
+        self.store.save_app_list(added, removed)
+
+        changes = ChangeSet(added, removed)
+        # Everything without a state for this cc yet, not just what was added: if an earlier
+        # sync died before fetching its new apps, they're in the app list but not fetched
+        to_fetch = self.store.unfetched(self.cc)
+        to_fetch += self.store.due(self.cc, now - self.max_age, self.max_refresh)
+        fetched = set()
+        for game in self.games.get_info_for(to_fetch, self.cc, compact=True):
+            appid = int(game.appid)
+            fetched.add(appid)
+            self._update(appid, game_state(game), now, changes)
+        for appid in to_fetch:
+            if appid not in fetched:
+                changes.missing.append(appid)
+                self.store.save_state(appid, self.cc, None, now, None)
+        self.store.commit()
+        return changes
+
+    def _update(self, appid, state, now, changes):
+        previous = self.store.get_state(appid, self.cc)
+        if previous is None or previous[0] is None:
+            changes.new[appid] = state
+            self.store.save_state(appid, self.cc, state, now, now)
+        elif previous[0] != state:
+            changes.changed[appid] = (previous[0], state)
+            self.store.save_state(appid, self.cc, state, now, now)
+        else:
+            changes.unchanged += 1
+            self.store.save_state(appid, self.cc, state, now, None)
+
+
+def game_state(game):
+    """The fields of a Game or CompactGame we keep track of, as a json-friendly dict"""
+    state = dict((field, getattr(game, field, None)) for field in STATE_FIELDS)
+    state['platforms'] = sorted(name for name, _ in PLATFORM_BITS if (game.platforms or {}).get(name))
+    state['packages'] = list(state['packages'] or [])
+    categories = state['categories'] or []
+    state['categories'] = [c['description'] if isinstance(c, dict) else c for c in categories]
+    # Round-trip so it compares equal to what comes back out of the store
+    return json.loads(json.dumps(state))
@@ -0,0 +1,371 @@
+"""
+Transports do the actual HTTP work for SteamAPI objects.
+
+By default every SteamAPI object shares one PooledTransport, which keeps
+connections to each Steam host alive between requests and asks for gzipped
+responses. Pass a different transport into any of the wrapper classes (or set
+SteamAPI.transport) to swap it out -- for example, to point everything at a local
+fake server in tests:
+
+    transport = PooledTransport(host_map={'api.steampowered.com': 'http://127.0.0.1:8000'})
+    items = GameItems(api_key, transport=transport)
+
+"""
+
+import httplib
+import socket
+import ssl
+import threading
+import time
+import urllib2
+import urlparse
+import zlib
+from StringIO import StringIO
+
+USER_AGENT = 'steamapiwrapper'
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class Headers(dict):
+    """Response headers, with case-insensitive lookups"""
+
+    def __init__(self, items=()):
+        dict.__init__(self, ((k.lower(), v) for k, v in items))
+
+    def __getitem__(self, key):
+        return dict.__getitem__(self, key.lower())
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key.lower())
+
+    def get(self, key, default=None):
+        return dict.get(self, key.lower(), default)
+
+    getheader = get
+
+
+class Response(object):
+    """
+    A fully read HTTP response. It looks enough like a urllib2 response
+    (read, getcode, info, geturl) that the rest of the code doesn't care which it gets.
+
+    timings is a dict of how long the request took: dns, connect (both None when a
+    pooled connection was reused) and ttfb, in seconds. Transports that can't tell
+    leave it as None.
+
+    """
+
+    def __init__(self, url, code, headers, body, timings=None):
+        self.url = url
+        self.code = code
+        self.headers = headers
+        self.body = body
+        self.timings = timings
+        self._fp = StringIO(body)
+
+    def read(self, size=-1):
+        return self._fp.read(size)
+
+    def getcode(self):
+        return self.code
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def close(self):
+        self._fp.close()
+
+
+class StreamingResponse(object):
+    """
+    A response whose body is read (and decompressed) from the socket as you go,
+    for payloads too big to hold in memory all at once. The connection goes back
+    to the pool once the body has been read to the end. bytes_read counts the
+    decoded body as it's read.
+
+    """
+
+    def __init__(self, url, code, headers, resp, release, timings=None):
+        self.url = url
+        self.code = code
+        self.headers = headers
+        self.timings = timings
+        self.bytes_read = 0
+        self._resp = resp
+        self._release = release
+        self._done = False
+        encoding = headers.get('content-encoding')
+        self._decoder = None
+        # What's been read of a deflate body, until it turns out whether it has a zlib header
+        self._deflate_start = None
+        if encoding == 'gzip':
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decoder = zlib.decompressobj()
+            self._deflate_start = ''
+
+    def read(self, size=-1):
+        if self._done:
+            return ''
+        while True:
+            raw = self._resp.read() if size < 0 else self._resp.read(size)
+            if not raw or size < 0:
+                data = self._decode(raw) + (self._decoder.flush() if self._decoder else '')
+                self.bytes_read += len(data)
+                self._finish(True)
+                return data
+            data = self._decode(raw)
+            # A chunk that only held a gzip header decodes to nothing, but we're not at the end yet
+            if data:
+                self.bytes_read += len(data)
+                return data
+
+    def getcode(self):
+        return self.code
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def close(self):
+        """Closing before the end of the body throws the connection away, since it can't be reused"""
+        if not self._done:
+            self._finish(False)
+
+    def _decode(self, raw):
+        if self._deflate_start is None:
+            return self._decoder.decompress(raw) if self._decoder else raw
+        self._deflate_start += raw
+        try:
+            data = self._decoder.decompress(raw)
+        except zlib.error:
+            # Some servers send raw deflate data without the zlib header, like in _decode below
+            self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = self._decoder.decompress(self._deflate_start)
+            self._deflate_start = None
+        if data:
+            self._deflate_start = None
+        return data
+
+    def _finish(self, complete):
+        self._done = True
+        self._release(complete)
+
+
+class Transport(object):
+    """Base class for transports. Subclasses only need to implement open()."""
+
+    def open(self, url, headers=None, stream=False):
+        """
+        Fetches url, returning a Response (including for 304 Not Modified). Failures
+        are raised as urllib2.HTTPError (for error status codes) or urllib2.URLError
+        (for everything else), the same as urllib2.urlopen.
+
+        If stream is True a transport may return a StreamingResponse instead, which
+        reads the body as it arrives. Transports that can't are free to ignore it.
+
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Releases any connections held by the transport"""
+        pass
+
+
+class UrllibTransport(Transport):
+    """Plain urllib2, with a new connection for every request"""
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+
+    def open(self, url, headers=None, stream=False):
+        request = urllib2.Request(url, headers=headers or {})
+        try:
+            resp = urllib2.urlopen(request, timeout=self.timeout)
+        except urllib2.HTTPError as e:
+            # urllib2 treats "Not Modified" as an error, but callers revalidating a cache want it back
+            if e.code != 304:
+                raise
+            return Response(url, 304, Headers(e.info().items()), '')
+        headers = Headers(resp.info().items())
+        body = _decode(resp.read(), headers.get('content-encoding'))
+        return Response(resp.geturl(), resp.getcode(), headers, body)
+
+
+class PooledTransport(Transport):
+    """
+    Keeps idle keep-alive connections around for each host and reuses them,
+    and transparently decodes gzip/deflate responses. Safe to share between threads.
+
+    """
+
+    def __init__(self, timeout=30, max_idle=8, max_redirects=5, host_map=None):
+        """
+        args:
+        timeout -- socket timeout in seconds
+        max_idle -- number of idle connections to keep per host
+        max_redirects -- number of redirects to follow before giving up
+        host_map -- optional dict of hostname -> base url (like 'http://127.0.0.1:8000')
+                    to send that host's requests somewhere else. The Host header is
+                    left alone, so a fake server can still tell the hosts apart.
+
+        """
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_redirects = max_redirects
+        self.host_map = host_map or {}
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def open(self, url, headers=None, stream=False):
+        for _ in xrange(self.max_redirects + 1):
+            code, resp_headers, body, timings = self._request(url, headers, stream)
+            if code in REDIRECT_CODES and 'location' in resp_headers:
+                url = urlparse.urljoin(url, resp_headers['location'])
+                continue
+            break
+        if code >= 400:
+            raise urllib2.HTTPError(url, code, httplib.responses.get(code, ''), resp_headers, StringIO(body))
+        if isinstance(body, StreamingResponse):
+            body.url = url
+            return body
+        return Response(url, code, resp_headers, body, timings)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _request(self, url, headers, stream=False):
+        """
+        Sends one GET, retrying once on a fresh connection if a reused one turned out to be dead.
+        With stream=True, successful responses come back as a StreamingResponse instead of the body.
+        Returns (status, headers, body, timings).
+
+        """
+        parts = urlparse.urlsplit(url)
+        key = self._connection_key(parts)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        send_headers = {
+            'Host': parts.netloc,
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+            'User-Agent': USER_AGENT,
+        }
+        send_headers.update(headers or {})
+
+        for attempt in (0, 1):
+            conn, reused = self._checkout(key)
+            timings = {'dns': None, 'connect': None, 'ttfb': None}
+            try:
+                if not reused:
+                    timings['dns'], timings['connect'] = self._connect(conn, key)
+                started = time.time()
+                conn.request('GET', path, headers=send_headers)
+                resp = conn.getresponse()
+                timings['ttfb'] = time.time() - started
+                resp_headers = Headers(resp.getheaders())
+                if stream and 200 <= resp.status < 300:
+                    release = self._releaser(key, conn, resp)
+                    body = StreamingResponse(url, resp.status, resp_headers, resp, release, timings)
+                    return resp.status, resp_headers, body, timings
+                body = resp.read()
+            except (httplib.HTTPException, socket.error) as e:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise urllib2.URLError(e)
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+            return resp.status, resp_headers, _decode(body, resp_headers.get('content-encoding')), timings
+
+    def _connect(self, conn, key):
+        """Connects a new connection, returning how long the DNS lookup and the connect took"""
+        scheme, host, port = key
+        started = time.time()
+        addresses = socket.getaddrinfo(host, port or conn.default_port, 0, socket.SOCK_STREAM)
+        resolved = time.time()
+        sock = _connect_any(addresses, self.timeout)
+        if scheme == 'https':
+            # The same as HTTPSConnection.connect, which would look the host up again:
+            # its context checks the certificate against the hostname
+            try:
+                sock = conn._context.wrap_socket(sock, server_hostname=host if ssl.HAS_SNI else None)
+            except Exception:
+                sock.close()
+                raise
+        conn.sock = sock
+        return resolved - started, time.time() - resolved
+
+    def _releaser(self, key, conn, resp):
+        """Returns a callback that hands conn back to the pool once a streamed body is finished with"""
+        def release(complete):
+            if complete and not resp.will_close:
+                self._checkin(key, conn)
+            else:
+                conn.close()
+        return release
+
+    def _connection_key(self, parts):
+        """(scheme, host, port) to actually connect to, after applying host_map"""
+        if parts.hostname in self.host_map:
+            parts = urlparse.urlsplit(self.host_map[parts.hostname])
+        return (parts.scheme, parts.hostname, parts.port)
+
+    def _checkout(self, key):
+        """Returns an idle connection for key if there is one, otherwise a new one"""
+        with self._lock:
+            conns = self._idle.get(key)
+            if conns:
+                return conns.pop(), True
+        scheme, host, port = key
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, port, timeout=self.timeout), False
+        return httplib.HTTPConnection(host, port, timeout=self.timeout), False
+
+    def _checkin(self, key, conn):
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.max_idle:
+                conns.append(conn)
+                return
+        conn.close()
+
+
+def _connect_any(addresses, timeout):
+    """A socket connected to the first of getaddrinfo's addresses that takes the connection, like socket.create_connection"""
+    error = socket.error('getaddrinfo returned no addresses')
+    for family, socktype, proto, _, address in addresses:
+        sock = None
+        try:
+            sock = socket.socket(family, socktype, proto)
+            sock.settimeout(timeout)
+            sock.connect(address)
+            return sock
+        except socket.error as e:
+            error = e
+            if sock is not None:
+                sock.close()
+    raise error
+
+
+def _decode(body, encoding):
+    """Undoes gzip or deflate content encoding"""
+    if encoding == 'gzip':
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # Some servers send raw deflate data without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
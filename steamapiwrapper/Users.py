@@ -6,7 +6,17 @@ Retrieves information about Steam users from the Steam API.
 import json
 import re
 from SteamBase import SteamAPI
-from bs4 import BeautifulSoup
+from Concurrency import imap
+from Backpacks import BACKPACK_URL, STATUS_MESSAGES, STATUS_OK, process_items
+from Scraping import RegexScraper
+from Inventory import InventoryReader
+from Libraries import OWNED_GAMES_URL
+
+SUMMARIES_URL = "http://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/?key={}&steamids={}"
+# GetPlayerSummaries takes at most this many comma separated steamids
+MAX_SUMMARIES = 100
+# The store link in a gift's actions has its appid
+GIFT_APPID = re.compile(r'([0-9]+)')
 
 
 class ProfileError(Exception):
@@ -32,40 +42,82 @@ class SteamUser(SteamAPI):
         my_user = SteamUser(steamid, api_key)
         my_user.avatar # returns a link to their avatar image
 
+        # Load lots of users with one request per 100 of them
+        users = SteamUser.bulk_load(steamids, api_key)
+
+    Wishlists and groups are scraped with SteamUser.scraper (see Scraping.py).
+
     """
 
-    def __init__(self, steam_id, api_key):
-        """Sets SteamID and API key, as well as retrieving this user's info"""
-        SteamAPI.__init__(self, steam_id, api_key)
-        self._get_user_info()
+    # Shared by every user. Set to Scraping.SoupScraper() to use BeautifulSoup instead.
+    scraper = RegexScraper()
+
+    def __init__(self, steam_id, api_key, transport=None, player=None):
+        """
+        Sets SteamID and API key, as well as retrieving this user's info.
+        If you already have their GetPlayerSummaries entry, pass it in as player
+        and no request is made (see bulk_load).
+
+        """
+        SteamAPI.__init__(self, steam_id, api_key, transport)
+        if player is None:
+            self._get_user_info()
+        else:
+            self.raw_json = {'response': {'players': [player]}}
+            self._set_user_info(player)
         self.games_dict = None
 
+    @classmethod
+    def bulk_load(cls, steam_ids, api_key, workers=1, transport=None):
+        """
+        Loads many users at once, 100 per GetPlayerSummaries request (the most Steam allows),
+        instead of one request per user. Returns a list of SteamUsers in the order of steam_ids.
+        Users Steam doesn't return anything for (bad SteamIDs) are left out.
+
+        args:
+        workers -- number of requests to keep in flight at once
+
+        """
+        steam_ids = [str(x) for x in steam_ids]
+        loader = SteamAPI("", api_key, transport)
+        chunks = [steam_ids[i:i + MAX_SUMMARIES] for i in xrange(0, len(steam_ids), MAX_SUMMARIES)]
+
+        def fetch(chunk):
+            url = SUMMARIES_URL.format(api_key, ','.join(chunk))
+            return loader._get_json(url)['response']['players']
+
+        players = {}
+        for page in imap(fetch, chunks, workers):
+            for player in page:
+                players[player['steamid']] = player
+        return [cls(x, api_key, transport, players[x]) for x in steam_ids if x in players]
 
     def _get_user_info(self):
         "Called during __init__ to retrieve basic user info"
 
-        url = "http://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/?key={}&steamids={}".format(self.api_key, self.steam_id)
+        url = SUMMARIES_URL.format(self.api_key, self.steam_id)
         json_data = self._get_json(url)
         self.raw_json = json_data
-        self.visible = False
         if len(json_data['response']['players']) == 0:
             raise ProfileError('Error loading profile')
         else:
-            if json_data['response']['players'][0]['communityvisibilitystate'] == 3:
-                self.visible = True
-            self.timecreated = None
-            if self.visible:
-                self.timecreated = self._date(json_data['response']['players'][0]['timecreated'])
-            self.username = json_data['response']['players'][0]['personaname']
-            self.profileurl = json_data["response"]["players"][0]["profileurl"]
-            self.avatar = json_data['response']['players'][0]['avatarfull']            
+            self._set_user_info(json_data['response']['players'][0])
+
+    def _set_user_info(self, player):
+        """Sets the user's info from their entry in a GetPlayerSummaries response"""
+        self.visible = player['communityvisibilitystate'] == 3
+        self.timecreated = None
+        if self.visible:
+            self.timecreated = self._date(player['timecreated'])
+        self.username = player['personaname']
+        self.profileurl = player["profileurl"]
+        self.avatar = player['avatarfull']
 
 
     def get_games(self):
         """Returns a list of dictionaries containing information about the games a user owns."""
         if self.visible:
-            url =  'http://api.steampowered.com/IPlayerService/GetOwnedGames/v0001/?key={}&steamid={}&format=json&include_played_free_games=1&include_appinfo=1'.format(
-                self.api_key, self.steam_id)
+            url = OWNED_GAMES_URL.format(self.api_key, self.steam_id, 1)
             json_data = self._get_json(url)
             self.games_dict = json_data['response']['games']
             return self.games_dict
@@ -73,18 +125,20 @@ class SteamUser(SteamAPI):
             raise ProfileError('Private profile. Cannot retrieve games.')
         
         
-    def get_items(self, game, raw_json=False):
+    def get_items(self, game, raw_json=False, compact=False):
         """
-        Return a dictionary of the user's TF2 or Dota2 items.
+        Return a Backpack of the user's TF2 or Dota2 items: a dict keyed by item id.
+        Use backpack.by_defindex() to group them by item type.
     
         args:
             game -- either 'dota2' or 'tf2'
             raw_json -- pass in True if you want the full json object from Steam, and not the dict constructed
                          here
+            compact -- pass in True for a CompactBackpack, which stores the items in arrays
+                       and uses much less memory
 
-        Returns the following: status, num_backpack_slots, id, original_id, defindex,
-        level, quantity, original_id, tradable, craftable, quality, custom_name,
-        custom_description, style
+        Each item has the following: item_id, original_id, defindex, level, quantity,
+        tradable, craftable, quality, custom_name, custom_desc, style
 
         See here for more info on these variables:
         http://wiki.teamfortress.com/wiki/WebAPI/GetPlayerItems
@@ -100,43 +154,26 @@ class SteamUser(SteamAPI):
         else:
             raise BadGameException("Invalid game. Please call with 'Dota2' or 'TF2'")
 
-        url = "http://api.steampowered.com/IEconItems_{}/GetPlayerItems/v0001/?key={}&SteamID={}".format(game_id, self.api_key, self.steam_id)
+        url = BACKPACK_URL.format(game_id, self.api_key, self.steam_id)
         json_data = self._get_json(url)
 
         status = json_data["result"]["status"]    # Status codes are 1, 8, 15, 18
 
-        if status == 8 or status == 18:
-            raise BackpackError("Invalid SteamID")
-        elif status == 15:
-            raise BackpackError("Backpack is private")
-
-        all_items ={}
-        for item in json_data["result"]["items"]:
-            values = {}
-            values["item_id"] = item.get("id")
-            values["original_id"] = item.get("original_id")
-            values["level"] = item.get("level")
-            values["quality"] = item.get("quality")
-            values["quantity"] = item.get("quantity")
-            values["custom_name"] = item.get("custom_name")
-            values["custom_desc"] = item.get("custom_desc")
-            values["style"] = item.get("style")
-            defindex = item.get("defindex")
-            # Optional Elements
-            if item.get("flag_cannot_trade") is None:  
-                values["tradable"] = True
-            else:
-                values["tradable"] = False
-            if item.get("flag_cannot_craft") is None:
-                values["craftable"] = True
-            else:
-                values["craftable"] = False
-            all_items[defindex] = values
+        if status != STATUS_OK:
+            raise BackpackError(STATUS_MESSAGES.get(status, "Unknown status"))
 
         if raw_json:
             return json_data['result']['items']
 
-        return all_items
+        return process_items(json_data["result"]["items"], compact)
+
+    def get_games_async(self):
+        """get_games, run on self.executor. Returns a Concurrency.Future of the list."""
+        return self.executor.submit(self.get_games)
+
+    def get_items_async(self, game, raw_json=False, compact=False):
+        """get_items, run on self.executor. Returns a Concurrency.Future of the backpack."""
+        return self.executor.submit(self.get_items, game, raw_json, compact)
 
     @staticmethod
     def get_steam_id(fed_identity):
@@ -154,45 +191,47 @@ class SteamUser(SteamAPI):
 
     def get_gifts(self):
         """Scrape for all of user's current gifts (no API call for this currently) - returns their appid"""
-        url = "http://steamcommunity.com/profiles/{}/inventory/json/753/1/".format(self.steam_id)
-        json_data = self._get_json(url)
-        gifts_list = []
-        if 'rgDescriptions' in json_data:
-            for item in json_data['rgDescriptions']:
-                link = json_data['rgDescriptions'][item]['actions'][0]['link']
-                search = re.search(r'([0-9]+)', link)
+        return list(self.iter_gifts())
+
+    def iter_gifts(self):
+        """
+        Yields the appid of each of the user's gifts, a page of their inventory at a time
+        (the next page is fetched while this one is being read).
+
+        """
+        reader = InventoryReader(self.steam_id, 753, 1, transport=self.transport)
+        for description in reader.descriptions():
+            actions = description.get('actions')
+            if actions:
+                search = GIFT_APPID.search(actions[0]['link'])
                 if search:
-                    gifts_list.append(int(search.group(1)))
-            return gifts_list
-        else:
-            return []
+                    yield int(search.group(1))
 
     def get_wishlist(self):
         """Retrieves all appids for games on a user's wishlist (scrapes it, no API call available)."""
         url = "http://steamcommunity.com/profiles/{}/wishlist".format(self.steam_id)
-        soup = BeautifulSoup(self._open_url(url))
-        wish_games = soup.findAll("div", "wishlistRow")
-        all_games = []
-
-        for game in wish_games:
-            current_id = game['id']
-            if current_id:
-                search = re.search(r'([0-9]+)', current_id)
-                if search:
-                    all_games.append(int(search.group(1)))
+        page = self._open_page(url)
+        try:
+            return self.scraper.wishlist_ids(page)
+        finally:
+            page.close()
 
-        return all_games
+    def get_wishlist_async(self):
+        """get_wishlist, run on self.executor. Returns a Concurrency.Future of the appids."""
+        return self.executor.submit(self.get_wishlist)
 
     def get_groups(self):
         """Scrape for a user's groups. No API call available."""
         url = "http://steamcommunity.com/profiles/{}/groups/".format(self.steam_id)
-        soup = BeautifulSoup(self._open_url(url))
-        groups = soup.findAll('div', 'groupBlockMedium')
-        all_groups = []
-        for group in groups:
-            group = group.find('a')
-            if group:
-                group_url = group['href']
-                if group_url:                    
-                    all_groups.append(group_url)
-        return all_groups
+        page = self._open_page(url)
+        try:
+            return self.scraper.group_urls(page)
+        finally:
+            page.close()
+
+    def _open_page(self, url):
+        """Opens a page to scrape, streaming it in so the scraper can work as it arrives"""
+        page = self._open_url(url, stream=True)
+        if page is None:
+            raise ProfileError("Couldn't load {}".format(url))
+        return page
@@ -1,9 +1,35 @@
 from steamapiwrapper.GameItems import GameItems
-from steamapiwrapper.Users import SteamUser
-from steamapiwrapper.SteamGames import Games 
+from steamapiwrapper.Users import BackpackError, SteamUser
+from steamapiwrapper.SteamGames import Games, Game, CompactGame, GameTable
 from steamapiwrapper import SteamBase
+from steamapiwrapper.Concurrency import END, AsyncIterator, Executor, Future, SingleFlight, TimeoutError, imap
+from steamapiwrapper.Transport import Headers, PooledTransport, Response, StreamingResponse, Transport
+from steamapiwrapper.RateLimit import RateLimiter, TokenBucket
+from steamapiwrapper.Cache import ResponseCache, SqliteStore, cache_key
+from steamapiwrapper.Streaming import iter_array
+from steamapiwrapper.Sync import CatalogStore, CatalogSync
+from steamapiwrapper.Backpacks import BackpackScanner, process_items
+from steamapiwrapper.Scraping import RegexScraper, SoupScraper
+from steamapiwrapper.Export import BACKPACK_SCHEMA, GAME_SCHEMA, backpack_rows, batches, export, game_rows
+from steamapiwrapper.Crawl import CatalogCrawl, CheckpointError, CrawlCheckpoint
+from steamapiwrapper.Batching import AdaptiveChunker, Blocklist
+from steamapiwrapper.Metrics import Instrument, MetricsCollector, StatsdExporter, endpoint
+from steamapiwrapper.AppIndex import AppIndex
+from steamapiwrapper.Libraries import LibraryLoader, OwnedGames
 import unittest
+import csv
+import gzip
 import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib2
+import urlparse
+import zlib
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from StringIO import StringIO
 from mock import Mock, patch
 
 class MockUrllib2Resp:
@@ -13,9 +39,279 @@ class MockUrllib2Resp:
     def read(self):
         return self.response
 
+    def getcode(self):
+        return 200
+
+    def info(self):
+        return {}
+
+class LocalHandler(BaseHTTPRequestHandler):
+    """Serves the request path back as JSON, gzipped, over keep-alive connections"""
+    protocol_version = 'HTTP/1.1'
+    clients = set()
+    requests = 0
+
+    def do_GET(self):
+        LocalHandler.clients.add(self.client_address)
+        LocalHandler.requests += 1
+        if self.path.startswith('/missing'):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        out = StringIO()
+        with gzip.GzipFile(fileobj=out, mode='wb') as f:
+            f.write(json.dumps({'path': self.path, 'host': self.headers.get('Host'), 'items': [1, 2, 3]}))
+        body = out.getvalue()
+        self.send_response(200)
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class LocalServer(object):
+    def __init__(self, handler=LocalHandler):
+        self.server = HTTPServer(('127.0.0.1', 0), handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class FakeTransport(Transport):
+    """Answers every request from a dict of url -> body"""
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def open(self, url, headers=None, stream=False):
+        self.requests.append(url)
+        return Response(url, 200, {}, self.pages[url])
+
+class SlowTransport(FakeTransport):
+    """A FakeTransport that takes a while to answer, so concurrent requests overlap"""
+    def open(self, url, headers=None, stream=False):
+        time.sleep(0.2)
+        return FakeTransport.open(self, url, headers, stream)
+
+class TransportTests(unittest.TestCase):
+    def setUp(self):
+        LocalHandler.clients = set()
+        self.server = LocalServer()
+        self.transport = PooledTransport(host_map={'api.steampowered.com': self.server.url})
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def test_keep_alive_and_gzip(self):
+        for i in range(3):
+            resp = self.transport.open('http://api.steampowered.com/thing/%d' % i)
+            data = json.load(resp)
+            self.assertEqual(data['path'], '/thing/%d' % i)
+            self.assertEqual(data['host'], 'api.steampowered.com')
+        self.assertEqual(len(LocalHandler.clients), 1)
+
+    def test_timings(self):
+        first = self.transport.open('http://api.steampowered.com/a')
+        second = self.transport.open('http://api.steampowered.com/b')
+        self.assertTrue(first.timings['dns'] is not None and first.timings['connect'] is not None)
+        self.assertEqual((second.timings['dns'], second.timings['connect']), (None, None))
+        self.assertTrue(second.timings['ttfb'] > 0)
+
+    def test_http_error(self):
+        self.assertRaises(urllib2.HTTPError, self.transport.open, 'http://api.steampowered.com/missing')
+
+    def test_tries_every_address(self):
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        dead_port = closed.getsockname()[1]
+        closed.close()
+        port = self.server.server.server_port
+        addresses = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', dead_port)),
+                     (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', port))]
+        with patch('socket.getaddrinfo', return_value=addresses) as getaddrinfo:
+            resp = self.transport.open('http://api.steampowered.com/a')
+        self.assertEqual(json.load(resp)['path'], '/a')
+        self.assertEqual(getaddrinfo.call_count, 1)
+
+    def test_injected_transport(self):
+        SteamBase.SteamAPI.cache.clear()
+        url = 'http://api.steampowered.com/ISteamApps/GetAppList/v2'
+        fake = FakeTransport({url: '{"applist": {"apps": [{"appid": 10, "name": "CS"}]}}'})
+        games = Games(transport=fake)
+        self.assertEqual(games.get_name(10), 'CS')
+        self.assertEqual(fake.requests, [url])
+        self.assertTrue(Games().transport is SteamBase.SteamAPI.transport)
+
+class CacheTests(unittest.TestCase):
+    def setUp(self):
+        self.now = [0]
+        self.url = 'http://api.steampowered.com/IEconItems_440/GetSchema/v0001/?key=secret'
+        self.api = SteamBase.SteamAPI('', 'secret')
+        self.api.cache = ResponseCache(clock=lambda: self.now[0])
+        self.api.transport = Mock()
+        self.api.transport.open.side_effect = lambda url, headers, stream: Response(url, 200, Headers([('ETag', '"v1"')]), '{"a": 1}')
+
+    def test_fresh_hit(self):
+        self.api._get_json(self.url)
+        self.assertEqual(self.api._get_json(self.url), {'a': 1})
+        self.assertEqual(self.api.transport.open.call_count, 1)
+        self.assertEqual((self.api.cache.hits, self.api.cache.misses), (1, 1))
+
+    def test_revalidate_not_modified(self):
+        self.api._get_json(self.url)
+        self.now[0] = 7 * 60 * 60
+        self.api.transport.open.side_effect = None
+        self.api.transport.open.return_value = Response(self.url, 304, Headers(), '')
+        self.assertEqual(self.api._get_json(self.url), {'a': 1})
+        self.api.transport.open.assert_called_with(self.url, {'If-None-Match': '"v1"'}, False)
+        self.assertTrue(self.api.cache.is_fresh(self.url, self.api.cache.get(self.url)))
+
+    def test_bypass(self):
+        self.api._get_json(self.url)
+        self.api._get_json(self.url, cache=False)
+        self.assertEqual(self.api.transport.open.call_count, 2)
+
+    def test_size_eviction(self):
+        cache = ResponseCache(ttls={'a.com': 60}, max_bytes=10)
+        cache.put('http://a.com/1', 'x' * 6, {})
+        cache.put('http://a.com/2', 'y' * 6, {})
+        self.assertEqual(cache.get('http://a.com/1'), None)
+        self.assertEqual(cache.get('http://a.com/2').body, 'y' * 6)
+
+    def test_sqlite_store_strips_key(self):
+        store = SqliteStore(':memory:')
+        cache = ResponseCache(store=store)
+        cache.put(self.url, '{}', Headers([('Last-Modified', 'yesterday')]))
+        self.assertTrue('secret' not in cache_key(self.url))
+        entry = ResponseCache(store=store).get(self.url)
+        self.assertEqual((entry.body, entry.last_modified), ('{}', 'yesterday'))
+
+class StreamingTests(unittest.TestCase):
+    def test_iter_array_small_chunks(self):
+        doc = {'result': {'status': 1, 'qualities': {'a': [1, 2]}, 'items': [
+            {'name': u'Caf\xe9', 'defindex': 12345}, 678, [1, {'x': None}], 'done'], 'after': True}}
+        for chunk_size in (1, 3, 7, 1000):
+            items = list(iter_array(StringIO(json.dumps(doc)), ['result', 'items'], chunk_size))
+            self.assertEqual(items, doc['result']['items'])
+
+    def test_streamed_deflate(self):
+        body = json.dumps({'items': range(500)})
+        raw = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        bodies = [zlib.compress(body), raw.compress(body) + raw.flush()]
+        for encoded in bodies:
+            for size in (1, 7, -1):
+                resp = StreamingResponse('http://a.com/', 200, Headers([('Content-Encoding', 'deflate')]),
+                                         StringIO(encoded), lambda complete: None)
+                read = []
+                while True:
+                    data = resp.read(size)
+                    read.append(data)
+                    if not data or size < 0:
+                        break
+                self.assertEqual(''.join(read), body)
+
+    def test_iter_array_missing_key(self):
+        self.assertRaises(KeyError, list, iter_array(StringIO('{"result": {"status": 2}}'), ['result', 'items']))
+
+    def test_stream_over_transport_is_cached(self):
+        LocalHandler.requests = 0
+        server = LocalServer()
+        transport = PooledTransport(host_map={'api.steampowered.com': server.url})
+        try:
+            api = SteamBase.SteamAPI('', 'key', transport)
+            api.cache = ResponseCache(ttls={'api.steampowered.com/stream': 60})
+            url = 'http://api.steampowered.com/stream/it'
+            self.assertEqual(list(api._stream_json(url, ['items'])), [1, 2, 3])
+            self.assertEqual(list(api._stream_json(url, ['items'])), [1, 2, 3])
+            self.assertEqual(LocalHandler.requests, 1)
+            self.assertEqual(json.loads(api.cache.get(url).body)['path'], '/stream/it')
+        finally:
+            transport.close()
+            server.stop()
+
 class GameItemsTests(unittest.TestCase):
     def setUp(self):
-        pass
+        SteamBase.SteamAPI.cache.clear()
+        self.url = 'http://api.steampowered.com/IEconItems_440/GetSchema/v0001/?key=key'
+        schema = {'result': {'status': 1, 'items': [
+            {'name': 'Bat', 'defindex': 0, 'item_class': 'tf_weapon_bat', 'used_by_classes': ['Scout']},
+            {'name': 'Bottle', 'defindex': 1, 'item_class': 'tf_weapon_bottle'}]}}
+        self.items = GameItems('key', FakeTransport({self.url: json.dumps(schema)}))
+
+    def test_get_all(self):
+        tf2 = self.items.get_all('tf2')
+        self.assertEqual(sorted(tf2), ['Bat', 'Bottle'])
+        self.assertEqual(tf2['Bat']['used_by_classes'], ['Scout'])
+
+    def test_get_all_raw(self):
+        self.assertEqual(len(self.items.get_all('tf2', raw_json=True)), 2)
+
+    def test_get_all_concurrent(self):
+        calls = []
+        def load(game, raw_json=False):
+            calls.append(game)
+            time.sleep(0.2)
+            return {'Bat': {}}
+        self.items._get_items = load
+        other = GameItems('key', self.items.transport)
+        other._get_items = load
+        results = []
+        threads = [threading.Thread(target=lambda items=items: results.append(items.get_all('tf2')))
+                   for items in [self.items] * 3 + [other] * 3]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(calls, ['440'])
+        self.assertEqual(len(results), 6)
+
+    def test_concurrent_schema_and_app_list(self):
+        transport = SlowTransport(self.items.transport.pages)
+        app_list = 'http://api.steampowered.com/ISteamApps/GetAppList/v2'
+        transport.pages[app_list] = '{"applist": {"apps": [{"appid": 10, "name": "CS"}]}}'
+        items, games = [GameItems('key', transport) for _ in range(2)], [Games(transport=transport) for _ in range(2)]
+        results = []
+        calls = [lambda x=x: results.append(x.get_schema('tf2')) for x in items * 2]
+        calls += [lambda x=x: results.append(x.get_name(10)) for x in games * 2]
+        threads = [threading.Thread(target=call) for call in calls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(sorted(transport.requests), sorted([app_list, self.url]))
+        self.assertEqual(results.count('CS'), 4)
+        self.assertTrue(items[0].get_schema('tf2') is items[1].get_schema('tf2'))
+
+    def test_schema_indexes(self):
+        schema = self.items.get_schema('TF2')
+        self.assertEqual(schema.get(1)['name'], 'Bottle')
+        self.assertEqual(schema.named('Bat')['defindex'], 0)
+        self.assertEqual([x['name'] for x in schema.find(used_by_classes='Scout')], ['Bat'])
+        self.assertEqual([x['name'] for x in schema.find(used_by_classes=None)], ['Bottle'])
+        self.assertEqual(schema.find(item_class='tf_weapon_bat', used_by_classes='Soldier'), [])
+        self.assertTrue(self.items.get_schema('tf2') is schema)
+
+    def test_schema_resolve(self):
+        schema = self.items.get_schema('tf2')
+        resolved = schema.resolve([{'id': 10, 'defindex': 1}, {'id': 11, 'defindex': 99}])
+        self.assertEqual(resolved[0]['schema']['name'], 'Bottle')
+        self.assertEqual(resolved[1]['schema'], None)
+
+class CountingFlight(SingleFlight):
+    """A SingleFlight that counts callers, so tests can wait for them all to arrive"""
+    callers = 0
+
+    def do(self, key, func):
+        self.callers += 1
+        return SingleFlight.do(self, key, func)
 
 class SteamBaseTests(unittest.TestCase):
     def setUp(self):
@@ -40,19 +336,788 @@ class SteamBaseTests(unittest.TestCase):
     def test_open_url(self):
         pass
 
-    def test_retry(self):
-        pass
+    def test_get_json_shares_in_flight_requests(self):
+        started, release = threading.Event(), threading.Event()
+        def respond(url, headers, stream):
+            started.set()
+            release.wait(5)
+            return Response(url, 200, {}, '{"players": []}')
+        self.api.transport = Mock()
+        self.api.transport.open.side_effect = respond
+        self.api.instruments = [Recorder()]
+        self.api.single_flight = CountingFlight()
+        results = []
+        fetch = lambda: results.append(self.api._get_json(self.url, cache=False))
+        threads = [threading.Thread(target=fetch) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while self.api.single_flight.callers < 4:
+            release.wait(0.01)
+        release.wait(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(self.api.transport.open.call_count, 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(sorted(info.cache for info in self.api.instruments[0].after), [None, 'shared', 'shared', 'shared'])
+        self.api._get_json(self.url, cache=False)
+        self.assertEqual(self.api.transport.open.call_count, 2)
+
+    def test_retry_honors_retry_after(self):
+        url = 'http://api.steampowered.com/ISteamApps/GetAppList/v2'
+        error = urllib2.HTTPError(url, 429, 'Too Many Requests', Headers([('Retry-After', '7')]), None)
+        transport = Mock()
+        transport.open.side_effect = [error, Response(url, 200, {}, '{}')]
+        slept = []
+        self.api.transport = transport
+        self.api.rate_limiter = RateLimiter(sleep=slept.append)
+        self.assertEqual(self.api._open_url(url).read(), '{}')
+        self.assertEqual(transport.open.call_count, 2)
+        self.assertTrue(7 - 0.5 < slept[-1] <= 7)
+        self.assertEqual(self.api.rate_limiter.stats()['api.steampowered.com']['throttled'], 1)
+
+    def test_retry_gives_up(self):
+        transport = Mock()
+        transport.open.side_effect = urllib2.URLError('down')
+        self.api.transport = transport
+        self.api.rate_limiter = RateLimiter(sleep=lambda seconds: None)
+        self.assertRaises(SteamBase.SteamError, self.api._open_url, self.url)
+        self.assertEqual(transport.open.call_count, self.api.retries + 1)
+
+    def test_token_bucket(self):
+        now = [0.0]
+        bucket = TokenBucket(2, 2, clock=lambda: now[0])
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0, 0, 0.5, 1.0])
+        now[0] = 10
+        self.assertEqual(bucket.reserve(), 0)
+        bucket.pause(3)
+        self.assertEqual(bucket.reserve(), 3)
 
     def test_date(sel):
         date = '2014-07-26 20:20:20'
 
+class Recorder(Instrument):
+    def __init__(self):
+        self.before, self.after = [], []
+
+    def before_request(self, info):
+        self.before.append(info)
+
+    def after_request(self, info):
+        self.after.append(info)
+
+class MetricsTests(unittest.TestCase):
+    def setUp(self):
+        self.url = 'http://api.steampowered.com/ISteamApps/GetAppList/v2'
+        self.api = SteamBase.SteamAPI('', 'key')
+        self.api.cache = ResponseCache(ttls={'api.steampowered.com/ISteamApps': 60})
+        self.api.rate_limiter = RateLimiter(limits={}, sleep=lambda seconds: None)
+        self.api.transport = Mock()
+        self.recorder, self.metrics = Recorder(), MetricsCollector()
+        self.api.instruments = [self.recorder, self.metrics]
+
+    def test_retry_recorded(self):
+        error = urllib2.HTTPError(self.url, 500, 'Server Error', Headers(), None)
+        timings = {'dns': 0.01, 'connect': 0.02, 'ttfb': 0.03}
+        self.api.transport.open.side_effect = [error, Response(self.url, 200, Headers(), '{"a": 1}', timings)]
+        self.assertEqual(self.api._get_json(self.url), {'a': 1})
+        info = self.recorder.after[0]
+        self.assertTrue(self.recorder.before[0] is info)
+        self.assertEqual((info.endpoint, info.status, info.retries, info.error), (
+            'api.steampowered.com/ISteamApps/GetAppList/v2', 200, 1, None))
+        self.assertEqual((info.bytes, info.ttfb, info.cache), (8, 0.03, 'miss'))
+        self.assertTrue(info.backoff >= 0 and info.parse >= 0 and info.total >= info.parse)
+
+    def test_cache_hits_and_errors(self):
+        self.api.transport.open.return_value = Response(self.url, 200, Headers(), '{}')
+        self.api._get_json(self.url)
+        self.api._get_json(self.url)
+        self.api.transport.open.side_effect = urllib2.HTTPError(self.url, 404, 'Not Found', Headers(), None)
+        self.assertRaises(SteamBase.SteamError, self.api._get_json, self.url + '?x=1', cache=False)
+        summary = self.metrics.summary()['api.steampowered.com/ISteamApps/GetAppList/v2']
+        self.assertEqual((summary['requests'], summary['errors'], summary['cache']), (3, 1, {'miss': 1, 'hit': 1}))
+        self.assertFalse(self.recorder.after[1].sent)
+        text = self.metrics.prometheus()
+        self.assertTrue('steamapi_request_duration_seconds_count{endpoint="api.steampowered.com/ISteamApps/GetAppList/v2"} 2' in text)
+        self.assertTrue('steamapi_cache_results_total{endpoint="api.steampowered.com/ISteamApps/GetAppList/v2",result="hit"} 1' in text)
+
+    def test_broken_instrument_and_statsd(self):
+        broken = Mock()
+        broken.before_request.side_effect = ValueError('oops')
+        statsd = StatsdExporter(prefix='test')
+        statsd._socket = Mock()
+        self.api.instruments = [broken, statsd]
+        self.api.transport.open.return_value = Response(self.url, 200, Headers(), '{}')
+        self.assertEqual(self.api._get_json(self.url), {})
+        packet = statsd._socket.sendto.call_args[0][0].split('\n')
+        self.assertEqual(packet[:2], ['test.api_steampowered_com_ISteamApps_GetAppList_v2.requests:1|c',
+                                      'test.api_steampowered_com_ISteamApps_GetAppList_v2.cache.miss:1|c'])
+        self.assertEqual(endpoint('http://steamcommunity.com/profiles/7656/wishlist?x=1'),
+                         'steamcommunity.com/profiles/{id}/wishlist')
+
+class ConcurrencyTests(unittest.TestCase):
+    def test_imap_ordered(self):
+        results = list(imap(lambda x: x * 2, xrange(50), 4))
+        self.assertEqual(results, [x * 2 for x in xrange(50)])
+
+    def test_imap_unordered(self):
+        results = list(imap(lambda x: x * 2, xrange(50), 4, ordered=False))
+        self.assertEqual(sorted(results), [x * 2 for x in xrange(50)])
+
+    def test_imap_raises(self):
+        def fail(x):
+            raise ValueError(x)
+        self.assertRaises(ValueError, list, imap(fail, xrange(5), 2))
+
+    def test_executor_futures(self):
+        executor = Executor(2)
+        futures = [executor.submit(lambda x: x * 2, x) for x in xrange(10)]
+        self.assertEqual([f.result(5) for f in futures], [x * 2 for x in xrange(10)])
+        self.assertTrue(len(executor._threads) <= 2)
+        failed = executor.submit(int, 'x')
+        self.assertRaises(ValueError, failed.result, 5)
+        self.assertTrue(isinstance(failed.exception(), ValueError))
+        called = []
+        failed.add_done_callback(called.append)
+        self.assertEqual(called, [failed])
+        self.assertRaises(TimeoutError, Future().result, 0.01)
+        executor.shutdown()
+
+    def test_async_iterator(self):
+        items = AsyncIterator(iter([1, 2]), Executor(2))
+        futures = [items.next() for _ in xrange(3)]
+        self.assertEqual([f.result(5) for f in futures], [1, 2, END])
+        self.assertEqual(list(AsyncIterator(xrange(5), Executor(2))), range(5))
+
+    def test_async_iterator_prefetch(self):
+        def slow():
+            for i in xrange(5):
+                time.sleep(0.1)
+                yield i
+        executor = Executor(2)
+        items = AsyncIterator(slow(), executor)
+        futures = [items.next() for _ in xrange(6)]
+        # The prefetched steps wait on each other, not on executor threads, so the other thread stays free
+        self.assertEqual(AsyncIterator([1], executor).next().result(0.15), 1)
+        self.assertEqual([f.result(5) for f in futures], range(5) + [END])
+        executor.shutdown()
+
+    def test_single_flight(self):
+        flight = SingleFlight()
+        release, calls, results = threading.Event(), [], []
+        def slow():
+            calls.append(1)
+            release.wait(5)
+            return object()
+        threads = [threading.Thread(target=lambda: results.append(flight.do('k', slow))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while not calls:
+            release.wait(0.01)
+        release.wait(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(set(id(result) for result, _ in results)), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True, True])
+        self.assertEqual(flight.in_flight(), 0)
+        self.assertRaises(ValueError, flight.do, 'k', lambda: int('x'))
+        self.assertEqual(flight.do('k', lambda: 2), (2, False))
+
+def appdetails_page(appids):
+    page = {}
+    for appid in appids:
+        page[str(appid)] = {'success': True, 'data': {
+            'type': 'game', 'name': 'Game %s' % appid, 'detailed_description': '',
+            'website': None, 'platforms': {'windows': True, 'mac': False, 'linux': False},
+            'price_overview': {'currency': 'USD', 'initial': 999, 'final': 499, 'discount_percent': 50}}}
+    return json.dumps(page)
+
 class GamesTests(unittest.TestCase):
     def setUp(self):
-        pass
+        SteamBase.SteamAPI.cache.clear()
+        self.games = Games(num=2, workers=3)
+
+    @patch.object(SteamBase.SteamAPI, '_open_url')
+    def test_get_info_for_concurrent(self, mock_open):
+        def respond(url, headers=None):
+            appids = urlparse.parse_qs(urlparse.urlparse(url).query)['appids'][0].split(',')
+            return MockUrllib2Resp(appdetails_page(appids))
+        mock_open.side_effect = respond
+        games = list(self.games.get_info_for(range(1, 10), 'US'))
+        self.assertEqual(sorted(int(g.appid) for g in games), range(1, 10))
+        self.assertEqual(mock_open.call_count, 5)
+        self.assertEqual(games[0].discounted_price, 4.99)
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_compact_game(self, mock_get_json):
+        page = json.loads(appdetails_page([5]))
+        game = CompactGame(page['5'], 5, self.games)
+        self.assertFalse(hasattr(game, '__dict__'))
+        self.assertEqual((game.name, game.price, game.discount_percent), ('Game 5', 9.99, 50))
+        self.assertEqual(game.platforms, {'windows': True, 'mac': False, 'linux': False})
+        self.assertEqual(mock_get_json.call_count, 0)
+        mock_get_json.return_value = page
+        self.assertEqual(game.description, '')
+        self.assertEqual(mock_get_json.call_count, 1)
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_compact_game_refetch_uses_cc(self, mock_get_json):
+        page = json.loads(appdetails_page([5]))
+        mock_get_json.return_value = page
+        game = list(self.games.get_info_for([5], 'GB', compact=True))[0]
+        self.assertEqual(game.cc, 'GB')
+        game.raw_json
+        self.assertEqual(urlparse.parse_qs(urlparse.urlparse(mock_get_json.call_args[0][0]).query)['cc'], ['GB'])
+        gone = CompactGame(page['5'], 5, self.games, cc='DE')
+        mock_get_json.return_value = {'5': {'success': False}}
+        self.assertRaises(SteamBase.SteamError, lambda: gone.raw_json)
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_get_prices(self, mock_get_json):
+        def respond(url):
+            query = urlparse.parse_qs(urlparse.urlparse(url).query)
+            appids = query['appids'][0].split(',')
+            if 'filters' not in query:
+                return json.loads(appdetails_page(appids))
+            self.assertEqual(query['filters'], ['price_overview'])
+            price = {'currency': 'GBP', 'initial': 799, 'final': 799, 'discount_percent': 0}
+            return dict((x, {'success': True, 'data': {'price_overview': price} if x != '2' else []})
+                        for x in appids)
+        mock_get_json.side_effect = respond
+        results = list(self.games.get_prices(['US', 'GB', 'DE'], range(1, 6)))
+        self.assertEqual(mock_get_json.call_count, 9)
+        self.assertEqual(sorted(int(r.appid) for r in results), range(1, 6))
+        prices = dict((int(r.appid), r.prices) for r in results)
+        self.assertEqual(prices[1]['US'], ('USD', 9.99, 4.99, 50))
+        self.assertEqual(prices[1]['DE'], ('GBP', 7.99, 7.99, 0))
+        self.assertEqual(prices[2]['GB'], (None, 0, 0, 0))
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_game_table(self, mock_get_json):
+        mock_get_json.side_effect = lambda url: json.loads(appdetails_page(
+            urlparse.parse_qs(urlparse.urlparse(url).query)['appids'][0].split(',')))
+        table = self.games.get_table('US', appids=range(1, 6))
+        self.assertEqual(len(table), 5)
+        self.assertAlmostEqual(table.total(), 49.95)
+        self.assertAlmostEqual(table.total('discounted_prices', platform='windows'), 24.95)
+        self.assertEqual(table.select(platform='linux'), [])
+
+    def test_adaptive_chunker(self):
+        chunker = AdaptiveChunker(10, minimum=2, maximum=20, step=5, target_seconds=1.0, probe_after=2)
+        chunker.record(10, True, 0.1)
+        self.assertEqual(chunker.size, 15)
+        chunker.record(10, True, 0.1)
+        self.assertEqual(chunker.size, 15)
+        chunker.record(15, True, 3.0)
+        self.assertEqual(chunker.size, 7)
+        chunker.record(7, False, 0.1)
+        chunker.record(3, False, 0.1)
+        self.assertEqual(chunker.size, 2)
+        # Doesn't grow back to a size that failed until probe_after good requests
+        chunker.record(2, True, 0.1)
+        self.assertEqual(chunker.size, 2)
+        chunker.record(2, True, 0.1)
+        self.assertEqual(chunker.size, 7)
+        fixed = AdaptiveChunker(4, 4, 4)
+        fixed.record(4, True, 0.1)
+        self.assertEqual(fixed.size, 4)
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_bisect_and_blocklist(self, mock_get_json):
+        requested = []
+        def respond(url):
+            appids = urlparse.parse_qs(urlparse.urlparse(url).query)['appids'][0].split(',')
+            requested.append(appids)
+            if '4' in appids:
+                return None
+            # Steam sometimes leaves appids out of multi-appid responses
+            return json.loads(appdetails_page([x for x in appids if x != '7' or len(appids) == 1]))
+        mock_get_json.side_effect = respond
+        path = os.path.join(tempfile.mkdtemp(), 'blocklist.json')
+        games = Games(num=4, blocklist=Blocklist(path, threshold=1))
+        found = sorted(int(g.appid) for g in games.get_info_for(range(1, 9), 'US'))
+        self.assertEqual(found, [1, 2, 3, 5, 6, 7, 8])
+        self.assertTrue(['4'] in requested and ['7'] in requested)
+        self.assertEqual(json.load(open(path)), {'4:US': 1})
+
+        del requested[:]
+        games = Games(num=4, blocklist=Blocklist(path, threshold=1))
+        self.assertEqual(len(list(games.get_info_for(range(1, 9), 'US'))), 7)
+        self.assertFalse(any('4' in x for x in requested))
+        # Blocked in the US only
+        self.assertEqual(len(list(games.get_info_for([4], 'GB'))), 0)
+        self.assertTrue(['4'] in requested)
+        self.assertEqual(games.blocklist.blocked('US'), ['4'])
+        self.assertEqual(games.blocklist.blocked(), [])
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_outage_isnt_blocklisted(self, mock_get_json):
+        mock_get_json.side_effect = SteamBase.SteamError('down')
+        games = Games(num=4, blocklist=Blocklist(threshold=1))
+        self.assertRaises(SteamBase.SteamError, list, games.get_info_for(range(1, 9), 'US'))
+        self.assertEqual(mock_get_json.call_count, 1)
+        self.assertEqual(games.blocklist.failures, {})
+        self.assertEqual(games.chunker.size, 4)
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_bisecting_keeps_chunk_size(self, mock_get_json):
+        def respond(url):
+            appids = urlparse.parse_qs(urlparse.urlparse(url).query)['appids'][0].split(',')
+            return None if '3' in appids else json.loads(appdetails_page(appids))
+        mock_get_json.side_effect = respond
+        games = Games(blocklist=Blocklist(threshold=1))
+        size = games.chunker.size
+        self.assertEqual(len(list(games.get_info_for(range(1, 9), 'US'))), 7)
+        self.assertTrue(games.chunker.size >= size)
+        self.assertEqual(games.blocklist.blocked('US'), ['3'])
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_rejected_chunks_shrink(self, mock_get_json):
+        requested = []
+        def respond(url):
+            appids = urlparse.parse_qs(urlparse.urlparse(url).query)['appids'][0].split(',')
+            requested.append(appids)
+            # Steam turning down anything bigger than 2 appids
+            return None if len(appids) > 2 else json.loads(appdetails_page(appids))
+        mock_get_json.side_effect = respond
+        games = Games(blocklist=Blocklist(threshold=1))
+        self.assertEqual(len(list(games.get_info_for(range(1, 201), 'US'))), 200)
+        self.assertTrue(games.chunker.size <= 2)
+        # Without shrinking, every chunk gets rejected and bisected: about 250 requests
+        self.assertTrue(len(requested) < 150)
+        self.assertEqual(games.blocklist.failures, {})
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_prices_region_down(self, mock_get_json):
+        def respond(url):
+            query = urlparse.parse_qs(urlparse.urlparse(url).query)
+            if query['cc'][0] == 'DE':
+                raise SteamBase.SteamError('down')
+            return json.loads(appdetails_page(query['appids'][0].split(',')))
+        mock_get_json.side_effect = respond
+        prices = list(Games(num=2, workers=2).get_prices(['US', 'GB', 'DE'], [1, 2, 3]))
+        self.assertEqual([x.appid for x in prices], ['1', '2', '3'])
+        self.assertEqual(prices[2].prices, {'US': ('USD', 9.99, 4.99, 50), 'GB': ('USD', 9.99, 4.99, 50), 'DE': None})
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_regional_failures_not_blocklisted(self, mock_get_json):
+        def respond(url):
+            query = urlparse.parse_qs(urlparse.urlparse(url).query)
+            if query['cc'][0] == 'GB':
+                return {x: {'success': False} for x in query['appids'][0].split(',')}
+            if query['cc'][0] == 'DE':
+                return {x: {'success': True, 'data': []} for x in query['appids'][0].split(',')}
+            return json.loads(appdetails_page(query['appids'][0].split(',')))
+        mock_get_json.side_effect = respond
+        games = Games(num=2, blocklist=Blocklist(threshold=1))
+        for _ in range(2):
+            prices = list(games.get_prices(['US', 'GB', 'DE'], [3, 1, 2]))
+        self.assertEqual([x.appid for x in prices], ['3', '1', '2'])
+        # Not sold in GB isn't the same as free (which is what DE says)
+        self.assertEqual(prices[0].prices['GB'], None)
+        self.assertEqual(prices[0].prices['DE'], (None, 0, 0, 0))
+        self.assertEqual(games.blocklist.failures, {})
+        self.assertEqual(len(list(games.get_info_for([1, 2, 3], 'US'))), 3)
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_get_info_for_async(self, mock_get_json):
+        mock_get_json.side_effect = lambda url: json.loads(appdetails_page(
+            urlparse.parse_qs(urlparse.urlparse(url).query)['appids'][0].split(',')))
+        games = self.games.get_info_for_async(range(1, 6), 'US')
+        first = games.next().result(5)
+        self.assertTrue(isinstance(first, Game))
+        self.assertEqual(sorted(int(g.appid) for g in [first] + list(games)), [1, 2, 3, 4, 5])
+
+class AppIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = AppIndex.build([(620, u'Portal 2'), (400, u'Portal'), (10, u'Counter-Strike'),
+                                     (240, u'Counter-Strike: Source'), (2001, u'Portal 2'), (5, u'Pok\xe9mon')])
+
+    def test_lookups(self):
+        self.assertEqual(self.index.name(240), u'Counter-Strike: Source')
+        self.assertEqual(self.index.name(241), None)
+        self.assertEqual(self.index.appids(u'Portal 2'), [620, 2001])
+        self.assertEqual(self.index.appids(u'portal 2'), [])
+        self.assertEqual(self.index.find('PORTAL-2'), [(620, u'Portal 2'), (2001, u'Portal 2')])
+        self.assertEqual(self.index.appids(), [5, 10, 240, 400, 620, 2001])
+
+    def test_prefix_and_fuzzy(self):
+        self.assertEqual([x[0] for x in self.index.prefix('counter str')], [10, 240])
+        self.assertEqual([x[0] for x in self.index.prefix('portal', limit=2)], [400, 620])
+        self.assertEqual(self.index.prefix(u'pok\xe9'), [(5, u'Pok\xe9mon')])
+        best = self.index.fuzzy('portel 2')
+        self.assertEqual(sorted(x[0] for x in best[:2]), [620, 2001])
+        self.assertEqual(self.index.fuzzy('zzzz'), [])
+
+    def test_save_and_mmap(self):
+        path = os.path.join(tempfile.mkdtemp(), 'apps.idx')
+        self.index.save(path)
+        loaded = AppIndex.load(path)
+        self.assertEqual(len(loaded), 6)
+        self.assertEqual(loaded.appids(u'Portal 2'), [620, 2001])
+        self.assertEqual(loaded.fuzzy('conter strike')[0][:2], (10, u'Counter-Strike'))
+        self.assertRaises(ValueError, AppIndex, 'not an index' * 4)
+
+    def test_games_use_index(self):
+        games = Games(index=self.index)
+        self.assertEqual(games.get_id(u'Portal 2'), 620)
+        self.assertEqual(games.get_ids(u'Portal 2'), [620, 2001])
+        self.assertEqual(games.get_name('400'), u'Portal')
+        self.assertEqual(games.search('portal', limit=3), [(400, u'Portal'), (620, u'Portal 2'), (2001, u'Portal 2')])
+        self.assertEqual(games.search('counter strik source', limit=1), [(240, u'Counter-Strike: Source')])
+
+class FakeCatalog(object):
+    """Stands in for Games: a fixed app list, and prices that can be changed between syncs"""
+    def __init__(self, apps):
+        self.apps = apps
+        self.prices = dict((appid, 999) for appid in apps)
+        self.requested = []
+
+    def iter_apps(self):
+        return self.apps.items()
+
+    def get_info_for(self, appids, cc, compact=False):
+        self.requested.append(sorted(appids))
+        page = json.loads(appdetails_page([x for x in appids if x != 3]))
+        for appid, entry in page.items():
+            entry['data']['price_overview']['initial'] = self.prices.get(int(appid), 999)
+            yield CompactGame(entry, appid)
+
+class SyncTests(unittest.TestCase):
+    def test_incremental_sync(self):
+        now = [0]
+        catalog = FakeCatalog({1: 'a', 2: 'b', 3: 'c'})
+        sync = CatalogSync(catalog, CatalogStore(':memory:'), 'US', max_age=100, clock=lambda: now[0])
+        changes = sync.sync()
+        self.assertEqual(sorted(changes.new), [1, 2])
+        self.assertEqual(changes.missing, [3])
+
+        # Nothing is due yet, so only the new app gets fetched
+        now[0] = 50
+        catalog.apps = {1: 'a', 3: 'c', 4: 'd'}
+        changes = sync.sync()
+        self.assertEqual((changes.added_apps, changes.removed_apps), ({4: 'd'}, {2: 'b'}))
+        self.assertEqual(catalog.requested[-1], [4])
+
+        now[0] = 200
+        catalog.prices[1] = 1999
+        changes = sync.sync()
+        self.assertEqual(catalog.requested[-1], [1, 3, 4])
+        self.assertEqual(changes.changed[1][0]['price'], 9.99)
+        self.assertEqual(changes.changed[1][1]['price'], 19.99)
+        self.assertEqual(changes.unchanged, 1)
+
+    def test_sync_after_crash(self):
+        catalog = FakeCatalog({1: 'a', 2: 'b'})
+        store = CatalogStore(':memory:')
+        def crash(appids, cc, compact=False):
+            raise SteamBase.SteamError('down')
+            yield
+        get_info_for, catalog.get_info_for = catalog.get_info_for, crash
+        self.assertRaises(SteamBase.SteamError, CatalogSync(catalog, store, 'US').sync)
+        catalog.get_info_for = get_info_for
+        changes = CatalogSync(catalog, store, 'US').sync()
+        self.assertEqual(catalog.requested[-1], [1, 2])
+        self.assertEqual(sorted(changes.new), [1, 2])
+        # Another country code gets the whole list too
+        CatalogSync(catalog, store, 'GB').sync()
+        self.assertEqual(catalog.requested[-1], [1, 2])
+
+def backpack_response(steam_id):
+    status = {'15': 15, '8': 8}.get(steam_id, 1)
+    result = {'status': status}
+    if status == 1:
+        result['items'] = [{'id': 100, 'defindex': 5021, 'quantity': 1},
+                           {'id': 101, 'defindex': 5021, 'quantity': 1, 'flag_cannot_trade': True},
+                           {'id': 102, 'defindex': 0, 'quantity': 1}]
+    return json.dumps({'result': result})
+
+class CrawlTests(unittest.TestCase):
+    def setUp(self):
+        SteamBase.SteamAPI.cache.clear()
+        folder = tempfile.mkdtemp()
+        self.checkpoint_path = os.path.join(folder, 'crawl.db')
+        self.output = os.path.join(folder, 'games.jsonl')
+        self.requested = []
+
+    def respond(self, url):
+        appids = urlparse.parse_qs(urlparse.urlparse(url).query)['appids'][0].split(',')
+        self.requested.append(appids)
+        if len(self.requested) == self.crash_at:
+            raise KeyboardInterrupt
+        return json.loads(appdetails_page(appids))
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_resume_after_crash(self, mock_get_json):
+        mock_get_json.side_effect = self.respond
+        self.crash_at = 3
+        crawl = CatalogCrawl(Games(num=2), CrawlCheckpoint(self.checkpoint_path), self.output, 'US')
+        self.assertRaises(KeyboardInterrupt, crawl.run, range(1, 8))
+        self.assertEqual(tuple(crawl.checkpoint.progress()), (4, 7))
+        with open(self.output, 'a') as f:
+            f.write('{"appid": 5, "half a li')
+
+        self.requested, self.crash_at = [], None
+        crawl = CatalogCrawl(Games(num=2), CrawlCheckpoint(self.checkpoint_path), self.output, 'US')
+        self.assertEqual(crawl.run(), 3)
+        self.assertEqual(self.requested, [['5', '6'], ['7']])
+        lines = [json.loads(line) for line in open(self.output)]
+        self.assertEqual([x['appid'] for x in lines], range(1, 8))
+        self.assertEqual(lines[0]['data']['name'], 'Game 1')
+        self.assertEqual(tuple(crawl.checkpoint.progress()), (7, 7))
+
+    def test_wrong_cc(self):
+        checkpoint = CrawlCheckpoint(self.checkpoint_path)
+        checkpoint.start([1], 'US')
+        self.assertRaises(CheckpointError, CatalogCrawl(Games(), checkpoint, self.output, 'GB').run)
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+class ExportTests(unittest.TestCase):
+    def setUp(self):
+        page = json.loads(appdetails_page([1, 2, 3]))
+        page['2']['data']['name'] = u'Caf\xe9'
+        page['2']['data']['categories'] = [{'id': 2, 'description': 'Single-player'}, {'id': 1, 'description': 'Co-op'}]
+        self.games = [Game(page[x], x) for x in sorted(page)] + [CompactGame(page['2'], 2)]
+        self.path = os.path.join(tempfile.mkdtemp(), 'out')
+
+    def test_batches(self):
+        sizes = [len(batch['appid']) for batch in batches(game_rows(self.games), GAME_SCHEMA, batch_size=3)]
+        self.assertEqual(sizes, [3, 1])
+
+    def test_csv(self):
+        self.assertEqual(export(game_rows(self.games), GAME_SCHEMA, self.path, batch_size=2), 4)
+        rows = list(csv.DictReader(open(self.path, 'rb')))
+        self.assertEqual([r['appid'] for r in rows], ['1', '2', '3', '2'])
+        self.assertEqual(rows[1]['name'].decode('utf-8'), u'Caf\xe9')
+        self.assertEqual((rows[1]['categories'], rows[3]['categories']), ('Single-player|Co-op',) * 2)
+        self.assertEqual((rows[0]['windows'], rows[0]['linux'], rows[0]['website']), ('True', 'False', ''))
+
+    def test_backpack_csv(self):
+        backpack = process_items([{'id': 10, 'defindex': 5021, 'quality': 6, 'flag_cannot_trade': True}], compact=True)
+        export(backpack_rows(backpack, 76561197960287930), BACKPACK_SCHEMA, self.path)
+        row = list(csv.DictReader(open(self.path, 'rb')))[0]
+        self.assertEqual((row['steam_id'], row['defindex'], row['tradable']), ('76561197960287930', '5021', 'False'))
+
+    @unittest.skipIf(pyarrow is None, 'needs pyarrow')
+    def test_parquet_and_arrow(self):
+        import pyarrow.parquet
+        export(game_rows(self.games), GAME_SCHEMA, self.path, 'parquet', batch_size=2)
+        table = pyarrow.parquet.read_table(self.path)
+        self.assertEqual(table.column('appid').to_pylist(), [1, 2, 3, 2])
+        export(game_rows(self.games), GAME_SCHEMA, self.path, 'arrow')
+        table = pyarrow.ipc.open_file(self.path).read_all()
+        self.assertEqual(table.column('categories').to_pylist()[1], ['Single-player', 'Co-op'])
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class LibrariesTests(unittest.TestCase):
+    def setUp(self):
+        self.libraries = OwnedGames.from_games([
+            ('1', [{'appid': 440, 'playtime_forever': 100}, {'appid': 570, 'playtime_forever': 5}]),
+            ('2', None),
+            ('3', [{'appid': 570}, {'appid': 730, 'playtime_forever': 60}, {'appid': 440, 'playtime_forever': 1}]),
+        ])
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_loader(self, mock_get_json):
+        def respond(url):
+            steamid = urlparse.parse_qs(urlparse.urlparse(url).query)['steamid'][0]
+            if steamid == '2':
+                return {'response': {}}
+            if steamid == '3':
+                raise SteamBase.SteamError('down')
+            return {'response': {'game_count': 1, 'games': [{'appid': 440, 'playtime_forever': 7}]}}
+        mock_get_json.side_effect = respond
+        libraries = LibraryLoader('key', workers=2).load(['1', '2', '3', '4'])
+        self.assertEqual(libraries.user_count, 4)
+        self.assertEqual(len(libraries), 2)
+        self.assertEqual(list(libraries.visible[[libraries.user_index(x) for x in (1, 2, 3, 4)]]),
+                         [True, False, True, True])
+        self.assertEqual(libraries.failed_steam_ids(), ['3'])
+        self.assertEqual(list(libraries.games_of(4)), [440])
+
+    def test_aggregates(self):
+        libraries = self.libraries
+        self.assertEqual(list(libraries.users), [0, 0, 2, 2, 2])
+        self.assertEqual(list(libraries.game_counts()), [2, 0, 3])
+        self.assertEqual(list(libraries.total_playtime()), [105, 0, 61])
+        self.assertEqual(libraries.top_apps(2), [(440, 2), (570, 2)])
+        self.assertEqual(libraries.top_apps(1, by='playtime'), [(440, 101)])
+        self.assertEqual(list(libraries.shared_apps('1', '3')), [440, 570])
+        self.assertRaises(KeyError, libraries.user_index, 5)
+        counts = libraries.co_ownership([730, 440, 570, 10], batch_users=2)
+        self.assertEqual(counts.tolist(), [[1, 1, 1, 0], [1, 2, 2, 0], [1, 2, 2, 0], [0, 0, 0, 0]])
+
+    def test_prices_and_save(self):
+        table = GameTable()
+        table.append_json(json.loads(appdetails_page([730]))['730'], 730)
+        table.append_json(json.loads(appdetails_page([440]))['440'], 440)
+        self.assertEqual(list(self.libraries.prices(table)), [9.99, 0, 0, 9.99, 9.99])
+        self.assertEqual(list(self.libraries.library_values(table, 'discounted_prices')), [4.99, 0, 9.98])
+        path = os.path.join(tempfile.mkdtemp(), 'libraries.npz')
+        self.libraries.save(path)
+        loaded = OwnedGames.load(path)
+        self.assertEqual(loaded.steam_ids.tolist(), [1, 2, 3])
+        self.assertEqual(loaded.total_playtime().tolist(), [105, 0, 61])
+        self.assertEqual(loaded.failed.tolist(), [False, False, False])
+
+    def test_real_steamids(self):
+        steam_id = 76561197960287930
+        libraries = OwnedGames.from_games([(str(steam_id), [{'appid': 440}]), (str(steam_id + 1), None)])
+        self.assertEqual(libraries.steam_ids.tolist(), [steam_id, steam_id + 1])
+        self.assertEqual(list(libraries.games_of(steam_id)), [440])
+        self.assertEqual(libraries.offsets.tolist(), [0, 1, 1])
+
+MALFORMED_BACKPACKS = {'600': '{}', '601': '{"result": {}}', '602': '{"result": {"status": 1, "items": [5]}}',
+                       '603': 'null'}
+
+class BackpackTests(unittest.TestCase):
+    def setUp(self):
+        def respond(url, headers=None, stream=False):
+            steam_id = urlparse.parse_qs(urlparse.urlparse(url).query)['SteamID'][0]
+            if steam_id == '500':
+                raise urllib2.HTTPError(url, 403, 'Forbidden', {}, None)
+            if steam_id in MALFORMED_BACKPACKS:
+                return Response(url, 200, {}, MALFORMED_BACKPACKS[steam_id])
+            return Response(url, 200, {}, backpack_response(steam_id))
+        self.transport = Mock()
+        self.transport.open.side_effect = respond
+
+    def test_scan(self):
+        scanner = BackpackScanner('key', workers=3, transport=self.transport)
+        results = dict((r.steam_id, r) for r in scanner.scan(['1', '8', '15', '500', '2'], 'TF2'))
+        self.assertEqual(sorted(results), ['1', '15', '2', '500', '8'])
+        self.assertTrue(results['1'].ok)
+        self.assertEqual((results['15'].status, results['15'].error), (15, 'Backpack is private'))
+        self.assertEqual(results['500'].status, None)
+        self.assertTrue('<hidden>' in results['500'].error)
+        self.assertEqual(scanner.scanned, 5)
+        self.assertTrue(scanner.users_per_second() > 0)
+
+    def test_malformed_responses(self):
+        scanner = BackpackScanner('key', workers=2, transport=self.transport)
+        results = dict((r.steam_id, r) for r in scanner.scan(sorted(MALFORMED_BACKPACKS) + ['1'], 'tf2'))
+        self.assertTrue(results['1'].ok)
+        for steam_id in MALFORMED_BACKPACKS:
+            self.assertEqual(results[steam_id].status, None)
+            self.assertTrue(results[steam_id].error.startswith('Malformed response'))
+
+    def test_backpack_keeps_duplicates(self):
+        result = next(BackpackScanner('key', transport=self.transport).scan(['1'], 'tf2'))
+        backpack = result.items
+        self.assertEqual(sorted(backpack), [100, 101, 102])
+        self.assertEqual(len(backpack.by_defindex()[5021]), 2)
+        self.assertEqual(backpack.count(5021), 2)
+        self.assertFalse(backpack[101]['tradable'])
+
+    def test_compact_backpack(self):
+        result = next(BackpackScanner('key', transport=self.transport).scan(['1'], 'tf2', compact=True))
+        backpack = result.items
+        self.assertEqual(len(backpack), 3)
+        self.assertEqual([x['item_id'] for x in backpack.by_defindex()[5021]], [100, 101])
+        self.assertEqual(backpack.count(5021), 2)
+        self.assertEqual(backpack[101]['tradable'], False)
+        self.assertEqual(backpack[100]['defindex'], 5021)
+        self.assertEqual(list(backpack)[2]['item_id'], 102)
+        backpack.append({'id': 2 ** 40 + 1, 'original_id': 2 ** 35, 'defindex': 5021})
+        self.assertEqual(backpack[2 ** 40 + 1]['item_id'], 2 ** 40 + 1)
+        self.assertEqual(backpack[2 ** 40 + 1]['original_id'], 2 ** 35)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'fixtures')
+
+def fixture(name):
+    return open(os.path.join(FIXTURES, name)).read()
+
+class ScrapingTests(unittest.TestCase):
+    def setUp(self):
+        self.wishlist = [int(x) for x in fixture('wishlist.ids').split()]
+        self.groups = fixture('groups.urls').split()
+
+    def test_scrapers_agree(self):
+        for scraper in (RegexScraper(), RegexScraper(chunk_size=7), SoupScraper()):
+            self.assertEqual(scraper.wishlist_ids(StringIO(fixture('wishlist.html'))), self.wishlist)
+            self.assertEqual(scraper.group_urls(StringIO(fixture('groups.html'))), self.groups)
+
+    def test_data_attributes_ignored(self):
+        wishlist = ('<div data-id="999" data-class="wishlistRow" class="wishlistRow " id="game_440"></div>'
+                    '<div data-class="wishlistRow" id="game_7"></div>')
+        groups = ('<div data-class="groupBlockMedium"><a href="http://x/wrong"></a></div>'
+                  '<div class="groupBlockMedium"><a data-href="/wrong" href="http://x/groups/right"></a></div>')
+        for scraper in (RegexScraper(), SoupScraper()):
+            self.assertEqual(scraper.wishlist_ids(StringIO(wishlist)), [440])
+            self.assertEqual(scraper.group_urls(StringIO(groups)), ['http://x/groups/right'])
+
+    def test_get_gifts_follows_pages(self):
+        url = 'http://steamcommunity.com/profiles/1/inventory/json/753/1/'
+        def page(appids, more_start):
+            descriptions = dict((str(a), {'actions': [{'link': 'http://store.steampowered.com/app/%d' % a}]})
+                                for a in appids)
+            descriptions['x'] = {'name': 'No actions'}
+            return json.dumps({'success': True, 'rgDescriptions': descriptions,
+                               'more': more_start is not None, 'more_start': more_start or False})
+        transport = FakeTransport({url: page([10, 20], 2), url + '?start=2': page([30], 3),
+                                   url + '?start=3': page([40], None)})
+        user = SteamUser('1', 'key', transport, player('1'))
+        self.assertEqual(sorted(user.get_gifts()), [10, 20, 30, 40])
+        self.assertEqual(len(transport.requests), 3)
+
+    def test_get_wishlist(self):
+        url = 'http://steamcommunity.com/profiles/1/wishlist'
+        user = SteamUser('1', 'key', FakeTransport({url: fixture('wishlist.html')}), player('1'))
+        self.assertEqual(user.get_wishlist(), self.wishlist)
+
+def player(steamid):
+    return {'steamid': steamid, 'communityvisibilitystate': 3, 'timecreated': 0,
+            'personaname': 'user%s' % steamid, 'profileurl': '', 'avatarfull': ''}
 
 class UsersTests(unittest.TestCase):
     def setUp(self):
         self.games = Games()
 
+    def test_bulk_load(self):
+        def respond(url, headers=None, stream=False):
+            ids = urlparse.parse_qs(urlparse.urlparse(url).query)['steamids'][0].split(',')
+            self.assertTrue(len(ids) <= 100)
+            players = [player(x) for x in ids if x != '7']
+            return Response(url, 200, {}, json.dumps({'response': {'players': players}}))
+        transport = Mock()
+        transport.open.side_effect = respond
+        users = SteamUser.bulk_load(range(250), 'key', workers=2, transport=transport)
+        self.assertEqual(transport.open.call_count, 3)
+        self.assertEqual(len(users), 249)
+        self.assertEqual(users[5].username, 'user5')
+        self.assertEqual(users[7].steam_id, '8')
+        self.assertEqual(users[5].raw_json['response']['players'][0]['steamid'], '5')
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_async_methods(self, mock_get_json):
+        user = SteamUser('5', 'key', player=player('5'))
+        mock_get_json.return_value = {'response': {'games': [{'appid': 440}]}}
+        future = user.get_games_async()
+        self.assertEqual(future.result(5), [{'appid': 440}])
+        mock_get_json.return_value = {'result': {'status': 15}}
+        self.assertRaises(BackpackError, user.get_items_async('tf2').result, 5)
+
+    @patch.object(SteamBase.SteamAPI, '_get_json')
+    def test_backpack_status_messages(self, mock_get_json):
+        user = SteamUser('5', 'key', player=player('5'))
+        for status, message in ((8, 'Invalid SteamID'), (15, 'Backpack is private'), (18, 'Invalid SteamID')):
+            mock_get_json.return_value = {'result': {'status': status}}
+            with self.assertRaises(BackpackError) as raised:
+                user.get_items('tf2')
+            self.assertEqual(str(raised.exception), message)
+
 if __name__ == '__main__':
     unittest.main()